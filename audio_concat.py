@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+import os
+import struct
+import subprocess
+import tempfile
+
+COPY_BUFFER_SIZE = 1024 * 1024  # Bytes copied from an input to the output at a time
+MAX_RIFF_SIZE = 0xFFFFFFFF
+
+# Layer III bitrates in kbps by bitrate index, for MPEG-1 and for MPEG-2/2.5
+MP3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+class WavInfo:
+    """The format of a WAV file and where its samples are."""
+
+    def __init__(self, path, fmt, fact, data_offset, data_size):
+        self.path = path
+        self.fmt = fmt  # The raw fmt chunk, copied to the output as is
+        self.fact = fact  # The raw fact chunk of non-PCM formats, or None
+        self.data_offset = data_offset
+        self.data_size = data_size
+        format_tag, self.channels, self.sample_rate, _, self.block_align, self.bits_per_sample = \
+            struct.unpack('<HHIIHH', fmt[:16])
+        if format_tag == 0xFFFE and len(fmt) >= 40:
+            format_tag = struct.unpack('<H', fmt[24:26])[0]  # The sub format of WAVE_FORMAT_EXTENSIBLE
+        self.format_tag = format_tag
+
+    @property
+    def sample_format(self):
+        """The fields that must match for the samples of two files to be joined as they are."""
+        return self.format_tag, self.channels, self.sample_rate, self.block_align, self.bits_per_sample
+
+def read_wav_info(path):
+    """Read the chunk headers of a WAV file, without reading its samples."""
+    size = os.path.getsize(path)
+    fmt = fact = None
+    with open(path, 'rb') as file:
+        riff, _, wave = struct.unpack('<4sI4s', file.read(12))
+        if riff != b'RIFF' or wave != b'WAVE':
+            raise ValueError(f'{path} is not a WAV file')
+        while True:
+            header = file.read(8)
+            if len(header) < 8:
+                raise ValueError(f'{path} has no data chunk')
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+            if chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError(f'{path} has no fmt chunk before its data')
+                offset = file.tell()
+                # Files written by a stream may leave the size unset, the samples then run to the end
+                return WavInfo(path, fmt, fact, offset, min(chunk_size, size - offset))
+            if chunk_id == b'fmt ':
+                fmt = file.read(chunk_size)
+            elif chunk_id == b'fact':
+                fact = file.read(chunk_size)
+            else:
+                file.seek(chunk_size, os.SEEK_CUR)
+            if chunk_size % 2:
+                file.seek(1, os.SEEK_CUR)  # Chunks are padded to an even size
+
+def wav_header(fmt, data_size, fact=None):
+    """Return the RIFF header, fmt chunk, optional fact chunk and data chunk header of a WAV file."""
+    chunks = b'fmt ' + struct.pack('<I', len(fmt)) + fmt + (b'\0' if len(fmt) % 2 else b'')
+    if fact is not None:
+        chunks += b'fact' + struct.pack('<I', len(fact)) + fact
+    chunks += b'data' + struct.pack('<I', data_size)
+    riff_size = 4 + len(chunks) + data_size + data_size % 2
+    if riff_size > MAX_RIFF_SIZE:
+        raise ValueError('The joined audio is larger than a WAV file can hold')
+    return b'RIFF' + struct.pack('<I', riff_size) + b'WAVE' + chunks
+
+def copy_range(source, destination, offset, size):
+    """Copy size bytes of the file source from offset to the open file destination, a buffer at a time."""
+    with open(source, 'rb') as file:
+        file.seek(offset)
+        while size > 0:
+            buffer = file.read(min(COPY_BUFFER_SIZE, size))
+            if not buffer:
+                break
+            destination.write(buffer)
+            size -= len(buffer)
+
+def stream_wav(infos, output_file):
+    """Write the samples of WAV files with the same sample format one after the other into output_file."""
+    first = infos[0]
+    data_size = sum(info.data_size for info in infos)
+    fact = None
+    if first.fact is not None:
+        # Non-PCM formats count their sample frames in the fact chunk
+        fact = struct.pack('<I', data_size // first.block_align) + first.fact[4:]
+    output_file.write(wav_header(first.fmt, data_size, fact))
+    for info in infos:
+        copy_range(info.path, output_file, info.data_offset, info.data_size)
+    if data_size % 2:
+        output_file.write(b'\0')
+
+def id3_size(audio):
+    """Return the size of the ID3v2 tag at the start of MP3 data, 0 if there is none."""
+    if len(audio) < 10 or audio[:3] != b'ID3':
+        return 0
+    # The tag size is a 28-bit integer stored 7 bits per byte, followed by a 10-byte footer if flagged
+    size = (audio[6] << 21) | (audio[7] << 14) | (audio[8] << 7) | audio[9]
+    return 10 + size + (10 if audio[5] & 0x10 else 0)
+
+def parse_mp3_frame_header(header):
+    """Return the MPEG version, layer, sample rate, mono flag and frame length of an MP3 frame header, or None."""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = (header[1] >> 3) & 3  # 3: MPEG-1, 2: MPEG-2, 0: MPEG-2.5
+    layer = 4 - ((header[1] >> 1) & 3)
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 3
+    if version == 1 or layer == 4 or sample_rate_index == 3 or bitrate_index in (0, 15):
+        return None
+    sample_rate = MP3_SAMPLE_RATES[version][sample_rate_index]
+    mono = header[3] >> 6 == 3
+    frame_length = None
+    if layer == 3:
+        bitrate = MP3_BITRATES[1 if version == 3 else 2][bitrate_index] * 1000
+        padding = (header[2] >> 1) & 1
+        frame_length = (144 if version == 3 else 72) * bitrate // sample_rate + padding
+    return version, layer, sample_rate, mono, frame_length
+
+def header_frame_length(frame, header):
+    """
+    Return the length of an MP3 frame if it is a Xing, Info or VBRI header frame, 0 if it holds audio.
+
+    frame holds the bytes of the frame, header its parse_mp3_frame_header result.
+    """
+    version, _, _, mono, frame_length = header
+    if not frame_length:
+        return 0
+    side_info = (32 if not mono else 17) if version == 3 else (17 if not mono else 9)
+    if frame[4 + side_info:8 + side_info] in (b'Xing', b'Info') or frame[36:40] == b'VBRI':
+        return frame_length
+    return 0
+
+def mp3_data_offset(audio):
+    """Return where the audio frames of MP3 data start, after its ID3v2 tag and Xing, Info or VBRI header frame."""
+    start = id3_size(audio)
+    header = parse_mp3_frame_header(audio[start:start + 4])
+    if header is None:
+        return start
+    return start + header_frame_length(audio[start:start + (header[4] or 4)], header)
+
+class Mp3Info:
+    """The format of an MP3 file and where its audio frames are."""
+
+    def __init__(self, path):
+        self.path = path
+        size = os.path.getsize(path)
+        with open(path, 'rb') as file:
+            head = file.read(10)
+            start = id3_size(head)
+            file.seek(start)
+            frame = file.read(4)
+            header = parse_mp3_frame_header(frame)
+            if header is None:
+                raise ValueError(f'{path} does not start with an MP3 frame')
+            version, layer, sample_rate, mono, frame_length = header
+            if frame_length:
+                # A Xing, Info or VBRI frame describes the length of this file only, it must not describe the joined one
+                frame += file.read(frame_length - 4)
+                start += header_frame_length(frame, header)
+            file.seek(max(start, size - 128))
+            tail = file.read(128)
+        end = size - 128 if len(tail) == 128 and tail[:3] == b'TAG' else size  # A trailing ID3v1 tag
+        self.data_offset = start
+        self.data_size = max(0, end - start)
+        self.sample_format = (version, layer, sample_rate, mono)
+
+def stream_mp3(infos, output_file):
+    """Write the audio frames of MP3 files with the same sample format one after the other into output_file."""
+    for info in infos:
+        copy_range(info.path, output_file, info.data_offset, info.data_size)
+
+def read_info(path):
+    """Return the WavInfo or Mp3Info of an audio file, or None if it is in neither format or cannot be parsed."""
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        if extension == '.wav':
+            return read_wav_info(path)
+        if extension == '.mp3':
+            return Mp3Info(path)
+    except (ValueError, struct.error):
+        pass
+    return None
+
+def decode_to_wav(paths, output_file):
+    """
+    Decode the input files one at a time into 16-bit PCM WAV, in the channels and sample
+    rate of the first one, so that only one decoded clip is held in memory.
+    """
+    from pydub import AudioSegment
+    output_file.write(wav_header(b'\0' * 16, 0))  # Rewritten once the size is known
+    channels = frame_rate = None
+    data_size = 0
+    for path in paths:
+        segment = AudioSegment.from_file(path)
+        if channels is None:
+            channels, frame_rate = segment.channels, segment.frame_rate
+        segment = segment.set_channels(channels).set_frame_rate(frame_rate).set_sample_width(2)
+        output_file.write(segment.raw_data)
+        data_size += len(segment.raw_data)
+    if data_size % 2:
+        output_file.write(b'\0')
+    fmt = struct.pack('<HHIIHH', 1, channels or 1, frame_rate or 44100, (frame_rate or 44100) * (channels or 1) * 2,
+                      (channels or 1) * 2, 16)
+    output_file.seek(0)
+    output_file.write(wav_header(fmt, data_size))
+
+def encode_wav(wav_path, output_path, audio_format):
+    """Encode a WAV file with ffmpeg, which streams it rather than loading it."""
+    from pydub import AudioSegment
+    subprocess.run([AudioSegment.converter, '-y', '-loglevel', 'error', '-i', wav_path, '-f', audio_format, output_path],
+                   check=True)
+
+def concatenate_audio(paths, output_path):
+    """
+    Join audio files into output_path, in order, and return 'stream' or 'decode' for how they were joined.
+
+    When every input has the format of the output (WAV or MP3) and they all share a
+    sample format, their samples or frames are copied into the output a buffer at a
+    time and only the header is written anew, so memory does not grow with the number
+    or length of the clips and nothing is decoded or re-encoded. Otherwise the inputs
+    are decoded with pydub one at a time, and MP3 output is encoded from a temporary
+    WAV file by ffmpeg.
+    """
+    paths = [os.fspath(path) for path in paths]
+    output_path = os.fspath(output_path)
+    if not paths:
+        raise ValueError('No audio files to join')
+    audio_format = os.path.splitext(output_path)[1].lower().lstrip('.')
+    part_path = output_path + '.part'
+    infos = [read_info(path) for path in paths]
+    streamable = (audio_format in ('wav', 'mp3')
+                  and all(info is not None and type(info) is type(infos[0]) for info in infos)
+                  and isinstance(infos[0], WavInfo if audio_format == 'wav' else Mp3Info)
+                  and len({info.sample_format for info in infos}) == 1)
+    try:
+        if streamable:
+            with open(part_path, 'wb') as output_file:
+                (stream_wav if audio_format == 'wav' else stream_mp3)(infos, output_file)
+        elif audio_format == 'wav':
+            with open(part_path, 'w+b') as output_file:
+                decode_to_wav(paths, output_file)
+        else:
+            with tempfile.NamedTemporaryFile(suffix='.wav', dir=os.path.dirname(os.path.abspath(output_path))) as wav_file:
+                decode_to_wav(paths, wav_file)
+                wav_file.flush()
+                encode_wav(wav_file.name, part_path, audio_format)
+        os.replace(part_path, output_path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    return 'stream' if streamable else 'decode'
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+import asyncio
+import threading
+import time
+import types
+from collections import deque
+
+from metrics import note_endpoint, note_queue_wait, percentile
+
+FAILOVER_ERRORS = {'APITimeoutError', 'APIConnectionError'}
+CAPACITY_POLL_INTERVAL = 0.05  # Seconds to wait when every endpoint is at its concurrency limit
+LATENCY_WINDOW = 1000  # Number of recent latencies kept per endpoint
+
+def should_fail_over(error):
+    """Return True if a request should be retried on another endpoint."""
+    return type(error).__name__ in FAILOVER_ERRORS or (getattr(error, 'status_code', None) or 0) >= 500
+
+class Endpoint:
+    """One OpenAI-compatible server in a backend pool."""
+
+    def __init__(self, name, client, weight=1.0, max_in_flight=4):
+        self.name = name
+        self.client = client
+        self.weight = max(float(weight), 0.001)
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.in_flight = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def load(self):
+        return self.in_flight / self.weight
+
+    def stats(self):
+        latencies = list(self.latencies)
+        return {
+            'healthy': self.healthy,
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'errors': self.errors,
+            'latency_mean': sum(latencies) / len(latencies) if latencies else None,
+            'latency_p50': percentile(latencies, 0.50),
+            'latency_p95': percentile(latencies, 0.95),
+        }
+
+class BackendPool:
+    """
+    Route requests to the least loaded healthy endpoint, relative to its weight.
+
+    An endpoint is taken out of rotation after failure_threshold consecutive connection
+    or server errors and probed again once cooldown seconds have passed. A request that
+    fails on one endpoint is retried on the others before the error is raised.
+    """
+
+    def __init__(self, endpoints, failure_threshold=3, cooldown=30.0, health_timeout=5.0):
+        self.endpoints = list(endpoints)
+        self.failure_threshold = int(failure_threshold)
+        self.cooldown = float(cooldown)
+        self.health_timeout = float(health_timeout)
+        self._lock = threading.Lock()
+
+    def _select(self, exclude):
+        """Reserve the best endpoint, or return None if all candidates are busy."""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+            healthy = [endpoint for endpoint in candidates
+                       if endpoint.healthy or endpoint.unhealthy_until <= now]
+            # With nothing healthy left, trying a sick endpoint beats failing outright
+            usable = [endpoint for endpoint in (healthy or candidates) if endpoint.in_flight < endpoint.max_in_flight]
+            if not usable:
+                return None
+            endpoint = min(usable, key=Endpoint.load)
+            endpoint.in_flight += 1
+            return endpoint
+
+    def _has_candidates(self, exclude):
+        return any(endpoint not in exclude for endpoint in self.endpoints)
+
+    def _finish(self, endpoint, started, error=None):
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.requests += 1
+            if error is None:
+                endpoint.latencies.append(time.perf_counter() - started)
+                endpoint.consecutive_failures = 0
+                endpoint.healthy = True
+                return
+            endpoint.errors += 1
+            if should_fail_over(error):
+                endpoint.consecutive_failures += 1
+                if endpoint.consecutive_failures >= self.failure_threshold:
+                    self._mark_unhealthy(endpoint)
+
+    def _mark_unhealthy(self, endpoint):
+        if endpoint.healthy:
+            print(f'Endpoint {endpoint.name} marked unhealthy for {self.cooldown:.0f}s')
+        endpoint.healthy = False
+        endpoint.unhealthy_until = time.monotonic() + self.cooldown
+
+    def stats(self):
+        """Return request counts and latency statistics per endpoint."""
+        with self._lock:
+            return {endpoint.name: endpoint.stats() for endpoint in self.endpoints}
+
+class PooledClient(BackendPool):
+    """A BackendPool of synchronous clients exposing chat.completions.create."""
+
+    def __init__(self, endpoints, **kwargs):
+        super().__init__(endpoints, **kwargs)
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create))
+
+    def check_health(self):
+        """Probe every endpoint with a model listing and update its health."""
+        for endpoint in self.endpoints:
+            try:
+                endpoint.client.models.list(timeout=self.health_timeout)
+                endpoint.healthy = True
+                endpoint.consecutive_failures = 0
+            except Exception as e:
+                print(f'Health check failed for endpoint {endpoint.name}: {e}')
+                self._mark_unhealthy(endpoint)
+
+    def _acquire(self, exclude):
+        waited = time.perf_counter()
+        while True:
+            endpoint = self._select(exclude)
+            if endpoint is not None:
+                note_queue_wait(time.perf_counter() - waited)
+                note_endpoint(endpoint.name)
+                return endpoint
+            time.sleep(CAPACITY_POLL_INTERVAL)
+
+    def _stream(self, endpoint, started, stream):
+        # The endpoint stays busy until the whole response has been received
+        error = None
+        try:
+            yield from stream
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._finish(endpoint, started, error)
+
+    def create(self, **request):
+        tried = set()
+        while True:
+            endpoint = self._acquire(tried)
+            started = time.perf_counter()
+            try:
+                response = endpoint.client.chat.completions.create(**request)
+            except Exception as e:
+                self._finish(endpoint, started, e)
+                tried.add(endpoint)
+                if not should_fail_over(e) or not self._has_candidates(tried):
+                    raise
+                print(f'Request to endpoint {endpoint.name} failed ({e.__class__.__name__}), failing over')
+                continue
+            if request.get('stream'):
+                return self._stream(endpoint, started, response)
+            self._finish(endpoint, started)
+            return response
+
+    def close(self):
+        for endpoint in self.endpoints:
+            endpoint.client.close()
+
+class AsyncPooledClient(BackendPool):
+    """A BackendPool of asyncio clients exposing chat.completions.create."""
+
+    def __init__(self, endpoints, **kwargs):
+        super().__init__(endpoints, **kwargs)
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create))
+
+    async def __aenter__(self):
+        await self.check_health()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await asyncio.gather(*[endpoint.client.close() for endpoint in self.endpoints])
+
+    async def check_health(self):
+        """Probe every endpoint with a model listing and update its health."""
+        async def probe(endpoint):
+            try:
+                await endpoint.client.models.list(timeout=self.health_timeout)
+                endpoint.healthy = True
+                endpoint.consecutive_failures = 0
+            except Exception as e:
+                print(f'Health check failed for endpoint {endpoint.name}: {e}')
+                self._mark_unhealthy(endpoint)
+        await asyncio.gather(*[probe(endpoint) for endpoint in self.endpoints])
+
+    async def _acquire(self, exclude):
+        waited = time.perf_counter()
+        while True:
+            endpoint = self._select(exclude)
+            if endpoint is not None:
+                note_queue_wait(time.perf_counter() - waited)
+                note_endpoint(endpoint.name)
+                return endpoint
+            await asyncio.sleep(CAPACITY_POLL_INTERVAL)
+
+    async def _stream(self, endpoint, started, stream):
+        # The endpoint stays busy until the whole response has been received
+        error = None
+        try:
+            async for event in stream:
+                yield event
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._finish(endpoint, started, error)
+
+    async def create(self, **request):
+        tried = set()
+        while True:
+            endpoint = await self._acquire(tried)
+            started = time.perf_counter()
+            try:
+                response = await endpoint.client.chat.completions.create(**request)
+            except Exception as e:
+                self._finish(endpoint, started, e)
+                tried.add(endpoint)
+                if not should_fail_over(e) or not self._has_candidates(tried):
+                    raise
+                print(f'Request to endpoint {endpoint.name} failed ({e.__class__.__name__}), failing over')
+                continue
+            if request.get('stream'):
+                return self._stream(endpoint, started, response)
+            self._finish(endpoint, started)
+            return response
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+import json
+
+BATCH_ENDPOINT = '/v1/chat/completions'
+CUSTOM_ID_SEPARATOR = '::'
+
+def make_custom_id(file_name, mode, chunk_index):
+    """Return the stable custom_id of a (file, mode, chunk) request."""
+    return CUSTOM_ID_SEPARATOR.join([file_name, mode, f'{chunk_index:05d}'])
+
+def write_batch_requests(requests, output_path):
+    """
+    Write chat completion requests as a Batch API input file.
+
+    Args:
+      requests: Iterable of (custom_id, request body) pairs.
+      output_path: The JSONL file to write.
+
+    Returns:
+      The number of requests written.
+    """
+    count = 0
+    with open(output_path, 'w', encoding='utf-8') as file:
+        for custom_id, body in requests:
+            line = {
+                'custom_id': custom_id,
+                'method': 'POST',
+                'url': BATCH_ENDPOINT,
+                'body': body
+            }
+            file.write(json.dumps(line, ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+def read_batch_results(results_path):
+    """
+    Read a Batch API output file.
+
+    Returns:
+      A tuple (responses, errors) where responses maps custom_id to the response
+      text and errors maps custom_id to an error description.
+    """
+    responses = {}
+    errors = {}
+    with open(results_path, 'r', encoding='utf-8') as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            custom_id = result.get('custom_id')
+            if custom_id is None:
+                print(f'Line {line_number} of {results_path} has no custom_id, skipping...')
+                continue
+
+            response = result.get('response') or {}
+            if result.get('error') or response.get('status_code') != 200:
+                errors[custom_id] = result.get('error') or response.get('body')
+                continue
+            try:
+                choice = response['body']['choices'][0]
+                content = choice['message']['content']
+            except (KeyError, IndexError, TypeError) as e:
+                errors[custom_id] = f'Malformed response body: {e}'
+                continue
+            if content is None:
+                # Tool calls and filtered completions come back without text
+                errors[custom_id] = f"No content in the response (finish reason: {choice.get('finish_reason')})"
+                continue
+            responses[custom_id] = content
+    return responses, errors
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import random
+import shutil
+import struct
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from audio_concat import concatenate_audio, read_wav_info, wav_header
+from bench_pipeline import run_measured
+from bench_tts import SILENT_FRAME
+
+def write_clip(path, seconds, sample_rate=22050, float_samples=False, seed=0):
+    """Write a mono WAV clip of noise, as 16-bit PCM or as 32-bit float like macOS say writes."""
+    rng = random.Random(seed)
+    frames = int(seconds * sample_rate)
+    # A second of noise repeated, generating every sample would dominate the setup time
+    if float_samples:
+        second = struct.pack(f'<{sample_rate}f', *(rng.uniform(-0.5, 0.5) for _ in range(sample_rate)))
+        fmt = struct.pack('<HHIIHH', 3, 1, sample_rate, sample_rate * 4, 4, 32)
+        fact = struct.pack('<I', frames)
+    else:
+        second = struct.pack(f'<{sample_rate}h', *(rng.randint(-8000, 8000) for _ in range(sample_rate)))
+        fmt = struct.pack('<HHIIHH', 1, 1, sample_rate, sample_rate * 2, 2, 16)
+        fact = None
+    data = (second * (frames // sample_rate + 1))[:frames * len(second) // sample_rate]
+    with open(path, 'wb') as file:
+        file.write(wav_header(fmt, len(data), fact))
+        file.write(data)
+
+def run_child(engine, output, clips):
+    """Join the clips the way an engine does."""
+    if engine == 'legacy':
+        # The previous loop of mac_tts.py and documentai_ocr.py
+        from pydub import AudioSegment
+        combined_audio = AudioSegment.empty()
+        for clip in clips:
+            combined_audio += AudioSegment.from_wav(clip)
+        combined_audio.export(output, format='wav')
+    else:
+        print(concatenate_audio(clips, output))
+
+def samples_digest(path):
+    """Hash the samples of a WAV file, whatever its header."""
+    info = read_wav_info(path)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        file.seek(info.data_offset)
+        remaining = info.data_size
+        while remaining:
+            buffer = file.read(min(remaining, 1024 * 1024))
+            digest.update(buffer)
+            remaining -= len(buffer)
+    return digest.hexdigest()
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the peak memory and time of joining audio clips with pydub and by streaming.')
+    parser.add_argument('--clips', type=int, default=200, help='Clips to join')
+    parser.add_argument('--seconds', type=float, default=30, help='Length of every clip')
+    parser.add_argument('--float', action='store_true', help='Write 32-bit float clips like macOS say (pydub needs ffmpeg to read them)')
+    parser.add_argument('--mp3', action='store_true', help='Also join as many MP3 clips by streaming')
+    parser.add_argument('--skip-legacy', action='store_true', help='Do not run the pydub loop')
+    parser.add_argument('--child', type=str, choices=['legacy', 'stream'], help=argparse.SUPPRESS)
+    parser.add_argument('paths', nargs='*', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.paths[0], args.paths[1:])
+        return
+
+    work_dir = Path(tempfile.mkdtemp(prefix='bench-audio-'))
+    try:
+        clips = []
+        for i in range(args.clips):
+            clips.append(work_dir / f'clip_{i:04d}.wav')
+            write_clip(clips[-1], args.seconds, float_samples=args.float, seed=i % 10)
+        size_mb = sum(clip.stat().st_size for clip in clips) / (1024 * 1024)
+        print(f'{args.clips} WAV clips of {args.seconds:.0f}s, {size_mb:.0f} MB')
+        print(f'{"engine":>10} {"peak_rss_mb":>12} {"wall_seconds":>13}')
+        engines = ['stream'] if args.skip_legacy else ['legacy', 'stream']
+        digests = {}
+        for engine in engines:
+            output = work_dir / f'{engine}.wav'
+            result = run_measured([sys.executable, __file__, '--child', engine, str(output)] + [str(clip) for clip in clips],
+                                  work_dir, work_dir / f'{engine}.log')
+            print(f'{engine:>10} {result["peak_rss_mb"]:12.1f} {result["wall_seconds"]:13.2f}')
+            digests[engine] = samples_digest(output)
+        if len(set(digests.values())) > 1:
+            raise SystemExit('The engines wrote different samples')
+
+        if args.mp3:
+            frames = int(args.seconds * 44100 / 1152)
+            mp3_clips = []
+            for i in range(args.clips):
+                mp3_clips.append(work_dir / f'clip_{i:04d}.mp3')
+                mp3_clips[-1].write_bytes(b'ID3\x04\x00\x00\x00\x00\x00\x00' + SILENT_FRAME * frames)
+            output = work_dir / 'stream.mp3'
+            result = run_measured([sys.executable, __file__, '--child', 'stream', str(output)] + [str(clip) for clip in mp3_clips],
+                                  work_dir, work_dir / 'mp3.log')
+            print(f'{"mp3 stream":>10} {result["peak_rss_mb"]:12.1f} {result["wall_seconds"]:13.2f}')
+            if output.stat().st_size != args.clips * frames * len(SILENT_FRAME):
+                raise SystemExit('The MP3 output does not hold every frame of the clips')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from chunker import iter_chunks, get_token_counter
+
+WORDS = ("the of and to in a is that for it as was with be by on not he this are or his from at which "
+         "but have an they you were her she there been one all we their has would when if so no more "
+         "analysis document chapter history government economy language structure development").split()
+
+def legacy_split(text, max_tokens):
+    """The previous slicer: cut every max_tokens characters."""
+    return [text[i:i + max_tokens] for i in range(0, len(text), max_tokens)]
+
+def make_document(size_mb, seed=0):
+    """Generate a synthetic document of paragraphs and sentences of roughly size_mb megabytes."""
+    rng = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    paragraphs, size = [], 0
+    while size < target:
+        sentences = []
+        for _ in range(rng.randint(2, 8)):
+            sentence = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(6, 30)))
+            sentences.append(sentence.capitalize() + '.')
+        paragraph = ' '.join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return '\n\n'.join(paragraphs)
+
+def measure(name, split, text, count_tokens):
+    """Run split over text and report request count, throughput and chunk quality."""
+    start = time.perf_counter()
+    chunks = list(split(text))
+    elapsed = time.perf_counter() - start
+    tokens = [count_tokens(chunk) for chunk in chunks]
+    broken_words = sum(1 for chunk in chunks[:-1] if chunk[-1:].isalnum())
+    size_mb = len(text.encode('utf-8')) / (1024 * 1024)
+    print(f'{name:>10}: {len(chunks):6d} requests/doc  {size_mb / elapsed:8.2f} MB/s  '
+          f'avg {sum(tokens) / len(tokens):8.0f} tokens/chunk  max {max(tokens):6d}  '
+          f'{broken_words} chunks cut mid-word')
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the token-aware chunker with the legacy character slicer.')
+    parser.add_argument('files', nargs='*', help='Text files to chunk (default: a synthetic document)')
+    parser.add_argument('--size-mb', type=float, default=5, help='Size of the synthetic document')
+    parser.add_argument('--max-tokens', type=int, default=16384, help='Token budget per chunk')
+    parser.add_argument('--model', type=str, default='llama3.2:latest', help='Model used to count tokens')
+    parser.add_argument('--fill-ratio', type=float, default=0.9, help='Target fill ratio of each chunk')
+    parser.add_argument('--overlap', type=int, default=0, help='Overlap between chunks in tokens')
+    args = parser.parse_args()
+
+    if args.files:
+        documents = [(name, Path(name).read_text(encoding='utf-8')) for name in args.files]
+    else:
+        documents = [(f'synthetic {args.size_mb} MB', make_document(args.size_mb))]
+
+    count_tokens = get_token_counter(args.model)
+    for name, text in documents:
+        print(f'{name}: {len(text)} characters, {count_tokens(text)} tokens')
+        measure('legacy', lambda t: legacy_split(t, args.max_tokens), text, count_tokens)
+        measure('chunker', lambda t: iter_chunks(t, args.max_tokens, args.model, args.fill_ratio, args.overlap),
+                text, count_tokens)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ocr_text import TextExtractor, orjson
+
+WORDS = ("the of and to in a is that for it as was with be by on not he this are or his from at which "
+         "report analysis section figure table results method data chapter history policy market region "
+         "inter- national govern- ment develop- ment").split()
+
+# The previous extraction helpers of documentai_ocr.py
+def legacy_extract_language_from_page(page):
+    language_code = "en-US"
+    detected_languages = page.get('detectedLanguages', [])
+    if detected_languages:
+        language_code = detected_languages[0].get('languageCode', 'en-US')
+    return language_code
+
+def legacy_extract_text_from_layout(layout, document_text):
+    extracted_text = ""
+    if 'textAnchor' in layout:
+        for segment in layout['textAnchor']['textSegments']:
+            start_index = int(segment.get('startIndex', 0))
+            end_index = int(segment.get('endIndex', len(document_text)))
+            extracted_text += document_text[start_index:end_index]
+    else:
+        print("No textAnchor found in layout.")
+    return extracted_text
+
+def legacy_clean_paragraph_text(text):
+    text = text.replace("\n", " ").strip()
+    text = re.sub(r'(\w)-\s*(\w)', r'\1\2', text)
+    return text
+
+def legacy_remove_header_footer(text, header_pattern, footer_pattern):
+    lines = text.splitlines()
+    cleaned_lines = []
+    for line in lines:
+        if header_pattern and re.search(header_pattern, line):
+            continue
+        if footer_pattern and re.search(footer_pattern, line):
+            continue
+        cleaned_lines.append(line)
+    return '\n'.join(cleaned_lines)
+
+def legacy_format_page_text(page, document_text, header, footer):
+    formatted_text = ""
+    for paragraph in page.get('paragraphs', []):
+        paragraph_text = legacy_extract_text_from_layout(paragraph['layout'], document_text)
+        if paragraph_text:
+            paragraph_text = legacy_clean_paragraph_text(paragraph_text)
+            paragraph_text = legacy_remove_header_footer(paragraph_text, header, footer)
+            if paragraph_text:
+                formatted_text += paragraph_text + "\n"
+    return formatted_text.strip()
+
+def legacy_extract_text_from_response(response, header, footer):
+    document = response.get('document', {})
+    document_text = document.get('text', '')
+    if not document_text:
+        print("No 'text' field found in the 'document' JSON response.")
+        return '', 'en-US'
+    extracted_text = ''
+    language_code = 'en-US'
+    for page in document.get('pages', []):
+        page_text = legacy_format_page_text(page, document_text, header, footer)
+        if page_text:
+            extracted_text += page_text + "\n\n"
+        page_language_code = legacy_extract_language_from_page(page)
+        if page_language_code:
+            language_code = page_language_code
+    return extracted_text.strip(), language_code
+
+def make_segment(start, end):
+    # Document AI encodes int64 fields as strings and leaves out zero values
+    segment = {'endIndex': str(end)}
+    if start:
+        segment['startIndex'] = str(start)
+    return segment
+
+def make_page_response(number, paragraphs=60, lines_per_paragraph=4, words_per_line=12, seed=0):
+    """
+    Build the saved response of one dense report page: a header, a footer and paragraphs
+    of several lines with hyphenated words, each line also anchored as a line and its
+    words as tokens, as Document AI does.
+    """
+    rng = random.Random(seed * 100003 + number)
+    text, page_paragraphs, lines, tokens = '', [], [], []
+    blocks = [[f'Page {number}']]
+    for _ in range(paragraphs):
+        blocks.append([' '.join(rng.choice(WORDS) for _ in range(words_per_line)) for _ in range(lines_per_paragraph)])
+    blocks.append([f'Chapter {number // 20 + 1} - Annual report'])
+    for block in blocks:
+        paragraph_start = len(text)
+        segments = []
+        for line in block:
+            line_start = len(text)
+            for match in re.finditer(r'\S+', line):
+                tokens.append({'layout': {'textAnchor': {'textSegments': [make_segment(line_start + match.start(), line_start + match.end())]},
+                                          'confidence': 0.99}})
+            text += line + '\n'
+            lines.append({'layout': {'textAnchor': {'textSegments': [make_segment(line_start, len(text))]}, 'confidence': 0.98}})
+            segments.append(make_segment(line_start, len(text)))
+        # Some paragraphs are anchored line by line, as Document AI does for paragraphs spanning columns
+        if rng.random() < 0.2:
+            anchor = {'textSegments': segments}
+        else:
+            anchor = {'textSegments': [make_segment(paragraph_start, len(text))]}
+        page_paragraphs.append({'layout': {'textAnchor': anchor, 'confidence': 0.98,
+                                           'boundingPoly': {'normalizedVertices': [{'x': 0.1, 'y': 0.1}, {'x': 0.9, 'y': 0.1},
+                                                                                   {'x': 0.9, 'y': 0.2}, {'x': 0.1, 'y': 0.2}]}}})
+    page = {'pageNumber': 1, 'paragraphs': page_paragraphs, 'lines': lines, 'tokens': tokens,
+            'detectedLanguages': [{'languageCode': 'en', 'confidence': 0.99}],
+            'dimension': {'width': 612, 'height': 792, 'unit': 'points'}}
+    return {'document': {'mimeType': 'application/pdf', 'text': text, 'pages': [page]}}
+
+def write_corpus(folder, pages, paragraphs, tokens=False):
+    """Save the responses of a synthetic report the way documentai_ocr.py does, one JSON file per page."""
+    paths = []
+    for number in range(1, pages + 1):
+        path = os.path.join(folder, f'report_page_{number}.json')
+        response = make_page_response(number, paragraphs)
+        if not tokens:
+            page = response['document']['pages'][0]
+            del page['lines'], page['tokens']
+        with open(path, 'w') as json_file:
+            json.dump(response, json_file, indent=2)
+        paths.append(path)
+    return paths
+
+def parse_json(path):
+    with open(path, 'rb') as json_file:
+        return json.loads(json_file.read())
+
+def parse_orjson(path):
+    with open(path, 'rb') as json_file:
+        return orjson.loads(json_file.read())
+
+def reextract(path, header, footer):
+    return TextExtractor(header, footer).extract_file(path)
+
+def measure(name, run, pages, size_mb=None):
+    start = time.perf_counter()
+    results = run()
+    elapsed = time.perf_counter() - start
+    throughput = f'  {size_mb / elapsed:7.1f} MB/s' if size_mb else ''
+    print(f'{name:>24}: {elapsed:7.2f}s  {pages / elapsed:8.0f} pages/s{throughput}')
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the text extraction engine with the legacy helpers over saved responses.')
+    parser.add_argument('--pages', type=int, default=1000, help='Pages of the synthetic report')
+    parser.add_argument('--paragraphs', type=int, default=60, help='Paragraphs per page')
+    parser.add_argument('--tokens', action='store_true', help='Also save the lines and tokens of every page, as full responses do')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Processes of the parallel run')
+    parser.add_argument('--header', type=str, default=r'^Page \d+$', help='Header pattern to remove')
+    parser.add_argument('--footer', type=str, default=r'^Chapter \d+', help='Footer pattern to remove')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = write_corpus(folder, args.pages, args.paragraphs, args.tokens)
+        size_mb = sum(os.path.getsize(path) for path in paths) / (1024 * 1024)
+        print(f'{args.pages} saved responses, {size_mb:.0f} MB')
+
+        print('Parsing:')
+        responses = measure('json', lambda: [parse_json(path) for path in paths], args.pages, size_mb)
+        if orjson is not None:
+            measure('orjson', lambda: [parse_orjson(path) for path in paths], args.pages, size_mb)
+        else:
+            print('orjson is not installed, skipping the orjson runs')
+
+        print('Extracting parsed responses:')
+        expected = measure('legacy', lambda: [legacy_extract_text_from_response(response, args.header, args.footer)
+                                              for response in responses], args.pages)
+        extractor = TextExtractor(args.header, args.footer)
+        results = measure('engine', lambda: [extractor.extract(response) for response in responses], args.pages)
+        if results != expected:
+            raise SystemExit('The engine extracted different text than the legacy helpers')
+
+        print('Re-extracting the saved corpus:')
+        measure('legacy', lambda: [legacy_extract_text_from_response(parse_json(path), args.header, args.footer)
+                                   for path in paths], args.pages, size_mb)
+        results = measure('engine', lambda: [extractor.extract_file(path) for path in paths], args.pages, size_mb)
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            extract = partial(reextract, header=args.header, footer=args.footer)
+            parallel = measure(f'engine, {args.workers} processes',
+                               lambda: list(executor.map(extract, paths, chunksize=32)), args.pages, size_mb)
+        if results != expected or parallel != expected:
+            raise SystemExit('The engine extracted different text than the legacy helpers')
+        print('All runs extracted identical text')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import io
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bench_chunker import make_document
+from mac_tts import SilenceEngine, audio_seconds, get_engine, synthesize_folder
+
+def main():
+    parser = argparse.ArgumentParser(description='Time mac_tts.synthesize_folder with different job limits.')
+    parser.add_argument('--files', type=int, default=32, help='Text files to speak')
+    parser.add_argument('--file-kb', type=float, default=2, help='Size of every text file')
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 2, 4, 8], help='Job limits to run')
+    parser.add_argument('--engine', type=str, default='silence', help='Engine to run (silence, espeak-ng or say)')
+    parser.add_argument('--realtime-factor', type=float, default=0.005, help='Seconds the silence engine takes per second of audio')
+    args = parser.parse_args()
+
+    engine = SilenceEngine(args.realtime_factor) if args.engine == 'silence' else get_engine(args.engine)
+    work_dir = Path(tempfile.mkdtemp(prefix='bench-tts-'))
+    try:
+        texts = work_dir / 'ssf'
+        texts.mkdir()
+        for i in range(args.files):
+            (texts / f'doc{i}.ssf').write_text(make_document(args.file_kb / 1024, seed=i), encoding='utf-8')
+        print(f'{args.files} files of {args.file_kb:.0f} KB spoken with {engine.name}')
+        print(f'{"jobs":>6} {"wall_seconds":>13} {"files_per_sec":>14} {"speedup":>8}')
+        baseline = None
+        for jobs in args.jobs:
+            output = work_dir / f'jobs{jobs}'
+            final_output = work_dir / f'jobs{jobs}_final_output.wav'
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = synthesize_folder(texts, output, final_output, engine, jobs, ['ssf'])
+            wall = time.perf_counter() - started
+            if any(result.status != 'generated' for result in results):
+                raise SystemExit(f'{sum(result.status == "failed" for result in results)} files failed with {jobs} jobs')
+            total = sum(audio_seconds(result.output_path) for result in results)
+            if abs(audio_seconds(final_output) - total) > 0.01:
+                raise SystemExit(f'The final output with {jobs} jobs is not as long as the files it combines')
+            baseline = baseline or wall
+            print(f'{jobs:6d} {wall:13.2f} {args.files / wall:14.1f} {baseline / wall:7.1f}x')
+
+        # A second run over the same output must skip every file
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = synthesize_folder(texts, output, None, engine, args.jobs[-1], ['ssf'])
+        if any(result.status != 'skipped' for result in results):
+            raise SystemExit('Files whose .wav file exists were spoken again')
+        print('A second run skipped every file')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+import argparse
+import random
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bench_chunker import WORDS
+from bench_pipeline import REPO_DIR, run_measured, write_config
+from chunker import iter_chunks
+from mock_openai_server import add_settings_arguments, settings_from_args, start_server
+from text_reader import iter_file_chunks
+
+def write_large_document(path, size_mb, seed=0):
+    """Write a synthetic document of about size_mb megabytes without holding it in memory."""
+    rng = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    size = 0
+    with open(path, 'w', encoding='utf-8') as file:
+        while size < target:
+            sentences = [' '.join(rng.choice(WORDS) for _ in range(rng.randint(6, 30))).capitalize() + '.'
+                         for _ in range(rng.randint(2, 8))]
+            paragraph = ' '.join(sentences) + '\n\n'
+            file.write(paragraph)
+            size += len(paragraph)
+
+def run_child(reader, path, max_tokens, model):
+    """Chunk a file the way a reader does and print how many chunks it produced."""
+    if reader == 'full':
+        # The previous reader: the whole text, then a list of every chunk
+        with open(path, 'r', encoding='utf-8') as file:
+            chunks = list(iter_chunks(file.read(), max_tokens, model, 0.9))
+        count = len(chunks)
+    else:
+        count = sum(1 for _ in iter_file_chunks(path, max_tokens, model, 0.9))
+    print(f'{count} chunks')
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the peak memory of the whole-file and streaming readers.')
+    parser.add_argument('--size-mb', type=float, default=200, help='Size of the synthetic document')
+    parser.add_argument('--max-tokens', type=int, default=16384, help='Token budget per chunk')
+    parser.add_argument('--model', type=str, default='llama3.2:latest', help='Model used to count tokens')
+    parser.add_argument('--pipeline', action='store_true', help='Also run openai-text-analizer.py --async on the document')
+    parser.add_argument('--max-in-flight', type=int, default=8, help='Concurrent requests allowed with --pipeline')
+    parser.add_argument('--child', type=str, choices=['full', 'stream'], help=argparse.SUPPRESS)
+    parser.add_argument('path', nargs='?', help=argparse.SUPPRESS)
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.path, args.max_tokens, args.model)
+        return
+
+    work_dir = Path(tempfile.mkdtemp(prefix='bench-memory-'))
+    try:
+        (work_dir / 'txt').mkdir()
+        document = work_dir / 'txt' / 'large.txt'
+        write_large_document(document, args.size_mb)
+        print(f'Document of {document.stat().st_size / (1024 * 1024):.0f} MB in {work_dir}')
+        print(f'{"reader":>10} {"peak_rss_mb":>12} {"wall_seconds":>13}')
+        for reader in ('full', 'stream'):
+            result = run_measured([sys.executable, __file__, '--child', reader, '--max-tokens', str(args.max_tokens),
+                                   '--model', args.model, str(document)], work_dir, work_dir / f'{reader}.log')
+            print(f'{reader:>10} {result["peak_rss_mb"]:12.1f} {result["wall_seconds"]:13.2f}')
+
+        if args.pipeline:
+            server = start_server(settings_from_args(args))
+            try:
+                write_config(work_dir, server.base_url, args)
+                result = run_measured([sys.executable, str(REPO_DIR / 'openai-text-analizer.py'), '--f',
+                                       str(work_dir / 'txt'), '--output', str(work_dir / 'output'), '--m', 'ent',
+                                       '--no-cache', '--async'], work_dir, work_dir / 'pipeline.log')
+            finally:
+                server.shutdown()
+            print(f'{"pipeline":>10} {result["peak_rss_mb"]:12.1f} {result["wall_seconds"]:13.2f}')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench_chunker import make_document
+from mock_openai_server import add_settings_arguments, settings_from_args, start_server
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+BASELINE_DIR = Path(__file__).resolve().parent / 'baselines'
+SCENARIOS = {
+    'sync': [],
+    'async': ['--async'],
+    'jobs': ['--jobs', '4', '--executor', 'thread'],
+    'stream': ['--async', '--stream'],
+}
+# Metrics where a higher value is better, the others are better when lower
+HIGHER_IS_BETTER = {'docs_per_sec', 'requests_per_sec'}
+
+def run_measured(command, cwd, log_file):
+    """Run a command and return its wall time, CPU time and peak RSS."""
+    started = time.perf_counter()
+    with open(log_file, 'w', encoding='utf-8') as log:
+        process = subprocess.Popen(command, cwd=cwd, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - started
+    if process.returncode != 0:
+        raise RuntimeError(f'{" ".join(map(str, command))} exited with {process.returncode}, see {log_file}')
+    return {
+        'wall_seconds': wall,
+        'cpu_seconds': usage.ru_utime + usage.ru_stime,
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        'peak_rss_mb': usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024),
+    }
+
+def write_corpus(directory, docs, doc_kb, seed=0):
+    """Write docs synthetic text files of about doc_kb kilobytes each."""
+    directory.mkdir(parents=True, exist_ok=True)
+    for i in range(docs):
+        (directory / f'doc{i:04d}.txt').write_text(make_document(doc_kb / 1024, seed + i), encoding='utf-8')
+
+def write_markdown_corpus(directory, docs, seed=0):
+    """Write docs synthetic markdown outlines like the ones the md mode produces."""
+    rng = random.Random(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    for i in range(docs):
+        lines = [f'# Document {i}']
+        for section in range(rng.randint(5, 15)):
+            lines.append(f'## Section {section}')
+            lines.extend(f'- {make_document(0.0002, seed + i * 100 + section + item)[:80]}'
+                         for item in range(rng.randint(3, 10)))
+        (directory / f'doc{i:04d}.md').write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+def write_config(work_dir, base_url, args):
+    """Write a config.json pointing the ollama backend at the mock server."""
+    with open(REPO_DIR / 'config.json', 'r') as file:
+        config = json.load(file)
+    if args.max_tokens:
+        config['default']['max_tokens'] = str(args.max_tokens)
+    backend = config['backends']['ollama']
+    backend['endpoints'] = [{'base_url': base_url, 'weight': '1', 'max_in_flight': str(args.max_in_flight)}]
+    backend['max_in_flight'] = str(args.max_in_flight)
+    config['cache']['path'] = str(work_dir / 'cache.sqlite')
+    with open(work_dir / 'config.json', 'w') as file:
+        json.dump(config, file, indent=4)
+
+def bench_pipeline(name, extra_args, work_dir, server, args):
+    """Run openai-text-analizer.py over the corpus with a fresh output directory."""
+    output_dir = work_dir / f'output-{name}'
+    before = server.RequestHandlerClass.settings.stats()
+    command = [sys.executable, str(REPO_DIR / 'openai-text-analizer.py'), '--f', str(work_dir / 'txt'),
+               '--output', str(output_dir), '--m', args.modes, '--no-cache', *extra_args]
+    result = run_measured(command, work_dir, work_dir / f'{name}.log')
+    after = server.RequestHandlerClass.settings.stats()
+    requests = after['requests'] - before['requests']
+    result.update({
+        'requests': requests,
+        'errors': after['errors'] - before['errors'],
+        'docs_per_sec': args.docs / result['wall_seconds'],
+        'requests_per_sec': requests / result['wall_seconds'],
+    })
+    return result
+
+def bench_offline(work_dir, args):
+    """Time the markmap and HTML conversions over a synthetic markdown corpus."""
+    md_dir = work_dir / 'offline' / 'md'
+    write_markdown_corpus(md_dir, args.offline_docs)
+    results = {}
+    map_dir = work_dir / 'offline' / 'map'
+    results['markmapper'] = run_measured(
+        [sys.executable, str(REPO_DIR / 'markmapper.py'), str(md_dir), str(map_dir)], work_dir, work_dir / 'markmapper.log')
+    folders = [work_dir / 'offline' / name for name in ('html', 'lda', 'ssf', 'sum', 'que', 'ent')]
+    results['html'] = run_measured(
+        [sys.executable, str(REPO_DIR / 'main.py'), str(md_dir), *map(str, folders), str(map_dir)],
+        work_dir, work_dir / 'html.log')
+    for result in results.values():
+        result['docs_per_sec'] = args.offline_docs / result['wall_seconds']
+    return results
+
+def print_results(results, baseline=None):
+    columns = ('docs_per_sec', 'requests_per_sec', 'wall_seconds', 'cpu_seconds', 'peak_rss_mb')
+    print(f'{"benchmark":>12} ' + ' '.join(f'{column:>18}' for column in columns))
+    for name, result in results.items():
+        cells = []
+        for column in columns:
+            value = result.get(column)
+            if value is None:
+                cells.append(f'{"-":>18}')
+                continue
+            cell = f'{value:.2f}'
+            previous = (baseline or {}).get(name, {}).get(column)
+            if previous:
+                change = 100 * (value - previous) / previous
+                better = change > 0 if column in HIGHER_IS_BETTER else change < 0
+                cell += f' ({change:+.0f}%{"" if abs(change) < 5 else " +" if better else " -"})'
+            cells.append(f'{cell:>18}')
+        print(f'{name:>12} ' + ' '.join(cells))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the analyzer pipeline against a local mock OpenAI server.')
+    parser.add_argument('--docs', type=int, default=20, help='Number of synthetic documents')
+    parser.add_argument('--doc-kb', type=float, default=64, help='Size of each synthetic document in kilobytes')
+    parser.add_argument('--max-tokens', type=int, default=None, help='Chunk size in tokens (default: config.json)')
+    parser.add_argument('--modes', type=str, default='ent', help='Mode passed to --m')
+    parser.add_argument('--max-in-flight', type=int, default=8, help='Concurrent requests allowed by the config')
+    parser.add_argument('--scenarios', type=str, default=','.join(SCENARIOS), help='Comma separated scenarios to run')
+    parser.add_argument('--offline-docs', type=int, default=200, help='Markdown documents for the offline stages (0 to skip)')
+    parser.add_argument('--save', type=str, default=None, help='Save the results as a named baseline')
+    parser.add_argument('--compare', type=str, default=None, help='Compare the results with a named baseline')
+    parser.add_argument('--keep', action='store_true', help='Keep the working directory')
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(BASELINE_DIR / f'{args.compare}.json', 'r') as file:
+            baseline = json.load(file)['results']
+
+    server = start_server(settings_from_args(args))
+    work_dir = Path(tempfile.mkdtemp(prefix='bench-pipeline-'))
+    write_corpus(work_dir / 'txt', args.docs, args.doc_kb)
+    write_config(work_dir, server.base_url, args)
+    print(f'{args.docs} documents of {args.doc_kb:g} KB in {work_dir}, mock server at {server.base_url}')
+
+    results = {}
+    try:
+        for name in args.scenarios.split(','):
+            results[name] = bench_pipeline(name, SCENARIOS[name], work_dir, server, args)
+        if args.offline_docs:
+            results.update(bench_offline(work_dir, args))
+    finally:
+        server.shutdown()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_results(results, baseline)
+    if args.save:
+        BASELINE_DIR.mkdir(exist_ok=True)
+        settings = {key: value for key, value in vars(args).items() if key not in ('save', 'compare', 'keep')}
+        with open(BASELINE_DIR / f'{args.save}.json', 'w') as file:
+            json.dump({'settings': settings, 'results': results}, file, indent=2)
+        print(f'Baseline saved to {BASELINE_DIR / f"{args.save}.json"}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from audio_concat import mp3_data_offset
+from tts_engine import SpeechEngine, chunk_text
+
+WORDS = ("the of and to in a is that for it as was with be by on not he this are or his from at which "
+         "report analysis section figure table results method data chapter history policy market region").split()
+
+# A silent MPEG-1 Layer III frame: 128 kbps, 44.1 kHz, joint stereo, 1152 samples
+SILENT_FRAME = b'\xff\xfb\x90\x44' + bytes(413)
+INFO_FRAME = b'\xff\xfb\x90\x44' + bytes(32) + b'Info' + bytes(377)  # The header frame LAME writes before the audio
+FRAME_SECONDS = 1152 / 44100
+ID3_TAG = b'ID3\x04\x00\x00\x00\x00\x00\x00'  # An empty ID3v2.4 tag, as some encoders write
+CHARACTERS_PER_SECOND = 15  # Speaking rate of the fake voice
+
+def silent_frames(text):
+    """Return the number of MP3 frames text takes to say."""
+    return max(1, round(len(text) / CHARACTERS_PER_SECOND / FRAME_SECONDS))
+
+def silent_mp3(text):
+    """Return silent MP3 data as long as text takes to say, tagged and with a header frame like an encoder writes it."""
+    return ID3_TAG + INFO_FRAME + SILENT_FRAME * silent_frames(text)
+
+class FakeSynthesizer:
+    """Stand in for Google Text-to-Speech: wait like a request, then return silent MP3 of the text's spoken length."""
+
+    def __init__(self, latency=0.3, seconds_per_kb=0.1):
+        self.latency = latency
+        self.seconds_per_kb = seconds_per_kb
+
+    def synthesize(self, text, language_code):
+        time.sleep(self.latency + self.seconds_per_kb * len(text.encode('utf-8')) / 1024)
+        return silent_mp3(text)
+
+def legacy_text_to_speech(text, language_code, output_path, synthesizer):
+    """
+    The previous text_to_speech loop: one chunk at a time, appended with AudioSegment +=.
+
+    The fake MP3 cannot be decoded without ffmpeg, so every chunk is added as the same
+    length of PCM silence, which is what AudioSegment.from_file would have returned.
+    """
+    from pydub import AudioSegment
+    combined_audio = AudioSegment.empty()
+    for chunk in chunk_text(text):
+        audio = synthesizer.synthesize(chunk, language_code)
+        frames = (len(audio) - mp3_data_offset(audio)) // len(SILENT_FRAME)
+        combined_audio += AudioSegment.silent(duration=frames * FRAME_SECONDS * 1000, frame_rate=44100)
+    combined_audio.export(output_path, format='wav')
+
+def make_text(kb, seed=0):
+    """Generate kb kilobytes of sentences."""
+    rng = random.Random(seed)
+    sentences, size = [], 0
+    while size < kb * 1024:
+        sentence = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(6, 30))).capitalize() + '.'
+        sentences.append(sentence)
+        size += len(sentence) + 1
+    return ' '.join(sentences)
+
+def measure(name, run, chunks, output_path):
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    print(f'{name:>28}: {elapsed:7.2f}s  {chunks / elapsed:6.1f} chunks/s  {os.path.getsize(output_path) / 1024 / 1024:6.1f} MB')
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the pooled speech engine with the sequential text_to_speech loop.')
+    parser.add_argument('--kb', type=float, default=200, help='Kilobytes of text to synthesize')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8], help='Pool sizes to run')
+    parser.add_argument('--latency', type=float, default=0.3, help='Seconds of every fake request')
+    parser.add_argument('--seconds-per-kb', type=float, default=0.1, help='Additional seconds per kilobyte of text')
+    parser.add_argument('--skip-legacy', action='store_true', help='Do not run the sequential loop')
+    args = parser.parse_args()
+
+    text = make_text(args.kb)
+    chunks = len(chunk_text(text))
+    synthesizer = FakeSynthesizer(args.latency, args.seconds_per_kb)
+    print(f'{args.kb:.0f} KB of text in {chunks} chunks')
+
+    with tempfile.TemporaryDirectory() as folder:
+        if not args.skip_legacy:
+            legacy_path = os.path.join(folder, 'legacy.wav')
+            measure('legacy', lambda: legacy_text_to_speech(text, 'en-US', legacy_path, synthesizer), chunks, legacy_path)
+
+        # Only the tag of the first chunk is kept, header frames would describe the length of one chunk
+        expected = ID3_TAG + b''.join(SILENT_FRAME * silent_frames(chunk) for chunk in chunk_text(text))
+        for workers in args.workers:
+            output_path = os.path.join(folder, f'engine_{workers}.mp3')
+            with SpeechEngine(synthesizer, workers) as engine:
+                measure(f'engine, {workers} workers', lambda: engine.synthesize_to_file(text, 'en-US', output_path),
+                        chunks, output_path)
+            with open(output_path, 'rb') as output:
+                if output.read() != expected:
+                    raise SystemExit(f'The engine with {workers} workers wrote different audio')
+        print('All engine runs wrote the chunks in order')
+
+if __name__ == "__main__":
+    main()
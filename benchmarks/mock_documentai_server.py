@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+import argparse
+import base64
+import io
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PyPDF2 import PageObject, PdfReader, PdfWriter
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+WORDS = ("the of and to in a is that for it as was with be by on not he this are or his from at which "
+         "report analysis section figure table results method data chapter history policy market region").split()
+
+def make_pdf(pages, words_per_page=300, seed=0, title='Document'):
+    """Return the bytes of a PDF whose pages carry extractable text, starting with '<title> page N'."""
+    rng = random.Random(seed)
+    writer = PdfWriter()
+    font = DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type1'),
+        NameObject('/BaseFont'): NameObject('/Helvetica'),
+    })
+    for number in range(1, pages + 1):
+        page = PageObject.create_blank_page(None, 612, 792)
+        lines = [f'{title} page {number}']
+        words = [rng.choice(WORDS) for _ in range(words_per_page)]
+        lines.extend(' '.join(words[i:i + 12]) for i in range(0, len(words), 12))
+        commands = ['BT', '/F1 10 Tf', '12 TL', '50 750 Td']
+        commands.extend(f'({line}) Tj T*' for line in lines)
+        commands.append('ET')
+        stream = DecodedStreamObject()
+        stream.set_data('\n'.join(commands).encode('latin-1'))
+        page[NameObject('/Contents')] = writer._add_object(stream)
+        page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/Font'): DictionaryObject({NameObject('/F1'): font})
+        })
+        writer.add_page(page)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+def make_document(page_texts, language='en'):
+    """Build a Document AI document with one paragraph per line of every page, anchored in the full text."""
+    text, pages = '', []
+    for number, page_text in enumerate(page_texts, start=1):
+        paragraphs = []
+        for line in page_text.splitlines():
+            if not line.strip():
+                continue
+            start = len(text)
+            text += line + '\n'
+            # Document AI encodes int64 fields as strings and leaves out zero values
+            segment = {'endIndex': str(len(text))}
+            if start:
+                segment['startIndex'] = str(start)
+            paragraphs.append({'layout': {'textAnchor': {'textSegments': [segment]}, 'confidence': 0.98,
+                                          'boundingPoly': {'normalizedVertices': [{'x': 0.1, 'y': 0.1}, {'x': 0.9, 'y': 0.1},
+                                                                                  {'x': 0.9, 'y': 0.2}, {'x': 0.1, 'y': 0.2}]}}})
+        pages.append({'pageNumber': number, 'paragraphs': paragraphs,
+                      'detectedLanguages': [{'languageCode': language, 'confidence': 0.99}],
+                      'dimension': {'width': 612, 'height': 792, 'unit': 'points'}})
+    return {'document': {'mimeType': 'application/pdf', 'text': text, 'pages': pages}}
+
+class MockSettings:
+    """Behaviour of the mock server, shared by all request handlers."""
+
+    def __init__(self, latency=0.2, page_latency=0.05, error_rate=0.0, error_status=503, max_pages=15, token=None,
+                 seed=0):
+        self.latency = float(latency)
+        self.page_latency = float(page_latency)
+        self.error_rate = float(error_rate)
+        self.error_status = int(error_status)
+        self.max_pages = int(max_pages)
+        self.token = token
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.pages = 0
+        self.errors = 0
+        self.connections = set()
+        self.lock = threading.Lock()
+
+    def stats(self):
+        with self.lock:
+            return {'requests': self.requests, 'pages': self.pages, 'errors': self.errors,
+                    'connections': len(self.connections)}
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Answer Document AI :process requests with the text of every page of the inline PDF."""
+
+    protocol_version = 'HTTP/1.1'
+    settings = MockSettings()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._send_json(200, self.settings.stats())
+        else:
+            self._send_json(404, {'error': {'code': 404, 'message': f'Unknown path {self.path}'}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if not self.path.endswith(':process'):
+            self._send_json(404, {'error': {'code': 404, 'message': f'Unknown path {self.path}'}})
+            return
+
+        settings = self.settings
+        with settings.lock:
+            settings.requests += 1
+            settings.connections.add(self.client_address)
+            failed = settings.random.random() < settings.error_rate
+            if failed:
+                settings.errors += 1
+        if settings.token and self.headers.get('Authorization') != f'Bearer {settings.token}':
+            self._send_json(401, {'error': {'code': 401, 'message': 'Request had invalid authentication credentials.'}})
+            return
+        time.sleep(settings.latency)
+        if failed:
+            headers = {'Retry-After': '0.1'} if settings.error_status == 429 else {}
+            self._send_json(settings.error_status, {'error': {'code': settings.error_status, 'message': 'Injected error'}},
+                            headers)
+            return
+
+        document = body.get('inlineDocument') or body.get('rawDocument') or {}
+        reader = PdfReader(io.BytesIO(base64.b64decode(document.get('content', ''))))
+        if len(reader.pages) > settings.max_pages:
+            self._send_json(400, {'error': {'code': 400, 'message': f'Document pages exceed the limit: {settings.max_pages}'}})
+            return
+        with settings.lock:
+            settings.pages += len(reader.pages)
+        time.sleep(settings.page_latency * len(reader.pages))
+        self._send_json(200, make_document([page.extract_text() for page in reader.pages]))
+
+def start_server(settings, host='127.0.0.1', port=0):
+    """Start the mock server in a background thread and return it; its process URL is server.process_url."""
+    handler = type('ConfiguredMockHandler', (MockHandler,), {'settings': settings})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.process_url = f'http://{host}:{server.server_address[1]}/v1/projects/mock/locations/us/processors/mock:process'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def add_settings_arguments(parser):
+    """Add the options of MockSettings to an argument parser."""
+    parser.add_argument('--latency', type=float, default=0.2, help='Seconds before every response')
+    parser.add_argument('--page-latency', type=float, default=0.05, help='Additional seconds per page of the request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail')
+    parser.add_argument('--error-status', type=int, default=503, help='HTTP status of failed requests (e.g. 429, 503)')
+    parser.add_argument('--max-pages', type=int, default=15, help='Pages allowed in one inline request')
+    parser.add_argument('--token', type=str, default=None, help='Bearer token required from clients')
+
+def settings_from_args(args):
+    return MockSettings(args.latency, args.page_latency, args.error_rate, args.error_status, args.max_pages, args.token)
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a mock Document AI processor.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_server(settings_from_args(args), args.host, args.port)
+    print(f'Mock Document AI processor listening on {server.process_url}, press Ctrl+C to stop')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
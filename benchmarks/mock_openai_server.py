@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class MockSettings:
+    """Behaviour of the mock server, shared by all request handlers."""
+
+    def __init__(self, latency=0.05, tokens_per_second=200.0, completion_tokens=64, error_rate=0.0,
+                 error_status=500, seed=0):
+        self.latency = float(latency)
+        self.tokens_per_second = float(tokens_per_second)
+        self.completion_tokens = int(completion_tokens)
+        self.error_rate = float(error_rate)
+        self.error_status = int(error_status)
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def stats(self):
+        with self.lock:
+            return {'requests': self.requests, 'errors': self.errors}
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Answer /v1/models and /v1/chat/completions like an OpenAI-compatible server."""
+
+    protocol_version = 'HTTP/1.1'
+    settings = MockSettings()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'mock', 'object': 'model', 'owned_by': 'mock'}]})
+        elif self.path == '/stats':
+            self._send_json(200, self.settings.stats())
+        else:
+            self._send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+            return
+
+        settings = self.settings
+        with settings.lock:
+            settings.requests += 1
+            failed = settings.random.random() < settings.error_rate
+            if failed:
+                settings.errors += 1
+        time.sleep(settings.latency)
+        if failed:
+            headers = {'retry-after-ms': '100'} if settings.error_status == 429 else {}
+            self._send_json(settings.error_status, {'error': {'message': 'Injected error', 'type': 'mock_error'}}, headers)
+            return
+
+        prompt_tokens = sum(len(str(message.get('content', ''))) // 4 for message in body.get('messages', []))
+        completion_tokens = min(settings.completion_tokens, int(body.get('max_tokens') or settings.completion_tokens))
+        pieces = [f'token{i % 100} ' for i in range(completion_tokens)]
+        completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+        model = body.get('model', 'mock')
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                 'total_tokens': prompt_tokens + completion_tokens}
+
+        if body.get('stream'):
+            self._stream(completion_id, model, pieces, usage)
+            return
+        time.sleep(completion_tokens / settings.tokens_per_second)
+        self._send_json(200, {
+            'id': completion_id, 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': ''.join(pieces)}}],
+            'usage': usage,
+        })
+
+    def _stream(self, completion_id, model, pieces, usage):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def send_event(data):
+            payload = f'data: {data}\n\n'.encode('utf-8')
+            self.wfile.write(f'{len(payload):x}\r\n'.encode('ascii') + payload + b'\r\n')
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None, **extra):
+            return json.dumps({
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}], **extra,
+            })
+
+        for piece in pieces:
+            time.sleep(1 / self.settings.tokens_per_second)
+            send_event(chunk({'content': piece}))
+        send_event(chunk({}, 'stop', usage=usage))
+        send_event('[DONE]')
+        self.wfile.write(b'0\r\n\r\n')
+
+def start_server(settings, host='127.0.0.1', port=0):
+    """Start the mock server in a background thread and return it; its base URL is server.base_url."""
+    handler = type('ConfiguredMockHandler', (MockHandler,), {'settings': settings})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.base_url = f'http://{host}:{server.server_address[1]}/v1'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def add_settings_arguments(parser):
+    """Add the options of MockSettings to an argument parser."""
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds before every response starts')
+    parser.add_argument('--tokens-per-second', type=float, default=200.0, help='Generation speed of the mock model')
+    parser.add_argument('--completion-tokens', type=int, default=64, help='Tokens in every completion')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail')
+    parser.add_argument('--error-status', type=int, default=500, help='HTTP status of failed requests (e.g. 429, 500)')
+
+def settings_from_args(args):
+    return MockSettings(args.latency, args.tokens_per_second, args.completion_tokens, args.error_rate, args.error_status)
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a mock OpenAI-compatible chat completions API.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=11434, help='Port to listen on')
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_server(settings_from_args(args), args.host, args.port)
+    print(f'Mock server listening on {server.base_url}, press Ctrl+C to stop')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
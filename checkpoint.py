@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+JOURNAL_FILE = 'journal.jsonl'
+
+def write_file_atomically(output_file, chunks, encoding='utf-8'):
+    """Write an iterable of strings to output_file so readers never see a partial file."""
+    output_file = Path(output_file)
+    temp_file = output_file.with_name(f'.{output_file.name}.tmp')
+    with open(temp_file, 'w', encoding=encoding) as file:
+        for chunk in chunks:
+            file.write(chunk)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_file, output_file)
+
+class ResponseWriter:
+    """Write a response to a temporary file piece by piece, hashing it as it goes."""
+
+    def __init__(self, directory):
+        directory.mkdir(parents=True, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=directory, suffix='.part', delete=False)
+        self.path = Path(self._file.name)
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self._hash.update(data)
+        self._file.write(data)
+        self.size += len(data)
+
+    def close(self):
+        """Flush the file to disk and return the hash of its content."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        return self._hash.hexdigest()
+
+    def discard(self):
+        """Drop a response that did not complete."""
+        self._file.close()
+        self.path.unlink(missing_ok=True)
+
+class ChunkJournal:
+    """
+    Append-only journal of the chunks of one (document, mode) that completed successfully.
+
+    Each response is stored once under the hash of its content and the journal records
+    (chunk index, request hash, response hash). A resumed run only redoes the chunks
+    that are missing from the journal or whose request changed, and the output file is
+    only written once every chunk has succeeded.
+    """
+
+    def __init__(self, journal_dir, document_name, mode):
+        self.directory = Path(journal_dir) / document_name / mode
+        self.path = self.directory / JOURNAL_FILE
+        self._entries = {}
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash can leave a truncated last line, ignore it
+                    continue
+                self._entries[entry['chunk']] = entry
+
+    def _response_path(self, response_hash):
+        return self.directory / f'{response_hash}.txt'
+
+    def is_complete(self, chunk_index, request_key):
+        """Return True if the chunk was already answered for exactly this request."""
+        entry = self._entries.get(chunk_index)
+        return (entry is not None and entry['request'] == request_key
+                and self._response_path(entry['response']).exists())
+
+    def open_response(self):
+        """Return a writer that streams a response to disk before it is recorded."""
+        return ResponseWriter(self.directory)
+
+    def record(self, chunk_index, request_key, response):
+        """Persist a chunk response and append it to the journal."""
+        writer = self.open_response()
+        writer.write(response)
+        self.record_written(chunk_index, request_key, writer)
+
+    def record_written(self, chunk_index, request_key, writer):
+        """Move a fully written response into place and append it to the journal."""
+        response_hash = writer.close()
+        os.replace(writer.path, self._response_path(response_hash))
+
+        entry = {'chunk': chunk_index, 'request': request_key, 'response': response_hash}
+        line = (json.dumps(entry) + '\n').encode('utf-8')
+        # A single O_APPEND write keeps lines intact even if several writers share the file
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._entries[chunk_index] = entry
+
+    def missing_chunks(self, request_keys):
+        """Return the indices of the chunks that have no journaled response."""
+        return [idx for idx, key in enumerate(request_keys) if not self.is_complete(idx, key)]
+
+    def read_response(self, chunk_index):
+        """Return the journaled response of a chunk."""
+        with open(self._response_path(self._entries[chunk_index]['response']), 'r', encoding='utf-8') as file:
+            return file.read()
+
+    def _iter_responses(self, count):
+        # One response in memory at a time, however large the output gets
+        for idx in range(count):
+            yield self.read_response(idx) + '\n'
+
+    def commit(self, output_file, request_keys, encoding='utf-8'):
+        """
+        Write the output file from the journaled responses, in chunk order.
+
+        Nothing is written unless every chunk completed. On success the journal is removed.
+
+        Returns:
+          The list of chunk indices that are still missing.
+        """
+        missing = self.missing_chunks(request_keys)
+        if missing:
+            return missing
+        write_file_atomically(output_file, self._iter_responses(len(request_keys)), encoding)
+        self.remove()
+        return []
+
+    def remove(self):
+        """Delete the journal and its stored responses."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        try:
+            self.directory.parent.rmdir()
+        except OSError:
+            pass  # Other modes of the document still have journals
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+import hashlib
+import os
+import re
+import tempfile
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None  # Fall back to a character based estimate
+
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+')
+WORD_BREAK = re.compile(r'\s+')
+CHARS_PER_TOKEN = 4  # Rough average for English text when no tokenizer is available
+FALLBACK_ENCODING = 'cl100k_base'  # Used for models tiktoken does not know (e.g. llama)
+ENCODING_URL = 'https://openaipublic.blob.core.windows.net/encodings/{}.tiktoken'  # Where tiktoken downloads an encoding
+
+_token_counters = {}
+_token_counter_names = {}  # Model -> description of the counter returned for it
+
+def estimate_tokens(text):
+    """Estimate the number of tokens in text from its length."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def is_encoding_cached(encoding_name):
+    """Return True if tiktoken can load an encoding from its local cache, without downloading it."""
+    # The same lookup as tiktoken.load.read_file_cached
+    if 'TIKTOKEN_CACHE_DIR' in os.environ:
+        cache_dir = os.environ['TIKTOKEN_CACHE_DIR']
+    elif 'DATA_GYM_CACHE_DIR' in os.environ:
+        cache_dir = os.environ['DATA_GYM_CACHE_DIR']
+    else:
+        cache_dir = os.path.join(tempfile.gettempdir(), 'data-gym-cache')
+    cache_key = hashlib.sha1(ENCODING_URL.format(encoding_name).encode()).hexdigest()
+    return bool(cache_dir) and os.path.exists(os.path.join(cache_dir, cache_key))
+
+def get_token_counter(model):
+    """
+    Return a function that counts the tokens of a string for the given model.
+
+    The counter is chosen once per model and process. Only an encoding already in the
+    local tiktoken cache is loaded, and tokens are estimated otherwise, so nothing is
+    ever downloaded.
+    """
+    if model in _token_counters:
+        return _token_counters[model]
+
+    counter = estimate_tokens
+    name = f'an estimate of {CHARS_PER_TOKEN} characters per token'
+    if tiktoken is None:
+        name += ' (tiktoken is not installed)'
+    else:
+        try:
+            encoding_name = tiktoken.encoding_name_for_model(model)
+        except KeyError:
+            encoding_name = FALLBACK_ENCODING
+        if not is_encoding_cached(encoding_name):
+            name += f' ({encoding_name} is not in the local tiktoken cache)'
+        else:
+            try:
+                encoding = tiktoken.get_encoding(encoding_name)
+                counter = lambda text: len(encoding.encode(text, disallowed_special=()))
+                name = f'tiktoken {encoding_name}'
+            except Exception as e:
+                # A damaged cache file, for instance
+                print(f'Could not load a tokenizer for model "{model}", estimating tokens instead ({type(e).__name__})')
+
+    _token_counters[model] = counter
+    _token_counter_names[model] = name
+    return counter
+
+def describe_token_counter(model):
+    """Return how get_token_counter counts the tokens of a model."""
+    get_token_counter(model)
+    return _token_counter_names[model]
+
+def iter_paragraphs(text):
+    """Yield the paragraphs of text lazily, without building a list."""
+    start = 0
+    for match in PARAGRAPH_BREAK.finditer(text):
+        paragraph = text[start:match.start()].strip()
+        if paragraph:
+            yield paragraph
+        start = match.end()
+    paragraph = text[start:].strip()
+    if paragraph:
+        yield paragraph
+
+def _split_oversized(text, pattern, joiner, budget, count_tokens):
+    """Split text that does not fit the budget into pieces that do, using pattern as boundary."""
+    pieces = [piece for piece in pattern.split(text) if piece]
+    if len(pieces) <= 1:
+        # No boundary left to respect, cut on characters as a last resort
+        slices, start = [], 0
+        while start < len(text):
+            step = max(1, budget * CHARS_PER_TOKEN)
+            while count_tokens(text[start:start + step]) > budget and step > 1:
+                step //= 2
+            slices.append(text[start:start + step])
+            start += step
+        return slices
+
+    parts = []
+    for piece in pieces:
+        if count_tokens(piece) > budget:
+            parts.extend(_split_oversized(piece, WORD_BREAK, ' ', budget, count_tokens))
+        else:
+            parts.append(piece)
+
+    # Re-pack the small pieces so each part is as close to the budget as possible
+    packed, current, current_tokens = [], [], 0
+    for part in parts:
+        part_tokens = count_tokens(part)
+        if current and current_tokens + part_tokens + 1 > budget:
+            packed.append(joiner.join(current))
+            current, current_tokens = [], 0
+        current.append(part)
+        current_tokens += part_tokens + (1 if len(current) > 1 else 0)
+    if current:
+        packed.append(joiner.join(current))
+    return packed
+
+def pack_chunks(paragraphs, budget, count_tokens, overlap_tokens=0):
+    """Pack whole paragraphs into chunks of at most budget tokens, yielding each chunk as it fills."""
+    current, current_tokens = [], 0
+
+    for paragraph in paragraphs:
+        paragraph_tokens = count_tokens(paragraph)
+        if paragraph_tokens > budget:
+            units = _split_oversized(paragraph, SENTENCE_BREAK, ' ', budget, count_tokens)
+        else:
+            units = [paragraph]
+
+        for unit in units:
+            unit_tokens = paragraph_tokens if len(units) == 1 else count_tokens(unit)
+            if current and current_tokens + unit_tokens + 1 > budget:
+                yield '\n\n'.join(text for text, _ in current)
+
+                # Carry the tail of the previous chunk over as context for the next one
+                carried, carried_tokens = [], 0
+                for text, tokens in reversed(current):
+                    if carried_tokens + tokens > overlap_tokens or carried_tokens + tokens + unit_tokens > budget:
+                        break
+                    carried.insert(0, (text, tokens))
+                    carried_tokens += tokens
+                current, current_tokens = carried, carried_tokens
+
+            current.append((unit, unit_tokens))
+            current_tokens += unit_tokens + (1 if len(current) > 1 else 0)
+
+    if current:
+        yield '\n\n'.join(text for text, _ in current)
+
+def iter_chunks(text, max_tokens, model, fill_ratio=1.0, overlap_tokens=0):
+    """
+    Lazily split text into chunks of whole paragraphs and sentences.
+
+    Args:
+      text: The text to split.
+      max_tokens: The token budget of a single chunk.
+      model: The model whose tokenizer is used to count tokens.
+      fill_ratio: Fraction of max_tokens a chunk may fill.
+      overlap_tokens: Up to this many tokens of trailing text are repeated at the start of the next chunk.
+    """
+    budget = max(1, int(max_tokens * fill_ratio))
+    return pack_chunks(iter_paragraphs(text), budget, get_token_counter(model), overlap_tokens)
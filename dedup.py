@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+import hashlib
+import re
+import threading
+
+WORD = re.compile(r'\w+')
+MAX_HASH = 2 ** 64
+
+def normalize_words(text):
+    """Return the lowercase words of a text, ignoring punctuation and whitespace."""
+    return WORD.findall(text.lower())
+
+def hash_text(text):
+    """Return the SHA-256 of a text, used to look up chunks by content."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def shingle_hashes(words, shingle_words):
+    """Return the 64-bit hashes of every run of shingle_words consecutive words."""
+    if len(words) <= shingle_words:
+        shingles = [' '.join(words)]
+    else:
+        shingles = (' '.join(words[i:i + shingle_words]) for i in range(len(words) - shingle_words + 1))
+    return {int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+            for shingle in shingles}
+
+def minhash_signature(hashes, num_perm):
+    """
+    Return a one-permutation MinHash signature of num_perm values.
+
+    Every shingle hash falls into one of num_perm bins and each bin keeps its smallest
+    value. Empty bins borrow the value of the next non-empty bin, so short texts still
+    get a full signature. This costs one hash per shingle instead of num_perm.
+    """
+    bin_size = MAX_HASH // num_perm
+    signature = [None] * num_perm
+    for value in hashes:
+        index = min(value // bin_size, num_perm - 1)
+        offset = value - index * bin_size
+        if signature[index] is None or offset < signature[index]:
+            signature[index] = offset
+    filled = [i for i, value in enumerate(signature) if value is not None]
+    if not filled:
+        return tuple([0] * num_perm)
+    for i in range(num_perm):
+        if signature[i] is None:
+            # Rotate to the next filled bin, offset so borrowed values differ from the original
+            source = next((j for j in filled if j > i), filled[0])
+            signature[i] = signature[source] + (source - i) % num_perm * bin_size
+    return tuple(signature)
+
+def estimate_similarity(first, second):
+    """Estimate the Jaccard similarity of two texts from their signatures."""
+    return sum(1 for a, b in zip(first, second) if a == b) / len(first)
+
+class DuplicateIndex:
+    """
+    Find exact and near-duplicate chunks with MinHash and locality-sensitive hashing.
+
+    The first chunk of a group becomes its representative. A later chunk is a duplicate
+    when its normalized words are identical to a representative's, or when its estimated
+    Jaccard similarity to one of the representatives sharing an LSH band with it reaches
+    threshold.
+    """
+
+    def __init__(self, threshold=0.9, num_perm=128, bands=32, shingle_words=5):
+        self.threshold = float(threshold)
+        self.num_perm = int(num_perm)
+        self.bands = max(1, min(int(bands), self.num_perm))
+        self.rows = self.num_perm // self.bands
+        self.shingle_words = max(1, int(shingle_words))
+        self.exact = {}  # Hash of normalized words -> representative id
+        self.buckets = [{} for _ in range(self.bands)]  # Band values -> representative ids
+        self.signatures = {}  # Representative id -> signature
+        self.duplicates = {}  # Duplicate id -> (representative id, similarity)
+        self.chunks = 0
+        self.exact_matches = 0
+
+    def add(self, chunk_id, text):
+        """Index a chunk and return (representative id, similarity), or None if it is new."""
+        self.chunks += 1
+        words = normalize_words(text)
+        exact_key = hash_text(' '.join(words))
+        if exact_key in self.exact:
+            self.exact_matches += 1
+            return self._add_duplicate(chunk_id, self.exact[exact_key], 1.0)
+
+        signature = minhash_signature(shingle_hashes(words, self.shingle_words), self.num_perm)
+        bands = [signature[band * self.rows:(band + 1) * self.rows] for band in range(self.bands)]
+        candidates = {candidate for band, values in enumerate(bands) for candidate in self.buckets[band].get(values, ())}
+        best = max(((estimate_similarity(signature, self.signatures[candidate]), candidate) for candidate in candidates),
+                   default=(0.0, None))
+        if best[1] is not None and best[0] >= self.threshold:
+            return self._add_duplicate(chunk_id, best[1], best[0])
+
+        self.exact[exact_key] = chunk_id
+        self.signatures[chunk_id] = signature
+        for band, values in enumerate(bands):
+            self.buckets[band].setdefault(values, []).append(chunk_id)
+        return None
+
+    def _add_duplicate(self, chunk_id, representative, similarity):
+        self.duplicates[chunk_id] = (representative, similarity)
+        return representative, similarity
+
+    def representatives(self):
+        """Return the representative id of every duplicate."""
+        return {chunk_id: representative for chunk_id, (representative, _) in self.duplicates.items()}
+
+    def report(self):
+        """Return the duplicate groups and how many chunks each kind of match removed."""
+        groups = {}
+        for chunk_id, (representative, similarity) in sorted(self.duplicates.items(), key=str):
+            groups.setdefault(representative, []).append({'chunk': list(chunk_id), 'similarity': round(similarity, 3)})
+        return {
+            'chunks': self.chunks,
+            'unique_chunks': self.chunks - len(self.duplicates),
+            'exact_duplicates': self.exact_matches,
+            'near_duplicates': len(self.duplicates) - self.exact_matches,
+            'threshold': self.threshold,
+            'groups': [{'representative': list(representative), 'duplicates': duplicates}
+                       for representative, duplicates in sorted(groups.items(), key=str)],
+        }
+
+class SharedResponses:
+    """
+    Hand the response of a representative chunk to its duplicates during a run, instead of a call.
+
+    Chunks are known by their ids only, and a response is kept for every (representative,
+    mode) pair that has duplicates. responses may be a dict shared by worker processes,
+    such as a multiprocessing manager dict. A duplicate whose representative is still in
+    flight waits on the event registered with start; otherwise, if the representative
+    has no response yet, the duplicate is sent itself.
+    """
+
+    def __init__(self, representatives, responses=None):
+        self.representatives = representatives  # Duplicate id -> representative id
+        self.groups = set(representatives.values())  # Ids of the representatives with duplicates
+        self.responses = {} if responses is None else responses  # (representative id, mode) -> response
+        self.waiters = {}  # (representative id, mode) -> event set when its request finishes
+        self.saved = 0  # Calls avoided by handing a response to a duplicate
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Worker processes only share the responses, requests in flight are local to a process
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['waiters'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def has_duplicates(self, chunk_id):
+        """Return True if other chunks of the run wait for the responses of this one."""
+        return chunk_id in self.groups
+
+    def start(self, chunk_id, mode, waiter):
+        """Register the event (threading or asyncio) set once the request of a representative finishes."""
+        if chunk_id in self.groups:
+            with self._lock:
+                self.waiters[(chunk_id, mode)] = waiter
+
+    def finish(self, chunk_id, mode, response=None):
+        """Store the response of a representative, or None if its request failed, and wake its duplicates."""
+        if chunk_id not in self.groups:
+            return
+        with self._lock:
+            if response is not None:
+                self.responses[(chunk_id, mode)] = response
+            waiter = self.waiters.pop((chunk_id, mode), None)
+        if waiter is not None:
+            waiter.set()
+
+    def lookup(self, chunk_id, mode):
+        """Return (response, event) of a duplicate's representative, the event if it is still in flight."""
+        representative = self.representatives.get(chunk_id)
+        if representative is None:
+            return None, None
+        with self._lock:
+            return self.responses.get((representative, mode)), self.waiters.get((representative, mode))
+
+    def reused(self, count=1):
+        """Count calls avoided by handing a response to a duplicate."""
+        with self._lock:
+            self.saved += count
+
+    def drain_saved(self):
+        """Return the calls avoided since the last drain and reset the count, to merge it into another process."""
+        with self._lock:
+            saved, self.saved = self.saved, 0
+        return saved
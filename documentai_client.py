@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+import base64
+import datetime
+import json
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rate_limiter import RETRYABLE_STATUS_CODES, parse_duration
+
+SCOPES = ['https://www.googleapis.com/auth/cloud-platform']
+TOKEN_REFRESH_MARGIN = 300  # Seconds before its expiry a cached access token is refreshed
+
+class DocumentAIError(Exception):
+    """A Document AI request that failed for good, with the HTTP status and body of the last attempt."""
+
+    def __init__(self, message, status_code=None, body=''):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+
+class TokenCache:
+    """
+    Hand out the OAuth access token of a set of Google credentials.
+
+    The token is only refreshed when it is missing or about to expire, instead of
+    before every request, so a run costs one OAuth round trip per hour, not per page.
+    """
+
+    def __init__(self, credentials, refresh_margin=TOKEN_REFRESH_MARGIN):
+        self.credentials = credentials
+        self.refresh_margin = datetime.timedelta(seconds=refresh_margin)
+        self.refreshes = 0
+        self._lock = threading.Lock()
+
+    def _expires_soon(self):
+        expiry = self.credentials.expiry
+        if expiry is None:
+            return False
+        # google-auth stores the expiry as a naive UTC datetime
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return expiry - now < self.refresh_margin
+
+    def token(self):
+        """Return a valid access token, refreshing it first if needed."""
+        with self._lock:
+            if not self.credentials.token or self._expires_soon():
+                from google.auth.transport.requests import Request
+                self.credentials.refresh(Request())
+                self.refreshes += 1
+            return self.credentials.token
+
+    def invalidate(self):
+        """Force a refresh on the next call, after the server rejected the token."""
+        with self._lock:
+            self.credentials.token = None
+
+class StaticToken:
+    """A fixed bearer token, for stand-in servers and tokens obtained elsewhere."""
+
+    def __init__(self, token):
+        self.value = token
+        self.refreshes = 0
+
+    def token(self):
+        return self.value
+
+    def invalidate(self):
+        pass
+
+def load_service_account(path):
+    """Return a TokenCache for the service account key file at path."""
+    from google.oauth2 import service_account
+    return TokenCache(service_account.Credentials.from_service_account_file(path, scopes=SCOPES))
+
+class DocumentAIClient:
+    """
+    Send documents to a Document AI processor.
+
+    Requests share a keep-alive connection pool sized for max_connections concurrent
+    pages, so TLS is negotiated once per connection rather than once per page. Throttled
+    requests (429), timeouts, connection errors and 5xx errors are retried up to
+    max_retries times with jittered exponential backoff, honouring retry-after. The
+    endpoint and the token source can point at a local stand-in server.
+    """
+
+    def __init__(self, endpoint, token_source=None, max_connections=8, max_retries=5, timeout=300.0,
+                 base_delay=1.0, max_delay=60.0):
+        self.endpoint = endpoint
+        self.token_source = token_source
+        self.max_retries = int(max_retries)
+        self.timeout = float(timeout)
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=int(max_connections), max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _headers(self):
+        headers = {'Content-Type': 'application/json'}
+        if self.token_source is not None:
+            headers['Authorization'] = f'Bearer {self.token_source.token()}'
+        return headers
+
+    def backoff_delay(self, attempt, headers):
+        """Return the jittered exponential backoff for a retry, honouring retry-after."""
+        retry_after = parse_duration(headers.get('retry-after'))
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.base_delay)
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def process(self, content, mime_type='application/pdf'):
+        """Process the bytes of a document and return the decoded response."""
+        payload = json.dumps({
+            'inlineDocument': {
+                'content': base64.b64encode(content).decode('ascii'),
+                'mimeType': mime_type
+            }
+        })
+        token_retried = False
+        attempt = 0
+        while True:
+            self._count('requests')
+            try:
+                response = self.session.post(self.endpoint, headers=self._headers(), data=payload, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error, headers = DocumentAIError(f'{type(e).__name__}: {e}'), {}
+            else:
+                if response.status_code == 200:
+                    return response.json()
+                error = DocumentAIError(f'HTTP {response.status_code}', response.status_code, response.text)
+                headers = response.headers
+                if response.status_code == 401 and self.token_source is not None and not token_retried:
+                    # The token may have been revoked or expired early, retry once with a fresh one
+                    token_retried = True
+                    self.token_source.invalidate()
+                    continue
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    self._count('errors')
+                    raise error
+            if attempt >= self.max_retries:
+                self._count('errors')
+                raise error
+            self._count('retries')
+            time.sleep(self.backoff_delay(attempt, headers))
+            attempt += 1
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'retries': self.retries,
+            'errors': self.errors,
+            'token_refreshes': getattr(self.token_source, 'refreshes', 0),
+        }
+
+    def close(self):
+        """Close the pooled connections."""
+        self.session.close()
@@ -1,217 +1,163 @@
 #!/usr/bin/env python3
 import os
-import requests
-import json
-import base64
 import PyPDF2
 import io
 import re
 import argparse
-from google.auth.transport.requests import Request
-from google.oauth2 import service_account
-from google.cloud import texttospeech
-from pydub import AudioSegment
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from audio_concat import concatenate_audio
+from documentai_client import DocumentAIClient, DocumentAIError, StaticToken, load_service_account
+from ocr_text import TextExtractor
+from response_store import ResponseStore
+from stage_pipeline import Pipeline, Stage
+from tts_engine import TTS_WORKERS, GoogleSynthesizer, SpeechEngine
 
 # Constants
 DOCUMENT_AI_API_URL = "https://us-documentai.googleapis.com/v1/projects/30256189746/locations/us/processors/b4a7fb495ba75820:process"
 SERVICE_ACCOUNT_FILE = "./key.json"  # Path to your service account JSON key file
 PDF_FOLDER = "."  # Replace with your local PDF folder path
-TEMP_PDF_FOLDER = "./pdf"  # Folder to save temporary one-page PDFs
 RESPONSES_FOLDER = "./responses"  # Folder to save API responses
 TEXTS_FOLDER = "./texts"  # Folder to save extracted text files
 AUDIO_FOLDER = "./audio"  # Folder to save audio files
 COMBINED_TEXT_FILE = "./combined.txt"  # Path to the combined text file
 COMBINED_AUDIO_FILE = "./audio/combined_audio.mp3"  # Path to the combined audio file
 COMBINED_PDF_FILE = "./combined.pdf"  # Path to the combined PDF file
-
-# Initialize credentials using service account
-SCOPES = ['https://www.googleapis.com/auth/cloud-platform']
-credentials = service_account.Credentials.from_service_account_file(
-    SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-
-def get_access_token():
-    """Get OAuth 2.0 access token."""
-    credentials.refresh(Request())
-    return credentials.token
-
-def split_pdf_into_one_pagers(pdf_path):
-    """Split a multi-page PDF into one-page PDFs and return the paths."""
-    pdf_reader = PyPDF2.PdfReader(pdf_path)
-    total_pages = len(pdf_reader.pages)
-    one_pager_paths = []
-
-    for page_number in range(total_pages):
-        pdf_writer = PyPDF2.PdfWriter()
+MAX_CONCURRENT_PAGES = 4  # Requests sent to Document AI at the same time
+MAX_PAGES_PER_REQUEST = 15  # Pages Document AI accepts in one inline request
+MAX_REQUEST_BYTES = 20 * 1024 * 1024  # Size of an inline document Document AI accepts
+SPLIT_WORKERS = 2  # PDFs split at the same time
+EXTRACT_WORKERS = 2  # Pages whose text is extracted at the same time
+
+# Items passed between the stages of the OCR pipeline; a response of None means it was saved by an earlier run
+PageRange = namedtuple('PageRange', ['pdf_file', 'first_page', 'page_count', 'content'])
+PageResponse = namedtuple('PageResponse', ['pdf_file', 'page_index', 'response'])
+PageText = namedtuple('PageText', ['pdf_file', 'page_index', 'response', 'text'])
+
+_token_cache = None  # Access token of the service account, loaded on first use
+
+def get_token_cache(credentials_file=SERVICE_ACCOUNT_FILE):
+    """Return the token cache of the service account, loading the key file on first use."""
+    global _token_cache
+    if _token_cache is None:
+        _token_cache = load_service_account(credentials_file)
+    return _token_cache
+
+def create_client(endpoint=DOCUMENT_AI_API_URL, credentials_file=SERVICE_ACCOUNT_FILE, token=None,
+                  concurrency=MAX_CONCURRENT_PAGES, max_retries=5):
+    """Create the Document AI client, authenticated with a fixed token or a service account key file."""
+    if token:
+        token_source = StaticToken(token)
+    elif credentials_file:
+        token_source = get_token_cache(credentials_file)
+    else:
+        token_source = None  # A local stand-in server that needs no authentication
+    return DocumentAIClient(endpoint, token_source, max_connections=concurrency, max_retries=max_retries)
+
+def group_page_ranges(page_indices, pages_per_request):
+    """Group sorted page indices into (first page, page count) runs of consecutive pages."""
+    ranges = []
+    for page_index in page_indices:
+        if ranges and ranges[-1][0] + ranges[-1][1] == page_index and ranges[-1][1] < pages_per_request:
+            ranges[-1][1] += 1
+        else:
+            ranges.append([page_index, 1])
+    return [tuple(page_range) for page_range in ranges]
+
+def write_pdf_range(pdf_reader, first_page, page_count):
+    """Return the bytes of a PDF holding page_count pages of pdf_reader, starting at first_page."""
+    pdf_writer = PyPDF2.PdfWriter()
+    for page_number in range(first_page, first_page + page_count):
         pdf_writer.add_page(pdf_reader.pages[page_number])
-
-        output_pdf_path = os.path.join(TEMP_PDF_FOLDER, f"{os.path.basename(pdf_path).replace('.pdf', '')}_page_{page_number + 1}.pdf")
-        with open(output_pdf_path, 'wb') as output_pdf:
-            pdf_writer.write(output_pdf)
-        
-        one_pager_paths.append(output_pdf_path)
-    
-    return one_pager_paths
-
-def send_pdf_to_api(pdf_path):
-    """Send a single PDF to the Document AI API."""
-    with open(pdf_path, 'rb') as f:
-        file_content = f.read()
-
-    # Base64 encode the PDF content as required by Document AI API
-    encoded_content = base64.b64encode(file_content).decode('utf-8')
-
-    headers = {
-        'Authorization': f'Bearer {get_access_token()}',
-        'Content-Type': 'application/json',
-    }
-
-    # Update the request body to use 'inlineDocument'
-    body = {
-        'inlineDocument': {
-            'content': encoded_content,
-            'mimeType': 'application/pdf'
+    buffer = io.BytesIO()
+    pdf_writer.write(buffer)
+    return buffer.getvalue()
+
+def split_pdf_into_ranges(pdf_reader, page_indices, pages_per_request=MAX_PAGES_PER_REQUEST,
+                          max_bytes=MAX_REQUEST_BYTES):
+    """Yield (first page, page count, PDF bytes) for in-memory PDFs of up to pages_per_request of the given pages."""
+    pending = group_page_ranges(page_indices, max(1, min(pages_per_request, MAX_PAGES_PER_REQUEST)))
+    while pending:
+        first_page, page_count = pending.pop(0)
+        content = write_pdf_range(pdf_reader, first_page, page_count)
+        if len(content) > max_bytes and page_count > 1:
+            # Too large for an inline request, send each half on its own
+            half = page_count // 2
+            pending[:0] = [(first_page, half), (first_page + half, page_count - half)]
+            continue
+        yield first_page, page_count, content
+
+def iter_text_segments(node):
+    """Yield every text segment of every text anchor found under a response node."""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == 'textAnchor':
+                yield from value.get('textSegments', [])
+            else:
+                yield from iter_text_segments(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from iter_text_segments(item)
+
+def split_response_into_pages(response):
+    """
+    Split the response of a multi-page request into one response per page.
+
+    Each page gets the slice of the document text its anchors point into, with its
+    anchors shifted to match, so the result is the same as if the page had been sent
+    on its own. The pages of response are modified in place.
+    """
+    document = response.get('document', {})
+    document_text = document.get('text', '')
+    page_responses = []
+    for page in document.get('pages', []):
+        segments = list(iter_text_segments(page))
+        start = min((int(segment.get('startIndex', 0)) for segment in segments), default=0)
+        end = max((int(segment.get('endIndex', len(document_text))) for segment in segments), default=0)
+        for segment in segments:
+            segment['startIndex'] = str(int(segment.get('startIndex', 0)) - start)
+            segment['endIndex'] = str(int(segment.get('endIndex', len(document_text))) - start)
+        page['pageNumber'] = 1
+        page_response = {key: value for key, value in response.items() if key != 'document'}
+        page_response['document'] = {
+            'mimeType': document.get('mimeType', 'application/pdf'),
+            'text': document_text[start:end],
+            'pages': [page]
         }
-    }
-
-    response = requests.post(DOCUMENT_AI_API_URL, headers=headers, json=body)
-
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(f"Error: {response.status_code} for file {pdf_path}")
-        print(f"Response: {response.text}")
+        page_responses.append(page_response)
+    return page_responses
+
+def send_pdf_to_api(pdf_content, client, description):
+    """Send the bytes of a PDF to the Document AI API, retrying throttled and failed requests."""
+    try:
+        return client.process(pdf_content)
+    except DocumentAIError as e:
+        print(f"Error: {e} for {description}")
+        if e.body:
+            print(f"Response: {e.body}")
         return None
     
-def text_to_speech(text, language_code, output_audio_path):
+@lru_cache(maxsize=None)
+def get_speech_engine(workers=TTS_WORKERS):
+    """Return the speech engine of the run, with one Google Text-to-Speech client for all pages."""
+    return SpeechEngine(GoogleSynthesizer(get_token_cache().credentials), workers)
+
+def text_to_speech(text, language_code, output_audio_path, engine=None):
     """Convert text to speech using Google Text-to-Speech API and save to an audio file."""
-    client = texttospeech.TextToSpeechClient(credentials=credentials)
-    
-    # Define the byte limit for the text
-    byte_limit = 5000
-    
-    # Split the text into chunks that fit within the byte limit
-    def chunk_text(text, byte_limit):
-        chunks = []
-        current_chunk = ""
-        for sentence in text.split('.'):
-            sentence = sentence.strip() + ". "
-            if len(current_chunk.encode('utf-8')) + len(sentence.encode('utf-8')) > byte_limit:
-                chunks.append(current_chunk.strip())
-                current_chunk = sentence
-            else:
-                current_chunk += sentence
-        if current_chunk:
-            chunks.append(current_chunk.strip())  # Add the last chunk
-        return chunks
-    
-    text_chunks = chunk_text(text, byte_limit)
-    
-    # Process each chunk separately and combine the audio
-    combined_audio = AudioSegment.empty()
-    for i, chunk in enumerate(text_chunks):
-        input_text = texttospeech.SynthesisInput(text=chunk)
-        voice = texttospeech.VoiceSelectionParams(
-            language_code=language_code,
-            ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL,
-        )
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3
-        )
-
-        response = client.synthesize_speech(input=input_text, voice=voice, audio_config=audio_config)
-
-        # Load the audio content into an AudioSegment
-        audio_segment = AudioSegment.from_file(io.BytesIO(response.audio_content), format='mp3')
-
-        combined_audio += audio_segment
-
-    # Export the combined audio to output_audio_path
-    combined_audio.export(output_audio_path, format='mp3')
+    engine = engine or get_speech_engine()
+    engine.synthesize_to_file(text, language_code, output_audio_path)
     print(f"Audio content written to {output_audio_path}")
 
-def extract_language_from_page(page):
-    """Extract the detected language from a page."""
-    language_code = "en-US"  # Default language code
-
-    detected_languages = page.get('detectedLanguages', [])
-    if detected_languages:
-        language_code = detected_languages[0].get('languageCode', 'en-US')
-    return language_code
-
-def extract_text_from_layout(layout, document_text):
-    """Extract text from layout using textAnchor positions."""
-    extracted_text = ""
-    
-    if 'textAnchor' in layout:
-        for segment in layout['textAnchor']['textSegments']:
-            start_index = int(segment.get('startIndex', 0))
-            end_index = int(segment.get('endIndex', len(document_text)))
-            extracted_text += document_text[start_index:end_index]
-    else:
-        print("No textAnchor found in layout.")
-    
-    return extracted_text
-
-def clean_paragraph_text(text):
-    """Remove line breaks inside paragraphs, recombine hyphenated words, and clean up the text."""
-    # Remove line breaks inside paragraphs
-    text = text.replace("\n", " ").strip()
-    # Recombine words split with hyphens due to line breaks
-    text = re.sub(r'(\w)-\s*(\w)', r'\1\2', text)
-    return text
-
-def remove_header_footer(text, header_pattern, footer_pattern):
-    """Remove header and footer from the text based on regex patterns."""
-    lines = text.splitlines()
-    cleaned_lines = []
-    for line in lines:
-        if header_pattern and re.search(header_pattern, line):
-            continue
-        if footer_pattern and re.search(footer_pattern, line):
-            continue
-        cleaned_lines.append(line)
-    return '\n'.join(cleaned_lines)
-
-def format_page_text(page, document_text, header, footer):
-    """Format document text by processing paragraphs without duplication."""
-    formatted_text = ""
-
-    # Process paragraphs only to avoid duplication
-    for paragraph in page.get('paragraphs', []):
-        paragraph_text = extract_text_from_layout(paragraph['layout'], document_text)
-        if paragraph_text:
-            paragraph_text = clean_paragraph_text(paragraph_text)
-            # Remove header and footer from the paragraph text
-            paragraph_text = remove_header_footer(paragraph_text, header, footer)
-            if paragraph_text:
-                formatted_text += paragraph_text + "\n"  # Single line break between paragraphs
-
-    return formatted_text.strip()
+@lru_cache(maxsize=None)
+def get_text_extractor(header, footer):
+    """Return the text extractor of a header and footer pattern, compiled once per run."""
+    return TextExtractor(header, footer)
 
 def extract_text_from_response(response, header, footer):
     """Extracts text and language code from the Document AI response."""
-    document = response.get('document', {})
-    document_text = document.get('text', '')
-
-    if not document_text:
-        print("No 'text' field found in the 'document' JSON response.")
-        return '', 'en-US'
-
-    extracted_text = ''
-    language_code = 'en-US'  # Default language code
-
-    # Process each page
-    for page in document.get('pages', []):
-        page_text = format_page_text(page, document_text, header, footer)
-        if page_text:
-            extracted_text += page_text + "\n\n"
-
-        # Extract language code from the page
-        page_language_code = extract_language_from_page(page)
-        if page_language_code:
-            language_code = page_language_code  # Use the detected language code
-
-    return extracted_text.strip(), language_code
+    return get_text_extractor(header, footer).extract(response)
 
 # Function to extract page number from filename
 def extract_page_number(filename):
@@ -268,76 +214,128 @@ def combine_audio_files(audio_folder, output_audio_file):
     # Sort files based on the extracted page numbers
     audio_files.sort(key=extract_page_number)
     
-    # Combine audio files in order
-    combined = AudioSegment.empty()
-    for audio_file in audio_files:
-        audio_path = os.path.join(audio_folder, audio_file)
-        audio = AudioSegment.from_file(audio_path)
-        combined += audio
-    combined.export(output_audio_file, format='mp3')
-    print(f"Combined audio file saved to {output_audio_file}")
-
-def process_pdfs_in_folder(folder_path, header, footer):
-    """Process all PDFs in the folder, splitting them into one-pagers, extracting text, and generating audio."""
+    # Combine audio files in order, streaming their frames into the output file
+    audio_paths = [os.path.join(audio_folder, f) for f in audio_files]
+    audio_paths = [path for path in audio_paths if os.path.abspath(path) != os.path.abspath(output_audio_file)]
+    mode = concatenate_audio(audio_paths, output_audio_file)
+    print(f"Combined audio file saved to {output_audio_file} ({mode})")
+
+def get_document_name(pdf_file):
+    """Return the name responses and texts of a PDF are saved under."""
+    return os.path.splitext(pdf_file)[0]
+
+def load_page_response(pdf_file, page_number, store):
+    """Load the response of a page saved by an earlier run, or return None if there is none."""
+    response = store.get(get_document_name(pdf_file), page_number)
+    if response is not None:
+        print(f"Response for page {page_number} of {pdf_file} already exists. Loading response from {store.folder}.")
+    return response
+
+def ocr_page_range(pdf_file, page_range, client):
+    """OCR a range of pages in one request and return the response of each page, by page index."""
+    first_page, page_count, content = page_range
+    pages = f"pages {first_page + 1}-{first_page + page_count}" if page_count > 1 else f"page {first_page + 1}"
+    description = f"{pages} of {pdf_file}"
+    print(f"Sending API request for {description}...")
+    result = send_pdf_to_api(content, client, description)
+    if not result:
+        print(f"Failed to get response for {description}")
+        return {}
+
+    page_responses = split_response_into_pages(result)
+    if len(page_responses) != page_count:
+        print(f"Expected {page_count} pages in the response for {description}, got {len(page_responses)}")
+        return {}
+    return dict(enumerate(page_responses, start=first_page))
+
+def split_stage(pdf_file, folder_path, pages_per_request, store):
+    """Yield the pages of a PDF whose response was saved by an earlier run, then in-memory PDFs of the others."""
+    print(f"Processing {pdf_file}...")
+    pdf_reader = PyPDF2.PdfReader(os.path.join(folder_path, pdf_file))
+    missing_pages = []
+    for idx in range(len(pdf_reader.pages)):
+        if store.contains(get_document_name(pdf_file), idx + 1):
+            yield PageRange(pdf_file, idx, 1, None)
+        else:
+            missing_pages.append(idx)
+    # Only pages without a saved response are sent, split into in-memory PDFs of consecutive pages
+    for first_page, page_count, content in split_pdf_into_ranges(pdf_reader, missing_pages, pages_per_request):
+        yield PageRange(pdf_file, first_page, page_count, content)
+
+def ocr_stage(page_range, client):
+    """Yield the response of every page of a page range, sending the range to Document AI unless it was saved."""
+    if page_range.content is None:
+        yield PageResponse(page_range.pdf_file, page_range.first_page, None)
+        return
+    range_responses = ocr_page_range(page_range.pdf_file, page_range[1:], client)
+    for idx, response in sorted(range_responses.items()):
+        yield PageResponse(page_range.pdf_file, idx, response)
+
+def extract_stage(page, header, footer, store):
+    """Yield the text of a page, extracted from its response."""
+    result = page.response if page.response is not None else load_page_response(page.pdf_file, page.page_index + 1, store)
+    if not result:
+        return
+    # Extract text and language code from the response
+    text, language_code = extract_text_from_response(result, header, footer)
+    yield PageText(page.pdf_file, page.page_index, page.response, text)
+
+def persist_stage(page, store):
+    """Save the response of a page if it is new, and its text."""
+    document_name = get_document_name(page.pdf_file)
+    page_name = f"{document_name}_page_{page.page_index + 1}"
+    if page.response is not None:
+        # Append the response to the pack of the PDF
+        pack_path = store.put(document_name, page.page_index + 1, page.response)
+        print(f"Response for page {page.page_index + 1} saved to {pack_path}")
+
+    # Save the text to a per-page text file
+    page_text_file = os.path.join(TEXTS_FOLDER, f"{page_name}.txt")
+    with open(page_text_file, 'w') as page_file:
+        page_file.write(page.text)
+    print(f"Extracted text for page {page.page_index + 1} saved to {page_text_file}")
+
+    # Determine the per-page audio file path
+    audio_output_path = os.path.join(AUDIO_FOLDER, f"{page_name}.mp3")
+    # Check if the audio file already exists
+    if os.path.exists(audio_output_path):
+        print(f"Audio file {audio_output_path} already exists. Skipping TTS API call.")
+    # else:
+        # Generate audio per page
+        # text_to_speech(page.text, language_code, audio_output_path)
+
+def process_pdfs_in_folder(folder_path, header, footer, client, concurrency=MAX_CONCURRENT_PAGES,
+                           pages_per_request=MAX_PAGES_PER_REQUEST, split_workers=SPLIT_WORKERS,
+                           extract_workers=EXTRACT_WORKERS, queue_size=None, prune=False):
+    """
+    Process all PDFs in the folder, sending them a range of pages at a time, extracting text, and generating audio.
+
+    Splitting, OCR, extraction and writing run as a pipeline of stages with their own
+    workers, connected by bounded queues, so PDFs are split while earlier pages wait on
+    the network and several PDFs are in progress at once. Responses are saved in one
+    compressed pack per PDF, pruned to the fields text extraction reads if prune is set.
+    """
     pdf_files = sorted([f for f in os.listdir(folder_path) if f.endswith('.pdf')])
 
     if not os.path.exists(AUDIO_FOLDER):
         os.makedirs(AUDIO_FOLDER)
 
-    if not os.path.exists(TEMP_PDF_FOLDER):
-        os.makedirs(TEMP_PDF_FOLDER)
-
     if not os.path.exists(RESPONSES_FOLDER):
         os.makedirs(RESPONSES_FOLDER)
 
     if not os.path.exists(TEXTS_FOLDER):
         os.makedirs(TEXTS_FOLDER)
 
-    for pdf_file in pdf_files:
-        pdf_path = os.path.join(folder_path, pdf_file)
-        print(f"Processing {pdf_file}...")
-
-        # Split into one-pagers
-        one_pager_paths = split_pdf_into_one_pagers(pdf_path)
-
-        # Prepare the overall text file for this PDF
-        text_output_file = os.path.join(TEXTS_FOLDER, os.path.splitext(pdf_file)[0] + '.txt')
-        for idx, one_pager_path in enumerate(one_pager_paths):
-            # Determine the response file path for this page
-            response_file_path = os.path.join(RESPONSES_FOLDER, f"{os.path.splitext(pdf_file)[0]}_page_{idx + 1}.json")
-            
-            if os.path.exists(response_file_path):
-                print(f"Response file {response_file_path} already exists. Loading response from file.")
-                with open(response_file_path, 'r') as json_file:
-                    result = json.load(json_file)
-            else:
-                print(f"Sending API request for {one_pager_path}...")
-                result = send_pdf_to_api(one_pager_path)
-                if result:
-                    # Save the response to the response file
-                    with open(response_file_path, 'w') as json_file:
-                        json.dump(result, json_file, indent=2)
-                    print(f"Response saved to {response_file_path}")
-                else:
-                    print(f"Failed to get response for {one_pager_path}")
-                    continue  # Skip to next page if failed
-            # Extract text and language code from the response
-            text, language_code = extract_text_from_response(result, header, footer)
-            # Save the text to a per-page text file
-            page_text_file = os.path.join(TEXTS_FOLDER, f"{os.path.splitext(pdf_file)[0]}_page_{idx + 1}.txt")
-            with open(page_text_file, 'w') as page_file:
-                page_file.write(text)
-            print(f"Extracted text for page {idx + 1} saved to {page_text_file}")
-
-            # Determine the per-page audio file path
-            audio_output_path = os.path.join(AUDIO_FOLDER, f"{os.path.splitext(pdf_file)[0]}_page_{idx + 1}.mp3")
-            # Check if the audio file already exists
-            if os.path.exists(audio_output_path):
-                print(f"Audio file {audio_output_path} already exists. Skipping TTS API call.")
-            # else:
-                # Generate audio per page
-                # text_to_speech(text, language_code, audio_output_path)
-        print(f"Extracted text for {pdf_file} saved to {text_output_file}")
+    store = ResponseStore(RESPONSES_FOLDER, prune)
+    pipeline = Pipeline([
+        Stage('split', partial(split_stage, folder_path=folder_path, pages_per_request=pages_per_request, store=store),
+              split_workers, queue_size),
+        Stage('ocr', partial(ocr_stage, client=client), concurrency, queue_size),
+        Stage('extract', partial(extract_stage, header=header, footer=footer, store=store), extract_workers, queue_size),
+        Stage('persist', partial(persist_stage, store=store), 1, queue_size),
+    ])
+    pipeline.run(pdf_files)
+    print(pipeline.format_report())
 
     # Optionally combine all text files into one combined text file
     combine_all_text_files(TEXTS_FOLDER, COMBINED_TEXT_FILE)
@@ -346,14 +344,78 @@ def process_pdfs_in_folder(folder_path, header, footer):
     # audio_files = [os.path.join(AUDIO_FOLDER, f) for f in sorted(os.listdir(AUDIO_FOLDER)) if f.endswith('.mp3')]
     # combine_audio_files(AUDIO_FOLDER, COMBINED_AUDIO_FILE)
 
+def reextract_document(document_name, header, footer):
+    """Extract the text of every saved page response of a PDF into its text file and return the number of pages."""
+    store = ResponseStore(RESPONSES_FOLDER)
+    extractor = get_text_extractor(header, footer)
+    page_numbers = store.pages(document_name)
+    for page_number in page_numbers:
+        text, language_code = extractor.extract(store.get(document_name, page_number))
+        with open(os.path.join(TEXTS_FOLDER, f"{document_name}_page_{page_number}.txt"), 'w') as page_file:
+            page_file.write(text)
+    return len(page_numbers)
+
+def reextract_texts(header, footer, workers=None):
+    """
+    Extract the text of every response saved in RESPONSES_FOLDER again, without reading any PDF.
+
+    Extraction is CPU bound, so the PDFs are spread over worker processes; this is
+    what makes trying new header and footer patterns on an OCRed corpus cheap.
+    """
+    document_names = ResponseStore(RESPONSES_FOLDER).names()
+    if not os.path.exists(TEXTS_FOLDER):
+        os.makedirs(TEXTS_FOLDER)
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        extract = partial(reextract_document, header=header, footer=footer)
+        pages = sum(executor.map(extract, document_names))
+    print(f"Extracted the text of {pages} saved responses in {time.perf_counter() - started:.1f}s")
+
+    combine_all_text_files(TEXTS_FOLDER, COMBINED_TEXT_FILE)
+
+def migrate_responses(prune=False):
+    """Move the page responses saved as JSON files by earlier versions into the packs."""
+    if not os.path.isdir(RESPONSES_FOLDER):
+        print(f"No {RESPONSES_FOLDER} folder to migrate")
+        return
+    moved, json_bytes, pack_bytes = ResponseStore(RESPONSES_FOLDER, prune).migrate()
+    print(f"Moved {moved} response files ({json_bytes / 1024 / 1024:.1f} MB) into packs of "
+          f"{pack_bytes / 1024 / 1024:.1f} MB in {RESPONSES_FOLDER}")
+
 def main():
     parser = argparse.ArgumentParser(description='Process PDFs and remove headers and footers.')
     parser.add_argument('--header', type=str, default='', help='Header text or regex pattern to remove')
     parser.add_argument('--footer', type=str, default='', help='Footer text or regex pattern to remove')
+    parser.add_argument('--endpoint', type=str, default=DOCUMENT_AI_API_URL, help='Document AI process URL (e.g. a local stand-in server)')
+    parser.add_argument('--credentials', type=str, default=SERVICE_ACCOUNT_FILE, help='Service account key file, empty to send no credentials')
+    parser.add_argument('--token', type=str, default=None, help='Bearer token to send instead of the service account')
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENT_PAGES, help='Requests sent to Document AI at the same time')
+    parser.add_argument('--pages-per-request', type=int, default=MAX_PAGES_PER_REQUEST, help=f'Pages sent in one request (at most {MAX_PAGES_PER_REQUEST})')
+    parser.add_argument('--split-workers', type=int, default=SPLIT_WORKERS, help='PDFs split at the same time')
+    parser.add_argument('--extract-workers', type=int, default=EXTRACT_WORKERS, help='Pages whose text is extracted at the same time')
+    parser.add_argument('--queue-size', type=int, default=None, help='Items waiting between two stages (default: twice the workers of the next stage)')
+    parser.add_argument('--max-retries', type=int, default=5, help='Retries of a throttled or failed page')
+    parser.add_argument('--reextract', action='store_true', help=f'Only extract the text of the responses saved in {RESPONSES_FOLDER} again')
+    parser.add_argument('--workers', type=int, default=None, help='Processes extracting text with --reextract (default: one per CPU)')
+    parser.add_argument('--prune', action='store_true', help='Only save the fields of responses that text extraction reads')
+    parser.add_argument('--migrate', action='store_true', help=f'Move the _page_N.json responses in {RESPONSES_FOLDER} into packs and exit')
     args = parser.parse_args()
 
+    if args.migrate:
+        migrate_responses(args.prune)
+        return
+    if args.reextract:
+        reextract_texts(args.header, args.footer, args.workers)
+        return
+
     # Call the processing function with header and footer
-    process_pdfs_in_folder(PDF_FOLDER, args.header, args.footer)
+    with create_client(args.endpoint, args.credentials, args.token, args.concurrency, args.max_retries) as client:
+        process_pdfs_in_folder(PDF_FOLDER, args.header, args.footer, client, args.concurrency, args.pages_per_request,
+                               args.split_workers, args.extract_workers, args.queue_size, args.prune)
+        stats = client.stats()
+        print(f"Document AI: {stats['requests']} requests, {stats['retries']} retries, {stats['errors']} errors, "
+              f"{stats['token_refreshes']} token refreshes")
 
 if __name__ == "__main__":
     main()
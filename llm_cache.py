@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+class ResponseCache:
+    """
+    Persistent, content-addressed cache of LLM responses stored in SQLite.
+
+    Entries are keyed on a hash of the full request (model, messages and sampling
+    parameters), so a chunk only reaches the model again when something that
+    influences its answer has changed. The least recently used entries are evicted
+    once the stored responses exceed max_size_mb.
+    """
+
+    def __init__(self, path, max_size_mb=512):
+        self.path = str(path)
+        self.max_bytes = int(float(max_size_mb) * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+        self._size = self._total_size()
+
+    @staticmethod
+    def make_key(request):
+        """Return the cache key of a chat completion request."""
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _total_size(self):
+        return self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def get(self, key):
+        """Return the cached response for key, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE responses SET last_access = ? WHERE key = ?', (time.time(), key))
+            self.hits += 1
+            return row[0]
+
+    def contains(self, key):
+        """Return True if a response is cached for key, without counting a lookup or refreshing the entry."""
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM responses WHERE key = ?', (key,)).fetchone() is not None
+
+    def put(self, key, response):
+        """Store a response and evict old entries if the cache grew too large."""
+        size = len(response.encode('utf-8'))
+        with self._lock:
+            previous = self._conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, response, size, last_access) VALUES (?, ?, ?, ?)',
+                (key, response, size, time.time())
+            )
+            self._size += size - (previous[0] if previous else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Other processes may share the file, so recount before deleting anything
+        self._size = self._total_size()
+        while self._size > self.max_bytes:
+            rows = self._conn.execute(
+                'SELECT key, size FROM responses ORDER BY last_access LIMIT 100'
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._size -= size
+                self.evictions += 1
+                if self._size <= self.max_bytes:
+                    break
+
+    def stats(self):
+        """Return hit/miss counters and the current size of the cache."""
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': entries,
+            'size_bytes': self._size,
+        }
+
+    def close(self):
+        """Close the underlying database connection."""
+        self._conn.close()
@@ -1,10 +1,28 @@
 #!/usr/bin/env python3
 
+import argparse
 import os
 import re
+import shutil
+import struct
 import subprocess
-from pydub import AudioSegment
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from natsort import natsorted
+from audio_concat import concatenate_audio, read_wav_info, wav_header
+
+# List of folder names (extensions) to process
+# in_paths = ["lda", "ent", "que", "sum", "ssf", "md"]
+in_paths = ["ssf"]
+
+OUTPUT_FOLDER = "./output"  # Folder holding one folder of text files per mode
+SILENCE_SAMPLE_RATE = 22050
+CHARACTERS_PER_SECOND = 15  # Speaking rate the silence engine assumes
+
+# Outcome of one text file: status is 'generated', 'skipped' or 'failed'
+FileResult = namedtuple('FileResult', ['filename', 'output_path', 'status', 'seconds'])
 
 def clean_markdown(text):
     """
@@ -16,63 +34,197 @@ def clean_markdown(text):
     text = re.sub(r'\n{2,}', '\n', text)  # Replace multiple newlines with a single newline
     return text.strip()
 
-def speak_text_files_in_folder(folder_path, output_folder, final_output_file):
+class SayEngine:
+    """The macOS say command, writing 32-bit float WAV at 22050 Hz."""
+
+    name = 'say'
+
+    def __init__(self, voice="Samantha", data_format='LEF32@22050'):
+        self.voice = voice
+        self.data_format = data_format
+
+    def command(self, output_path):
+        # The text is read from stdin, long texts would not fit in the arguments
+        return ['say', '-v', self.voice, '-f', '-', '-o', output_path, '--file-format=WAVE',
+                f'--data-format={self.data_format}']
+
+class EspeakEngine:
+    """The espeak-ng speech synthesizer, available on Linux, writing 16-bit WAV at 22050 Hz."""
+
+    name = 'espeak-ng'
+
+    def __init__(self, voice='en-us'):
+        self.voice = voice
+
+    def command(self, output_path):
+        return ['espeak-ng', '-v', self.voice, '-w', output_path, '--stdin']
+
+class SilenceEngine:
     """
-    Reads all text files in a folder, speaks their content using the macOS TTS engine,
-    and saves the speech for each file to an individual .wav file in an output folder. 
-    Combines all generated audio files into a single final .wav file.
+    A stand-in that writes as much silence as the text would take to say, in the format of say.
+
+    It runs as a subprocess like the real engines and takes realtime_factor seconds per
+    second of audio, so the scheduler can be exercised and timed on any system.
+    """
+
+    name = 'silence'
+
+    def __init__(self, realtime_factor=0.0):
+        self.realtime_factor = realtime_factor
+
+    def command(self, output_path):
+        return [sys.executable, os.path.abspath(__file__), '--write-silence', output_path,
+                '--realtime-factor', str(self.realtime_factor)]
+
+ENGINES = {engine.name: engine for engine in (SayEngine, EspeakEngine, SilenceEngine)}
+
+def write_silence(output_path, text, realtime_factor=0.0):
+    """Write the silence SilenceEngine stands in for, after taking as long as it is told to."""
+    frames = int(len(text) / CHARACTERS_PER_SECOND * SILENCE_SAMPLE_RATE)
+    time.sleep(frames / SILENCE_SAMPLE_RATE * realtime_factor)
+    fmt = struct.pack('<HHIIHH', 3, 1, SILENCE_SAMPLE_RATE, SILENCE_SAMPLE_RATE * 4, 4, 32)
+    with open(output_path, 'wb') as file:
+        file.write(wav_header(fmt, frames * 4, struct.pack('<I', frames)))
+        file.write(bytes(frames * 4))
+
+def get_engine(name, voice=None):
+    """Return the engine called name, with voice if it has one."""
+    engine_class = ENGINES[name]
+    if voice and engine_class is not SilenceEngine:
+        return engine_class(voice)
+    return engine_class()
+
+def default_engine_name():
+    """Return say on macOS, espeak-ng elsewhere if it is installed, or the silence engine."""
+    if sys.platform == 'darwin':
+        return 'say'
+    return 'espeak-ng' if shutil.which('espeak-ng') else 'silence'
+
+def audio_seconds(path):
+    """Return the length of a WAV file in seconds, or 0 if it cannot be read."""
+    try:
+        info = read_wav_info(path)
+    except (OSError, ValueError, struct.error):
+        return 0.0
+    return info.data_size / info.block_align / info.sample_rate
+
+def synthesize_file(engine, file_path, output_path):
+    """Speak a text file into output_path with engine and return the seconds it took, or None if it failed."""
+    with open(file_path, 'r') as file:
+        cleaned_text = clean_markdown(file.read())
+
+    # Written under a temporary name, so an interrupted run leaves no .wav that would be skipped next time
+    part_path = output_path[:-len('.wav')] + '.part.wav'
+    started = time.perf_counter()
+    result = subprocess.run(engine.command(part_path), input=cleaned_text, text=True, capture_output=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0 or not os.path.exists(part_path):
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        print(f"Failed to generate audio for '{os.path.basename(file_path)}' with {engine.name}: "
+              f"{result.stderr.strip() or f'exit code {result.returncode}'}")
+        return None
+    os.replace(part_path, output_path)
+    return elapsed
+
+def synthesize_folder(folder_path, output_folder, final_output_file=None, engine=None, jobs=None, extensions=None):
+    """
+    Speak the text files of a folder into one .wav file each in output_folder, running up
+    to jobs engine processes at once, and optionally combine them into final_output_file.
+
+    Each say or espeak-ng process uses a single core, so files are spoken in parallel,
+    one process per file. Files whose .wav file already exists are skipped. The time of
+    every file is printed as it finishes, and a FileResult per file is returned in
+    natural order.
 
     Args:
       folder_path: The path to the folder containing the text files.
       output_folder: The path to the folder where individual audio files will be saved.
-      final_output_file: The path for the final combined audio file.
-      voice: The TTS voice (default is 'Samantha').
+      final_output_file: The path for the final combined audio file, or None to not combine them.
+      engine: The TTS engine (default: say on macOS, espeak-ng elsewhere).
+      jobs: The number of engine processes run at once (default: one per CPU).
+      extensions: The extensions of the text files to speak (default: in_paths).
     """
-    voice = "Samantha"
+    engine = engine or get_engine(default_engine_name())
+    jobs = max(1, jobs or os.cpu_count() or 1)
+    extensions = extensions or in_paths
     os.makedirs(output_folder, exist_ok=True)
-    audio_files = []
 
+    started = time.perf_counter()
+    results = {}
+    pending = []
     # Process each file in the folder if it matches the required extensions
     for filename in natsorted(os.listdir(folder_path)):  # Use natsorted for natural order
-        if any(filename.endswith(f".{ext}") for ext in in_paths):  # Check against each extension in in_paths
-            file_path = os.path.join(folder_path, filename)
+        if any(filename.endswith(f".{ext}") for ext in extensions):  # Check against each extension in extensions
             output_file_name = filename.rsplit(".", 1)[0] + ".wav"  # Replace extension with .wav
             output_file_path = os.path.join(output_folder, output_file_name)
 
             # Skip if the audio file already exists
             if os.path.exists(output_file_path):
                 print(f"Skipping '{filename}' - audio file already exists.")
-                audio_files.append(output_file_path)  # Add to list for combining later
+                results[filename] = FileResult(filename, output_file_path, 'skipped', 0.0)
                 continue
+            pending.append((filename, output_file_path))
 
-            # Read file contents and clean Markdown
-            with open(file_path, 'r') as file:
-                file_contents = file.read()
-                cleaned_text = clean_markdown(file_contents).replace('"', '\\"')  # Escape quotes
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(synthesize_file, engine, os.path.join(folder_path, filename), output_file_path):
+                   (filename, output_file_path) for filename, output_file_path in pending}
+        for future in as_completed(futures):
+            filename, output_file_path = futures[future]
+            elapsed = future.result()
+            if elapsed is None:
+                results[filename] = FileResult(filename, output_file_path, 'failed', 0.0)
+                continue
+            results[filename] = FileResult(filename, output_file_path, 'generated', elapsed)
+            print(f"Generated audio for '{filename}' with {engine.name} in {elapsed:.1f}s "
+                  f"({audio_seconds(output_file_path):.0f}s of audio), saved to '{output_file_path}'")
 
-            # Generate the audio file using macOS 'say' command with .wav format
-            subprocess.run(['say', '-v', voice, cleaned_text, '-o', output_file_path, '--data-format=LEF32@22050'])
-            print(f"Generated audio for '{filename}' with voice '{voice}' and saved to '{output_file_path}'")
+    results = [results[filename] for filename in natsorted(results)]
+    wall = time.perf_counter() - started
+    generated = [result for result in results if result.status == 'generated']
+    busy = sum(result.seconds for result in generated)
+    print(f"{len(generated)} generated, {sum(result.status == 'skipped' for result in results)} skipped, "
+          f"{sum(result.status == 'failed' for result in results)} failed in {wall:.1f}s with {jobs} jobs "
+          f"({busy:.1f}s of {engine.name} time, {busy / wall if wall else 0:.1f}x)")
 
-            # Add the generated file to the list for final combination
-            audio_files.append(output_file_path)
+    if final_output_file:
+        # Combine all .wav files into a single final file, streaming their samples into it
+        audio_files = [result.output_path for result in results if result.status != 'failed']
+        if audio_files:
+            concatenate_audio(audio_files, final_output_file)
+            print(f"Combined all audio files into '{final_output_file}'")
+    return results
 
-    # Combine all .wav files into a single final file
-    combined_audio = AudioSegment.empty()
-    for audio_file in audio_files:
-        combined_audio += AudioSegment.from_wav(audio_file)
-    
-    # Export the combined audio to the specified final output path
-    combined_audio.export(final_output_file, format="wav")
-    print(f"Combined all audio files into '{final_output_file}'")
+def speak_text_files_in_folder(folder_path, output_folder, final_output_file):
+    """
+    Reads all text files in a folder, speaks their content using the macOS TTS engine,
+    and saves the speech for each file to an individual .wav file in an output folder.
+    Combines all generated audio files into a single final .wav file.
+    """
+    return synthesize_folder(folder_path, output_folder, final_output_file, SayEngine())
 
-# List of folder names (extensions) to process
-# in_paths = ["lda", "ent", "que", "sum", "ssf", "md"]
-in_paths = ["ssf"]
+def main():
+    parser = argparse.ArgumentParser(description='Speak the text files of every mode folder into .wav files.')
+    parser.add_argument('--modes', nargs='+', default=in_paths, help='Modes to speak; ./output/<mode> holds their .<mode> files')
+    parser.add_argument('--output', type=str, default=OUTPUT_FOLDER, help='Folder holding one folder per mode')
+    parser.add_argument('--engine', type=str, choices=sorted(ENGINES), default=default_engine_name(),
+                        help='TTS engine (default: say on macOS, espeak-ng elsewhere if installed, else silence)')
+    parser.add_argument('--voice', type=str, default=None, help='Voice of the engine (default: Samantha for say, en-us for espeak-ng)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='Engine processes run at once')
+    parser.add_argument('--no-combine', action='store_true', help='Do not combine the .wav files of a mode into <mode>_final_output.wav')
+    parser.add_argument('--realtime-factor', type=float, default=0.0, help='Seconds the silence engine takes per second of audio')
+    parser.add_argument('--write-silence', type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.write_silence:
+        write_silence(args.write_silence, sys.stdin.read(), args.realtime_factor)
+        return
+
+    engine = SilenceEngine(args.realtime_factor) if args.engine == 'silence' else get_engine(args.engine, args.voice)
+    for path in args.modes:
+        folder_path = os.path.join(args.output, path)  # Folder for each category
+        final_output_file = None if args.no_combine else os.path.join(args.output, f'{path}_final_output.wav')
+        synthesize_folder(folder_path, folder_path, final_output_file, engine, args.jobs, [path])
 
-# Example usage
-for path in in_paths:
-    folder_path = f'./output/{path}'  # Folder for each category
-    output_folder = f'./output/{path}/'  # Output folder for audio files
-    final_output_file = f'./output/{path}_final_output.wav'  # Path for the combined final file
-    speak_text_files_in_folder(folder_path, output_folder, final_output_file)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
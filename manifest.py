@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from checkpoint import write_file_atomically
+
+MANIFEST_FILE = 'manifest.jsonl'
+HASH_BLOCK_SIZE = 1024 * 1024
+
+def hash_file(path):
+    """Return the SHA-256 of a file's content, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_json(value):
+    """Return the SHA-256 of a JSON-serializable value."""
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def make_fingerprint(input_hash, mode_config, model, params):
+    """Describe everything an output depends on: its input text, prompt, model and parameters."""
+    return {
+        'input': input_hash,
+        'prompt': hash_json(mode_config),
+        'model': model,
+        'params': hash_json(params),
+    }
+
+class Manifest:
+    """
+    Record, for every output file, the fingerprint of the inputs it was computed from.
+
+    The manifest is an append-only JSONL file where the last line for an output wins,
+    so several worker processes can record outputs at the same time.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries = {}
+        self.lines = 0
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.entries[entry['output']] = entry['fingerprint']
+                    self.lines += 1
+
+    def check(self, output, fingerprint):
+        """Return (needs processing, reason) for an existing output."""
+        recorded = self.entries.get(output)
+        if recorded is None:
+            return True, 'not in manifest'
+        for field, reason in (('input', 'input changed'), ('prompt', 'prompt changed'),
+                              ('model', 'model changed'), ('params', 'parameters changed')):
+            if recorded.get(field) != fingerprint[field]:
+                return True, reason
+        return False, 'unchanged'
+
+    def record(self, output, fingerprint):
+        """Append the fingerprint of a freshly written output."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        line = (json.dumps({'output': output, 'fingerprint': fingerprint}) + '\n').encode('utf-8')
+        # A single O_APPEND write keeps lines intact when workers record concurrently
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+        self.entries[output] = fingerprint
+        self.lines += 1
+
+    def compact(self):
+        """Rewrite the manifest with one line per output. Only call this when no worker is recording."""
+        # Pick up what other processes recorded since this manifest was loaded
+        self.__init__(self.path)
+        if self.lines <= len(self.entries):
+            return
+        write_file_atomically(self.path, (
+            json.dumps({'output': output, 'fingerprint': fingerprint}) + '\n'
+            for output, fingerprint in sorted(self.entries.items())
+        ))
+        self.lines = len(self.entries)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+import asyncio
+
+PART_SEPARATOR = '\n\n---\n\n'
+
+def plan_windows(parts, fan_in):
+    """
+    Cut the parts of one reduce level into windows of fan_in consecutive parts.
+
+    Windows are fixed by position, and every window gives exactly one part of the next
+    level whatever the token budget does inside it. A part whose text or size changes
+    therefore only changes the reduce requests on its own path up the tree; every other
+    request is sent with the same text as before and is answered by the cache.
+    """
+    fan_in = max(2, int(fan_in))
+    return [parts[i:i + fan_in] for i in range(0, len(parts), fan_in)]
+
+def split_window(window, budget, count_tokens):
+    """
+    Split a window into groups of consecutive parts of at most budget tokens, when possible.
+
+    If every part is too large to share a context with its neighbour, they are paired
+    anyway so that reducing the window still converges.
+    """
+    groups, current, current_tokens = [], [], 0
+    for part in window:
+        part_tokens = count_tokens(part)
+        if current and current_tokens + part_tokens > budget:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(part)
+        current_tokens += part_tokens
+    if current:
+        groups.append(current)
+
+    if len(groups) == len(window) and len(window) > 1:
+        groups = [window[i:i + 2] for i in range(0, len(window), 2)]
+    return groups
+
+def reduce_window(window, reduce_group, budget, count_tokens):
+    """Reduce the parts of a window to a single result, splitting it where it does not fit the budget."""
+    while len(window) > 1:
+        window = [group[0] if len(group) == 1 else reduce_group(PART_SEPARATOR.join(group))
+                  for group in split_window(window, budget, count_tokens)]
+    return window[0]
+
+def reduce_tree(parts, reduce_group, fan_in, budget, count_tokens, label='Reduce'):
+    """
+    Reduce partial results level by level until a single result is left.
+
+    Args:
+      parts: The partial results of the map step, in chunk order.
+      reduce_group: Function combining the joined text of a group into one result.
+      fan_in: Maximum number of parts combined by one reduce request.
+      budget: Token budget of the text sent to one reduce request.
+      count_tokens: Function counting the tokens of a string.
+      label: Prefix of the progress messages.
+    """
+    level = 1
+    while len(parts) > 1:
+        windows = plan_windows(parts, fan_in)
+        print(f'{label} level {level}: combining {len(parts)} parts into {len(windows)}')
+        parts = [reduce_window(window, reduce_group, budget, count_tokens) for window in windows]
+        level += 1
+    return parts[0] if parts else ''
+
+async def reduce_window_async(window, reduce_group, budget, count_tokens):
+    """Like reduce_window, but reduce_group is a coroutine and the groups of a window run concurrently."""
+    async def passthrough(part):
+        return part
+
+    while len(window) > 1:
+        window = await asyncio.gather(*[
+            passthrough(group[0]) if len(group) == 1 else reduce_group(PART_SEPARATOR.join(group))
+            for group in split_window(window, budget, count_tokens)
+        ])
+    return window[0]
+
+async def reduce_tree_async(parts, reduce_group, fan_in, budget, count_tokens, label='Reduce'):
+    """Like reduce_tree, but reduce_group is a coroutine and every window of a level runs concurrently."""
+    level = 1
+    while len(parts) > 1:
+        windows = plan_windows(parts, fan_in)
+        print(f'{label} level {level}: combining {len(parts)} parts into {len(windows)}')
+        parts = await asyncio.gather(*[
+            reduce_window_async(window, reduce_group, budget, count_tokens) for window in windows
+        ])
+        level += 1
+    return parts[0] if parts else ''
+
+def reduce_window_estimate(window, reduce_group, budget):
+    """Like reduce_window, over token counts instead of texts."""
+    while len(window) > 1:
+        window = [group[0] if len(group) == 1 else reduce_group(sum(group))
+                  for group in split_window(window, budget, lambda tokens: tokens)]
+    return window[0]
+
+def estimate_tree(part_tokens, fan_in, budget, result_tokens):
+    """
+    Return the prompt tokens of every reduce request a tree over parts of the given sizes would send.
+
+    Every reduced group is assumed to produce a result of result_tokens tokens, so the
+    tree is planned the same way reduce_tree would plan it without running a single request.
+    """
+    requests = []
+
+    def reduce_group(tokens):
+        requests.append(tokens)
+        return result_tokens
+
+    parts = list(part_tokens)
+    while len(parts) > 1:
+        parts = [reduce_window_estimate(window, reduce_group, budget) for window in plan_windows(parts, fan_in)]
+    return requests
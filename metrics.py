@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+import contextvars
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from checkpoint import write_file_atomically
+
+QUANTILES = (0.50, 0.95, 0.99)
+
+# Tags (file, mode, chunk, ...) of the calls made in the current task or thread
+_call_tags = contextvars.ContextVar('call_tags', default={})
+# The call currently being measured, so the client wrappers can add queue wait, retries and endpoint
+_current_call = contextvars.ContextVar('current_call', default=None)
+
+class CallRecord:
+    """Measurements of one completion call."""
+
+    __slots__ = ('file', 'mode', 'chunk', 'model', 'endpoint', 'wall', 'queue_wait', 'prompt_tokens',
+                 'completion_tokens', 'retries', 'error')
+
+    def __init__(self, tags, model):
+        self.file = tags.get('file')
+        self.mode = tags.get('mode')
+        self.chunk = tags.get('chunk')
+        self.model = model
+        self.endpoint = None
+        self.wall = 0.0
+        self.queue_wait = float(tags.get('queue_wait', 0.0))
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.retries = 0
+        self.error = None
+
+    def tokens_per_second(self):
+        generation_time = self.wall - self.queue_wait
+        return self.completion_tokens / generation_time if self.completion_tokens and generation_time > 0 else None
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, values):
+        record = cls({}, values.get('model'))
+        for name in cls.__slots__:
+            setattr(record, name, values.get(name))
+        return record
+
+@contextmanager
+def tag_calls(**tags):
+    """Tag every completion call made inside the block, on top of the tags already set."""
+    token = _call_tags.set({**_call_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _call_tags.reset(token)
+
+def note_queue_wait(seconds):
+    """Add time spent waiting for a rate limit or a free endpoint to the current call."""
+    record = _current_call.get()
+    if record is not None:
+        record.queue_wait += seconds
+
+def note_retry():
+    record = _current_call.get()
+    if record is not None:
+        record.retries += 1
+
+def note_endpoint(name):
+    record = _current_call.get()
+    if record is not None:
+        record.endpoint = name
+
+def note_usage(usage, completion_tokens=0):
+    """Record the token usage of the current call, falling back to a count of streamed pieces."""
+    record = _current_call.get()
+    if record is None:
+        return
+    if usage is not None:
+        record.prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        record.completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+    else:
+        record.completion_tokens = completion_tokens
+
+def percentile(values, fraction):
+    """Return the value at the given fraction of the sorted values (nearest rank)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def summarize(values):
+    """Return the count, mean and quantiles of a list of numbers."""
+    values = [value for value in values if value is not None]
+    summary = {'count': len(values), 'sum': sum(values), 'mean': sum(values) / len(values) if values else None}
+    for quantile in QUANTILES:
+        summary[f'p{int(quantile * 100)}'] = percentile(values, quantile)
+    return summary
+
+class Metrics:
+    """Collect one CallRecord per completion call and turn them into a run report."""
+
+    def __init__(self):
+        self.records = []
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self, model):
+        """Measure the completion call made inside the block."""
+        record = CallRecord(_call_tags.get(), model)
+        # Time spent waiting before the block, for example on a concurrency semaphore, counts towards wall time
+        waited = record.queue_wait
+        token = _current_call.set(record)
+        started = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record.error = type(e).__name__
+            raise
+        finally:
+            record.wall = time.perf_counter() - started + waited
+            _current_call.reset(token)
+            with self._lock:
+                self.records.append(record)
+
+    def drain(self):
+        """Remove and return the records collected so far, as plain dicts."""
+        with self._lock:
+            records, self.records = self.records, []
+        return [record.to_dict() for record in records]
+
+    def extend(self, records):
+        """Add records drained from a worker."""
+        with self._lock:
+            self.records.extend(CallRecord.from_dict(record) for record in records)
+
+    def _group(self, *fields):
+        groups = defaultdict(list)
+        with self._lock:
+            for record in self.records:
+                groups[tuple(getattr(record, field) for field in fields)].append(record)
+        return groups
+
+    @staticmethod
+    def _aggregate(records):
+        return {
+            'calls': len(records),
+            'errors': sum(1 for record in records if record.error),
+            'retries': sum(record.retries for record in records),
+            'prompt_tokens': sum(record.prompt_tokens for record in records),
+            'completion_tokens': sum(record.completion_tokens for record in records),
+            'latency_seconds': summarize([record.wall for record in records]),
+            'queue_wait_seconds': summarize([record.queue_wait for record in records]),
+            'tokens_per_second': summarize([record.tokens_per_second() for record in records]),
+        }
+
+    def report(self):
+        """Return the run report: totals, and statistics per (mode, model) and per endpoint."""
+        with self._lock:
+            records = list(self.records)
+        errors = defaultdict(int)
+        for record in records:
+            if record.error:
+                errors[record.error] += 1
+        return {
+            'started': self.started,
+            'duration_seconds': time.time() - self.started,
+            'total': self._aggregate(records),
+            'errors_by_type': dict(errors),
+            'by_mode': [
+                {'mode': mode, 'model': model, **self._aggregate(group)}
+                for (mode, model), group in sorted(self._group('mode', 'model').items(), key=str)
+            ],
+            'by_endpoint': [
+                {'endpoint': endpoint, **self._aggregate(group)}
+                for (endpoint,), group in sorted(self._group('endpoint').items(), key=str)
+            ],
+        }
+
+    def write_report(self, path):
+        """Write the run report as JSON."""
+        write_file_atomically(path, [json.dumps(self.report(), indent=2) + '\n'])
+
+    def write_prometheus(self, path):
+        """Write the statistics per (mode, model) in the Prometheus text exposition format."""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{{{format_labels(labels)}}} {format_value(value)}')
+
+        groups = sorted(self._group('mode', 'model').items(), key=str)
+        for name, field, help_text in (
+                ('llm_request_duration_seconds', 'wall', 'Wall time of completion calls'),
+                ('llm_request_queue_wait_seconds', 'queue_wait', 'Time completion calls waited for a rate limit or endpoint')):
+            summaries = [({'mode': mode, 'model': model}, summarize([getattr(record, field) for record in records]))
+                         for (mode, model), records in groups]
+            metric(name, 'summary', help_text, [
+                ({**labels, 'quantile': str(quantile)}, summary[f'p{int(quantile * 100)}'])
+                for labels, summary in summaries for quantile in QUANTILES
+            ])
+            for suffix in ('sum', 'count'):
+                for labels, summary in summaries:
+                    lines.append(f'{name}_{suffix}{{{format_labels(labels)}}} {format_value(summary[suffix])}')
+
+        metric('llm_tokens_total', 'counter', 'Tokens used by completion calls', [
+            ({'mode': mode, 'model': model, 'kind': kind}, sum(getattr(record, f'{kind}_tokens') for record in records))
+            for (mode, model), records in groups for kind in ('prompt', 'completion')
+        ])
+        metric('llm_requests_total', 'counter', 'Completion calls', [
+            ({'mode': mode, 'model': model}, len(records)) for (mode, model), records in groups
+        ])
+        metric('llm_request_errors_total', 'counter', 'Completion calls that failed', [
+            ({'mode': mode, 'model': model}, sum(1 for record in records if record.error))
+            for (mode, model), records in groups
+        ])
+        metric('llm_request_retries_total', 'counter', 'Retries of completion calls', [
+            ({'mode': mode, 'model': model}, sum(record.retries for record in records))
+            for (mode, model), records in groups
+        ])
+        write_file_atomically(path, [line + '\n' for line in lines])
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels):
+    """Format a dict of labels as Prometheus label pairs."""
+    return ','.join(f'{key}="{escape_label(value)}"' for key, value in labels.items())
+
+def format_value(value):
+    return 'NaN' if value is None else repr(float(value))
@@ -1,22 +1,133 @@
 #!/usr/bin/env python3
-from openai import OpenAI
+import asyncio
 import json
 import os
 import argparse
+import threading
+import time
 from pathlib import Path
+from collections import Counter
+from functools import partial
+from multiprocessing import Manager
+from chunker import get_token_counter, estimate_tokens, describe_token_counter
+from text_reader import iter_file_chunks, iter_stream_paragraphs, iter_text_blocks
+from llm_cache import ResponseCache
+from checkpoint import ChunkJournal, write_file_atomically
+from batch_api import make_custom_id, write_batch_requests, read_batch_results
+from rate_limiter import RateLimitScheduler, RateLimitedClient, AsyncRateLimitedClient
+from backend_pool import Endpoint, PooledClient, AsyncPooledClient
+from map_reduce import reduce_tree, reduce_tree_async, estimate_tree
+from work_queue import build_jobs, run_jobs
+from manifest import MANIFEST_FILE, Manifest, hash_file, hash_json, make_fingerprint
+from metrics import Metrics, tag_calls, note_usage
+from dedup import DuplicateIndex, SharedResponses
+
+JOURNAL_DIR = '.journal'  # Checkpoints of unfinished outputs, relative to the output path
+
+_worker_state = {}  # Client, cache and settings of a --jobs worker, set by init_worker
+_manifests = {}  # Manifest of each output path, loaded once per process
+_metrics = Metrics()  # Measurements of every completion call made by this process
+_requests_in_flight = {}  # Request key -> task of the async call answering it
+_input_hashes = {}  # Input file hashes by (path, size, mtime)
+_corpus_hashes = {}  # Hash of the corpus of the local topic model by directory, computed once per run
+RUNTIME_SETTINGS = ('api_key', 'stream', 'incremental')  # Settings that do not change an output
+
+def get_backend_config(mode, config):
+    """Return the settings of a backend from the backends section of config.json."""
+    return config.get('backends', {}).get(mode, {})
+
+def get_endpoints(mode, config):
+    """Return the endpoints of a backend, falling back to its single default server."""
+    backend = get_backend_config(mode, config)
+    default_url = 'http://localhost:11434/v1' if mode == 'ollama' else None  # Ollama's local API endpoint
+    endpoints = backend.get('endpoints') or [{'base_url': default_url}]
+    return [
+        {
+            'base_url': endpoint.get('base_url', default_url),
+            'weight': float(endpoint.get('weight', '1')),
+            'max_in_flight': int(endpoint.get('max_in_flight', backend.get('max_in_flight', '1')))
+        }
+        for endpoint in endpoints
+    ]
+
+def create_scheduler(mode, config, max_in_flight, retry_connection_errors=True):
+    """Build the rate limit scheduler for an endpoint of a backend from config.json."""
+    backend = get_backend_config(mode, config)
+    return RateLimitScheduler(
+        requests_per_minute=float(backend.get('requests_per_minute') or 0),
+        tokens_per_minute=float(backend.get('tokens_per_minute') or 0),
+        max_concurrency=max_in_flight,
+        max_retries=int(backend.get('max_retries', '6')),
+        retry_connection_errors=retry_connection_errors
+    )
+
+def get_pool_options(mode, config):
+    """Return the health checking options of a backend pool."""
+    backend = get_backend_config(mode, config)
+    return {
+        'failure_threshold': int(backend.get('failure_threshold', '3')),
+        'cooldown': float(backend.get('cooldown', '30'))
+    }
+
+def get_api_key(mode, config):
+    """Return the API key to send to the backend."""
+    if mode == 'ollama':
+        return 'ollama'  # Dummy key, as Ollama doesn't require an actual API key
+    return os.environ.get('OPENAI_API_KEY', config.get('api_key', ''))
 
 def initialize_client(mode, config):
     """Initialize the API client based on the mode (OpenAI or Ollama)."""
-    if mode == 'ollama':
-        # Use Ollama's local API compatible with OpenAI
-        return OpenAI(
-            base_url='http://localhost:11434/v1',  # Ollama's local API endpoint
-            api_key='ollama'  # Dummy key, as Ollama doesn't require an actual API key
-        )
-    else:
-        # Use OpenAI's actual API
-        api_key = os.environ.get('OPENAI_API_KEY', config.get('api_key', ''))
-        return OpenAI(api_key=api_key)
+    # Imported on first use: openai takes most of the startup time and runs with nothing to do never need it
+    import httpx
+    from openai import OpenAI
+
+    endpoints = get_endpoints(mode, config)
+    pooled_endpoints = []
+    for endpoint in endpoints:
+        # One keep-alive connection pool per endpoint, sized to its concurrency
+        http_client = httpx.Client(limits=httpx.Limits(
+            max_connections=endpoint['max_in_flight'], max_keepalive_connections=endpoint['max_in_flight']
+        ))
+        # Retries are handled by the rate limit scheduler, not by the OpenAI client
+        client = OpenAI(base_url=endpoint['base_url'], api_key=get_api_key(mode, config),
+                        max_retries=0, http_client=http_client)
+        scheduler = create_scheduler(mode, config, endpoint['max_in_flight'], len(endpoints) == 1)
+        pooled_endpoints.append(Endpoint(str(client.base_url), RateLimitedClient(client, scheduler),
+                                         endpoint['weight'], endpoint['max_in_flight']))
+    pool = PooledClient(pooled_endpoints, **get_pool_options(mode, config))
+    pool.check_health()
+    return pool
+
+def initialize_async_client(mode, config):
+    """Initialize the asyncio API client based on the mode (OpenAI or Ollama)."""
+    import httpx
+    from openai import AsyncOpenAI
+
+    endpoints = get_endpoints(mode, config)
+    pooled_endpoints = []
+    for endpoint in endpoints:
+        http_client = httpx.AsyncClient(limits=httpx.Limits(
+            max_connections=endpoint['max_in_flight'], max_keepalive_connections=endpoint['max_in_flight']
+        ))
+        client = AsyncOpenAI(base_url=endpoint['base_url'], api_key=get_api_key(mode, config),
+                             max_retries=0, http_client=http_client)
+        scheduler = create_scheduler(mode, config, endpoint['max_in_flight'], len(endpoints) == 1)
+        pooled_endpoints.append(Endpoint(str(client.base_url), AsyncRateLimitedClient(client, scheduler),
+                                         endpoint['weight'], endpoint['max_in_flight']))
+    return AsyncPooledClient(pooled_endpoints, **get_pool_options(mode, config))
+
+def get_max_in_flight(mode, config):
+    """Return how many requests may be in flight at once across all endpoints of a backend."""
+    return sum(endpoint['max_in_flight'] for endpoint in get_endpoints(mode, config))
+
+def print_endpoint_stats(client):
+    """Print request counts and latencies of every endpoint the client used."""
+    for name, stats in client.stats().items():
+        if not stats['requests']:
+            continue
+        print(f"Endpoint {name}: {stats['requests']} requests, {stats['errors']} errors, "
+              f"latency mean {stats['latency_mean'] or 0:.2f}s p50 {stats['latency_p50'] or 0:.2f}s "
+              f"p95 {stats['latency_p95'] or 0:.2f}s{'' if stats['healthy'] else ' (unhealthy)'}")
 
 def load_config():
     """Load the configuration from config.json."""
@@ -27,85 +138,1011 @@ def setup_paths(process_path):
     """Ensure input directory exists."""
     process_path.mkdir(parents=True, exist_ok=True)
 
-def split_text_into_chunks(text, max_tokens):
-    """Split text into manageable chunks based on max token size."""
-    return [text[i:i + max_tokens] for i in range(0, len(text), max_tokens)]
+def build_request(config, prompt_content, chunk):
+    """Build the chat completion arguments for a single chunk."""
+    messages = [
+        {
+            'role': 'system',
+            'content': f"{prompt_content}. Please don't add outro or intro to your response"
+        },
+        {
+            'role': 'user',
+            'content': chunk
+        }
+    ]
+    return {
+        'model': config['default']['model'],
+        'messages': messages,
+        'temperature': float(config['default']['temperature']),
+        'max_tokens': int(config['default']['max_tokens']),
+        'top_p': float(config['default']['top_p']),
+        'frequency_penalty': float(config['default']['frequency_penalty']),
+        'presence_penalty': float(config['default']['presence_penalty'])
+    }
 
-def process_file(client, text_file, config, mode, output_base_path):
-    """Process a single file using the API and write to the output."""
-    with open(text_file, 'r', encoding=config['default'].get('encoding', 'utf-8')) as file:
-        text_content = file.read()
+def is_incremental(config):
+    """Return True if outputs are recomputed whenever their inputs changed, not only when missing."""
+    return str(config['default'].get('incremental', 'false')).lower() == 'true'
 
-    max_input_tokens = int(config['default']['max_tokens'])
-    text_chunks = split_text_into_chunks(text_content, max_input_tokens)
-    
+def get_manifest(output_base_path, reload=False):
+    """Return the manifest of an output directory, loading it once per process."""
+    key = str(output_base_path)
+    if reload or key not in _manifests:
+        _manifests[key] = Manifest(Path(output_base_path) / MANIFEST_FILE)
+    return _manifests[key]
+
+def get_input_hash(text_file):
+    """Return the hash of an input file, hashing each version of the file only once."""
+    stat = text_file.stat()
+    key = (str(text_file), stat.st_size, stat.st_mtime_ns)
+    if key not in _input_hashes:
+        _input_hashes[key] = hash_file(text_file)
+    return _input_hashes[key]
+
+def get_lda_corpus(text_file):
+    """Return the text files the local topic model is fit on: every text file next to text_file."""
+    return sorted(text_file.parent.glob('*.txt'))
+
+def get_corpus_hash(text_file):
+    """Return the hash of the names and contents of every file of the corpus of text_file."""
+    key = str(text_file.parent)
+    if key not in _corpus_hashes:
+        _corpus_hashes[key] = hash_json([[corpus_file.name, get_input_hash(corpus_file)]
+                                         for corpus_file in get_lda_corpus(text_file)])
+    return _corpus_hashes[key]
+
+def get_fingerprint(text_file, config, current_mode):
+    """Describe everything the output of a mode depends on."""
+    params = {key: value for key, value in config['default'].items() if key not in RUNTIME_SETTINGS}
+    input_hash = get_input_hash(text_file)
+    if current_mode == 'lda' and is_local_lda(config, current_mode):
+        # The topics are fit on the whole corpus, so adding or changing any file changes every output
+        input_hash = get_corpus_hash(text_file)
+    return make_fingerprint(input_hash, config['modes'].get(current_mode, {}), config['default']['model'], params)
+
+def get_output_key(mode_output_file):
+    """Return the manifest key of an output, relative to the output path."""
+    return f'{mode_output_file.parent.name}/{mode_output_file.name}'
+
+def record_output(mode_output_file, fingerprint):
+    """Record the fingerprint of a freshly written output in its manifest."""
+    if fingerprint is not None:
+        get_manifest(mode_output_file.parent.parent).record(get_output_key(mode_output_file), fingerprint)
+
+def get_output_status(text_file, config, current_mode, mode_output_file):
+    """Return (needs processing, reason) for the output of a mode."""
+    if not mode_output_file.exists():
+        return True, 'output missing'
+    if not is_incremental(config):
+        return False, 'output exists'
+    manifest = get_manifest(mode_output_file.parent.parent)
+    return manifest.check(get_output_key(mode_output_file), get_fingerprint(text_file, config, current_mode))
+
+def get_pending_modes(text_file, config, mode, output_base_path, verbose=True):
+    """Return (mode, prompt, output file, fingerprint) for every mode whose output must be computed."""
     # Determine modes to process
     modes_to_process = config['modes'].keys() if mode == "all" else [mode]
-    
+
+    pending = []
     for current_mode in modes_to_process:
         # Set prompt and output directory for each mode
         prompt_content = config['modes'].get(current_mode, {}).get('prompt', '')
         output_dir = output_base_path / current_mode
         output_dir.mkdir(parents=True, exist_ok=True)
-        
+
         # Set file extension based on mode
         file_extension = config['modes'].get(current_mode, {}).get('file_extension', 'txt')
         mode_output_file = output_dir / text_file.with_suffix(f'.{file_extension}').name
 
-        # Skip if output file already exists
-        if mode_output_file.exists():
-            print(f'The file {mode_output_file} already exists, skipping...')
+        # Skip if output file already exists, or in incremental runs if nothing it depends on changed
+        needed, reason = get_output_status(text_file, config, current_mode, mode_output_file)
+        if not needed:
+            if verbose and reason == 'output exists':
+                print(f'The file {mode_output_file} already exists, skipping...')
+            elif verbose:
+                print(f'The file {mode_output_file} is {reason}, skipping...')
             continue
+        if verbose and reason != 'output missing':
+            print(f'The file {mode_output_file} will be recomputed: {reason}')
+        pending.append((current_mode, prompt_content, mode_output_file, get_fingerprint(text_file, config, current_mode)))
+    return pending
+
+def report_incremental(text_files, config, mode, output_base_path):
+    """Print how many outputs will be computed or skipped, and why."""
+    modes_to_process = list(config['modes'].keys()) if mode == "all" else [mode]
+    reasons = Counter()
+    for text_file in text_files:
+        for current_mode in modes_to_process:
+            file_extension = config['modes'].get(current_mode, {}).get('file_extension', 'txt')
+            mode_output_file = output_base_path / current_mode / text_file.with_suffix(f'.{file_extension}').name
+            needed, reason = get_output_status(text_file, config, current_mode, mode_output_file)
+            reasons[('compute' if needed else 'skip', reason)] += 1
+
+    for action in ('compute', 'skip'):
+        details = ', '.join(f'{count} {reason}' for (kind, reason), count in sorted(reasons.items()) if kind == action)
+        total = sum(count for (kind, _), count in reasons.items() if kind == action)
+        print(f'Incremental run: {total} outputs to {action}' + (f' ({details})' if details else ''))
+    return sum(count for (kind, _), count in reasons.items() if kind == 'compute')
+
+def write_mode_output(mode_output_file, llm_response, config, fingerprint=None):
+    """Write the combined response of a mode to its output file."""
+    write_file_atomically(mode_output_file, [llm_response], config['default'].get('encoding', 'utf-8'))
+    record_output(mode_output_file, fingerprint)
+    print(f'File {mode_output_file} created successfully.')
+
+def open_journal(text_file, current_mode, output_base_path):
+    """Open the checkpoint journal of a (document, mode) pair."""
+    return ChunkJournal(output_base_path / JOURNAL_DIR, text_file.name, current_mode)
+
+def report_missing_chunks(mode_output_file, missing, total):
+    """Explain why a mode's output file was not written."""
+    chunk_list = ', '.join(str(idx + 1) for idx in missing)
+    print(f'File {mode_output_file} not written, chunks {chunk_list} of {total} failed. '
+          f'Run again to retry only those chunks.')
+
+def is_map_reduce(config, current_mode):
+    """Return True if a mode combines its chunk results with a reduce tree instead of joining them."""
+    return config['modes'].get(current_mode, {}).get('strategy', 'concat') == 'map_reduce'
 
-        llm_response = ''
-        # Process chunks for each mode
-        for idx, chunk in enumerate(text_chunks):
-            print(f'Processing chunk {idx + 1} of {len(text_chunks)} for mode "{current_mode}"')
-            messages = [
-                {
-                    'role': 'system',
-                    'content': f"{prompt_content}. Please don't add outro or intro to your response"
-                },
-                {
-                    'role': 'user',
-                    'content': chunk
-                }
-            ]
+def get_reduce_options(config, current_mode):
+    """Return the reduce prompt, fan-in, token budget and token counter of a map-reduce mode."""
+    mode_config = config['modes'][current_mode]
+    budget = int(int(config['default']['max_tokens']) * float(config['default'].get('chunk_fill_ratio', '1')))
+    return (mode_config.get('reduce_prompt', mode_config.get('prompt', '')), int(mode_config.get('fan_in', '4')),
+            budget, get_token_counter(config['default']['model']))
 
+def commit_mode_output(client, journal, current_mode, mode_output_file, fingerprint, request_keys, config, cache=None):
+    """Write a mode's output file once every chunk is journaled, otherwise report the gaps."""
+    if not is_map_reduce(config, current_mode):
+        missing = journal.commit(mode_output_file, request_keys, config['default'].get('encoding', 'utf-8'))
+        if missing:
+            report_missing_chunks(mode_output_file, missing, len(request_keys))
+        else:
+            record_output(mode_output_file, fingerprint)
+            print(f'File {mode_output_file} created successfully.')
+        return
+
+    missing = journal.missing_chunks(request_keys)
+    if missing:
+        report_missing_chunks(mode_output_file, missing, len(request_keys))
+        return
+    try:
+        parts = [journal.read_response(idx) for idx in range(len(request_keys))]
+    except Exception as e:
+        print(f'Error reducing the results of mode "{current_mode}" for {mode_output_file}: {e}')
+        return
+    result = reduce_mode_results(client, parts, current_mode, mode_output_file, config, cache)
+    if result is None:
+        return
+    write_mode_output(mode_output_file, result + '\n', config, fingerprint)
+    journal.remove()
+
+def reduce_mode_results(client, parts, current_mode, mode_output_file, config, cache=None):
+    """Combine the chunk results of a map-reduce mode with its reduce tree, or return None if a request failed."""
+    reduce_prompt, fan_in, budget, count_tokens = get_reduce_options(config, current_mode)
+
+    def reduce_group(text):
+        # Every reduce request goes through the cache, so unchanged branches of the tree are reused
+        return complete_request(client, build_request(config, reduce_prompt, text), cache)
+
+    try:
+        return reduce_tree(parts, reduce_group, fan_in, budget, count_tokens, f'Reducing {mode_output_file.name}')
+    except Exception as e:
+        print(f'Error reducing the results of mode "{current_mode}" for {mode_output_file}: {e}')
+        return None
+
+async def commit_mode_output_async(client, journal, current_mode, mode_output_file, fingerprint, request_keys, config,
+                                   semaphore, cache=None):
+    """Write a mode's output file once every chunk is journaled, reducing the results concurrently."""
+    if not is_map_reduce(config, current_mode):
+        commit_mode_output(client, journal, current_mode, mode_output_file, fingerprint, request_keys, config, cache)
+        return
+
+    missing = journal.missing_chunks(request_keys)
+    if missing:
+        report_missing_chunks(mode_output_file, missing, len(request_keys))
+        return
+    reduce_prompt, fan_in, budget, count_tokens = get_reduce_options(config, current_mode)
+
+    async def reduce_group(text):
+        waited = time.perf_counter()
+        async with semaphore:
+            with tag_calls(queue_wait=time.perf_counter() - waited):
+                return await complete_request_async(client, build_request(config, reduce_prompt, text), cache)
+
+    try:
+        parts = [journal.read_response(idx) for idx in range(len(request_keys))]
+        result = await reduce_tree_async(parts, reduce_group, fan_in, budget, count_tokens,
+                                         f'Reducing {mode_output_file.name}')
+    except Exception as e:
+        print(f'Error reducing the results of mode "{current_mode}" for {mode_output_file}: {e}')
+        return
+    write_mode_output(mode_output_file, result + '\n', config, fingerprint)
+    journal.remove()
+
+def iter_text_chunks(text_file, config):
+    """Lazily read a text file and split it into chunks of whole paragraphs and sentences that fit the token budget."""
+    return iter_file_chunks(
+        text_file,
+        max_tokens=int(config['default']['max_tokens']),
+        model=config['default']['model'],
+        fill_ratio=float(config['default'].get('chunk_fill_ratio', '1')),
+        overlap_tokens=int(config['default'].get('chunk_overlap_tokens', '0')),
+        encoding=config['default'].get('encoding', 'utf-8')
+    )
+
+def open_cache(config):
+    """Open the persistent response cache configured in config.json."""
+    cache_config = config.get('cache', {})
+    return ResponseCache(
+        cache_config.get('path', './.llm_cache.sqlite'),
+        max_size_mb=cache_config.get('max_size_mb', '512')
+    )
+
+def complete_request(client, request, cache=None):
+    """Return the response text for a request, from the cache when possible."""
+    key = cache.make_key(request) if cache else None
+    if cache:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    with _metrics.track(request['model']):
+        response = client.chat.completions.create(**request)
+        content = response.choices[0].message.content
+        note_usage(response.usage, estimate_tokens(content or ''))
+    if cache:
+        cache.put(key, content)
+    return content
+
+async def complete_request_async(client, request, cache=None):
+    """Return the response text for a request, from the cache when possible."""
+    key = ResponseCache.make_key(request)
+    if cache:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    # Identical requests in flight at the same time, such as duplicate chunks, share one call
+    if key in _requests_in_flight:
+        return await asyncio.shield(_requests_in_flight[key])
+
+    async def call():
+        with _metrics.track(request['model']):
+            response = await client.chat.completions.create(**request)
+            content = response.choices[0].message.content
+            note_usage(response.usage, estimate_tokens(content or ''))
+        if cache:
+            cache.put(key, content)
+        return content
+
+    _requests_in_flight[key] = asyncio.ensure_future(call())
+    try:
+        return await asyncio.shield(_requests_in_flight[key])
+    finally:
+        _requests_in_flight.pop(key, None)
+
+def is_streaming(config):
+    """Return True if responses should be streamed to disk as they are generated."""
+    return str(config['default'].get('stream', 'false')).lower() == 'true'
+
+def report_stream(label, start, first_token_at, tokens):
+    """Print time-to-first-token and generation speed of a streamed response."""
+    end = time.perf_counter()
+    if first_token_at is None:
+        print(f'{label}: no tokens received after {end - start:.2f}s')
+        return
+    generation_time = end - first_token_at
+    tokens_per_second = tokens / generation_time if generation_time > 0 else float('inf')
+    print(f'{label}: first token after {first_token_at - start:.2f}s, '
+          f'{tokens} tokens at {tokens_per_second:.1f} tokens/s')
+
+def stream_request(client, request, writer, label):
+    """Stream a completion into writer piece by piece."""
+    start = time.perf_counter()
+    first_token_at, tokens, usage = None, 0, None
+    with _metrics.track(request['model']):
+        for event in client.chat.completions.create(**request, stream=True):
+            delta = event.choices[0].delta.content if event.choices else None
+            if delta:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                writer.write(delta)
+                tokens += 1
+            # Servers that report usage while streaming send it with the last event
+            usage = getattr(event, 'usage', None) or usage
+        note_usage(usage, tokens)
+    report_stream(label, start, first_token_at, tokens)
+
+async def stream_request_async(client, request, writer, label):
+    """Stream a completion into writer piece by piece."""
+    start = time.perf_counter()
+    first_token_at, tokens, usage = None, 0, None
+    with _metrics.track(request['model']):
+        async for event in await client.chat.completions.create(**request, stream=True):
+            delta = event.choices[0].delta.content if event.choices else None
+            if delta:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                writer.write(delta)
+                tokens += 1
+            # Servers that report usage while streaming send it with the last event
+            usage = getattr(event, 'usage', None) or usage
+        note_usage(usage, tokens)
+    report_stream(label, start, first_token_at, tokens)
+
+def complete_chunk(client, config, journal, idx, request, request_key, cache, label):
+    """Answer one chunk and record its response in the journal."""
+    if not is_streaming(config):
+        journal.record(idx, request_key, complete_request(client, request, cache))
+        return
+
+    cached = cache.get(request_key) if cache else None
+    if cached is not None:
+        journal.record(idx, request_key, cached)
+        return
+    writer = journal.open_response()
+    try:
+        stream_request(client, request, writer, label)
+    except BaseException:
+        writer.discard()
+        raise
+    journal.record_written(idx, request_key, writer)
+    if cache:
+        cache.put(request_key, journal.read_response(idx))
+
+async def complete_chunk_async(client, config, journal, idx, request, request_key, cache, label):
+    """Answer one chunk and record its response in the journal."""
+    if not is_streaming(config):
+        journal.record(idx, request_key, await complete_request_async(client, request, cache))
+        return
+
+    cached = cache.get(request_key) if cache else None
+    if cached is not None:
+        journal.record(idx, request_key, cached)
+        return
+    writer = journal.open_response()
+    try:
+        await stream_request_async(client, request, writer, label)
+    except BaseException:
+        writer.discard()
+        raise
+    journal.record_written(idx, request_key, writer)
+    if cache:
+        cache.put(request_key, journal.read_response(idx))
+
+def reuse_duplicate_response(shared, chunk_id, current_mode):
+    """Return the response of a duplicate chunk's representative, waiting for it if it is in flight, or None."""
+    if shared is None:
+        return None
+    response, waiter = shared.lookup(chunk_id, current_mode)
+    if response is None and waiter is not None:
+        waiter.wait()
+        response, _ = shared.lookup(chunk_id, current_mode)
+    if response is not None:
+        shared.reused()
+    return response
+
+async def reuse_duplicate_response_async(shared, chunk_id, current_mode):
+    """Return the response of a duplicate chunk's representative, waiting for it if it is in flight, or None."""
+    if shared is None:
+        return None
+    response, waiter = shared.lookup(chunk_id, current_mode)
+    if response is None and waiter is not None:
+        await waiter.wait()
+        response, _ = shared.lookup(chunk_id, current_mode)
+    if response is not None:
+        shared.reused()
+    return response
+
+def process_file(client, text_file, config, mode, output_base_path, cache=None, shared=None):
+    """Process a single file using the API and write to the output, reusing the responses of duplicates from shared."""
+    pending_modes = get_pending_modes(text_file, config, mode, output_base_path)
+    if not pending_modes:
+        return
+    journals = [open_journal(text_file, current_mode, output_base_path) for current_mode, _, _, _ in pending_modes]
+    request_keys = [[] for _ in pending_modes]
+
+    # Each chunk is read lazily and sent for every mode before the next one is read
+    for idx, chunk in enumerate(iter_text_chunks(text_file, config)):
+        chunk_id = (text_file.name, idx)
+        shares = shared is not None and shared.has_duplicates(chunk_id)
+        for (current_mode, prompt_content, _, _), journal, keys in zip(pending_modes, journals, request_keys):
+            request = build_request(config, prompt_content, chunk)
+            request_key = ResponseCache.make_key(request)
+            keys.append(request_key)
+            # Skip the chunks a previous run already finished
+            if journal.is_complete(idx, request_key):
+                print(f'Chunk {idx + 1} for mode "{current_mode}" already done, skipping...')
+                if shares:
+                    shared.finish(chunk_id, current_mode, journal.read_response(idx))
+                continue
+            response = reuse_duplicate_response(shared, chunk_id, current_mode)
+            if response is not None:
+                print(f'Chunk {idx + 1} for mode "{current_mode}" is a duplicate, reusing its response')
+                journal.record(idx, request_key, response)
+                continue
+            print(f'Processing chunk {idx + 1} for mode "{current_mode}"')
+            if shares:
+                shared.start(chunk_id, current_mode, threading.Event())
+            response = None
             try:
-                response = client.chat.completions.create(
-                    model=config['default']['model'],
-                    messages=messages,
-                    temperature=float(config['default']['temperature']),
-                    max_tokens=max_input_tokens,
-                    top_p=float(config['default']['top_p']),
-                    frequency_penalty=float(config['default']['frequency_penalty']),
-                    presence_penalty=float(config['default']['presence_penalty'])
-                )
-                llm_response += response.choices[0].message.content + '\n'
+                label = f'{text_file.name} chunk {idx + 1} for mode "{current_mode}"'
+                with tag_calls(file=text_file.name, mode=current_mode, chunk=idx + 1):
+                    complete_chunk(client, config, journal, idx, request, request_key, cache, label)
+                if shares:
+                    response = journal.read_response(idx)
             except Exception as e:
                 print(f'Error processing chunk {idx + 1} for mode "{current_mode}": {e}')
+            finally:
+                if shares:
+                    shared.finish(chunk_id, current_mode, response)
+
+    # Write output for each mode
+    for (current_mode, _, mode_output_file, fingerprint), journal, keys in zip(pending_modes, journals, request_keys):
+        with tag_calls(file=text_file.name, mode=current_mode, chunk='reduce'):
+            commit_mode_output(client, journal, current_mode, mode_output_file, fingerprint, keys, config, cache)
+
+async def process_file_async(client, text_file, config, mode, output_base_path, semaphore, cache=None, shared=None):
+    """Process a single file by sending every (mode, chunk) request concurrently, reusing the responses of duplicates."""
+    pending_modes = get_pending_modes(text_file, config, mode, output_base_path)
+    if not pending_modes:
+        return
+    journals = [open_journal(text_file, current_mode, output_base_path) for current_mode, _, _, _ in pending_modes]
+    request_keys = [[] for _ in pending_modes]
+
+    async def complete_chunk(journal, current_mode, idx, request, request_key, waited):
+        chunk_id = (text_file.name, idx)
+        response = None
+        try:
+            print(f'Processing chunk {idx + 1} for mode "{current_mode}"')
+            try:
+                label = f'{text_file.name} chunk {idx + 1} for mode "{current_mode}"'
+                with tag_calls(file=text_file.name, mode=current_mode, chunk=idx + 1, queue_wait=waited):
+                    await complete_chunk_async(client, config, journal, idx, request, request_key, cache, label)
+                if shared is not None and shared.has_duplicates(chunk_id):
+                    response = journal.read_response(idx)
+            except Exception as e:
+                print(f'Error processing chunk {idx + 1} for mode "{current_mode}": {e}')
+        finally:
+            semaphore.release()
+            if shared is not None:
+                shared.finish(chunk_id, current_mode, response)
+
+    async def reuse_or_complete_chunk(journal, current_mode, idx, request, request_key):
+        # Waiting for the representative takes no slot, the representative may still need one
+        response = await reuse_duplicate_response_async(shared, (text_file.name, idx), current_mode)
+        if response is not None:
+            print(f'Chunk {idx + 1} for mode "{current_mode}" is a duplicate, reusing its response')
+            journal.record(idx, request_key, response)
+            return
+        waited = time.perf_counter()
+        await semaphore.acquire()
+        await complete_chunk(journal, current_mode, idx, request, request_key, time.perf_counter() - waited)
+
+    # The semaphore bounds the number of requests in flight across all files. A slot is taken
+    # before a request is dispatched, so chunks are only read as fast as requests complete.
+    tasks = []
+    for idx, chunk in enumerate(iter_text_chunks(text_file, config)):
+        chunk_id = (text_file.name, idx)
+        shares = shared is not None and shared.has_duplicates(chunk_id)
+        for (current_mode, prompt_content, _, _), journal, keys in zip(pending_modes, journals, request_keys):
+            request = build_request(config, prompt_content, chunk)
+            request_key = ResponseCache.make_key(request)
+            keys.append(request_key)
+            # Only the chunks missing from the journal are sent, the journal keeps them in chunk order
+            if journal.is_complete(idx, request_key):
+                if shares:
+                    shared.finish(chunk_id, current_mode, journal.read_response(idx))
+                continue
+            response, waiter = shared.lookup(chunk_id, current_mode) if shared is not None else (None, None)
+            if response is not None or waiter is not None:
+                tasks.append(asyncio.ensure_future(reuse_or_complete_chunk(journal, current_mode, idx, request,
+                                                                           request_key)))
+                continue
+            if shares:
+                shared.start(chunk_id, current_mode, asyncio.Event())
+            waited = time.perf_counter()
+            await semaphore.acquire()
+            tasks.append(asyncio.ensure_future(
+                complete_chunk(journal, current_mode, idx, request, request_key, time.perf_counter() - waited)
+            ))
+    await asyncio.gather(*tasks)
+
+    async def commit_mode(current_mode, mode_output_file, fingerprint, journal, keys):
+        with tag_calls(file=text_file.name, mode=current_mode, chunk='reduce'):
+            await commit_mode_output_async(client, journal, current_mode, mode_output_file, fingerprint, keys,
+                                           config, semaphore, cache)
+
+    await asyncio.gather(*[
+        commit_mode(current_mode, mode_output_file, fingerprint, journal, keys)
+        for (current_mode, _, mode_output_file, fingerprint), journal, keys in zip(pending_modes, journals, request_keys)
+    ])
+
+def get_batch_pending_modes(text_file, config, mode, output_base_path):
+    """Return the pending modes of a file that the LLM answers, leaving out the lda mode of the local topic model."""
+    return [pending for pending in get_pending_modes(text_file, config, mode, output_base_path)
+            if not is_local_lda(config, pending[0])]
+
+def iter_batch_requests(text_files, config, mode, output_base_path):
+    """Yield (custom_id, request) for every chunk of every mode that still needs an output."""
+    for text_file in text_files:
+        pending_modes = get_batch_pending_modes(text_file, config, mode, output_base_path)
+        if not pending_modes:
+            continue
+        for idx, chunk in enumerate(iter_text_chunks(text_file, config)):
+            for current_mode, prompt_content, _, _ in pending_modes:
+                yield make_custom_id(text_file.name, current_mode, idx), build_request(config, prompt_content, chunk)
+
+def get_map_reduce_modes(config, mode):
+    """Return the selected modes that combine their chunk results with a reduce tree."""
+    modes_to_process = list(config['modes'].keys()) if mode == "all" else [mode]
+    return [current_mode for current_mode in modes_to_process
+            if is_map_reduce(config, current_mode) and not is_local_lda(config, current_mode)]
+
+def export_batch(text_files, config, mode, output_base_path, batch_file):
+    """Write every pending (file, mode, chunk) request to a Batch API input file."""
+    count = write_batch_requests(iter_batch_requests(text_files, config, mode, output_base_path), batch_file)
+    print(f'Wrote {count} batch requests to {batch_file}')
+    map_reduce_modes = get_map_reduce_modes(config, mode)
+    if map_reduce_modes:
+        # Reduce requests depend on the map results, so they cannot be part of the same batch
+        print(f'The reduce step of modes {", ".join(map_reduce_modes)} runs against the API on --batch-import')
+
+def import_batch(text_files, config, mode, output_base_path, results_file, cache=None, client=None):
+    """
+    Assemble the per-mode output files from a Batch API results file.
+
+    The chunk results of map-reduce modes are combined with their reduce tree, whose
+    requests are sent with client and go through the cache like in a live run.
+    """
+    responses, errors = read_batch_results(results_file)
+    print(f'Read {len(responses)} responses and {len(errors)} errors from {results_file}')
+
+    for text_file in text_files:
+        pending_modes = get_batch_pending_modes(text_file, config, mode, output_base_path)
+        if not pending_modes:
+            continue
+        mode_custom_ids = [[] for _ in pending_modes]
+        for idx, chunk in enumerate(iter_text_chunks(text_file, config)):
+            for (current_mode, prompt_content, _, _), custom_ids in zip(pending_modes, mode_custom_ids):
+                custom_id = make_custom_id(text_file.name, current_mode, idx)
+                custom_ids.append(custom_id)
+                # Cached results are reused by a live run that retries the chunks missing from the batch
+                if cache and custom_id in responses:
+                    cache.put(cache.make_key(build_request(config, prompt_content, chunk)), responses[custom_id])
+
+        for (current_mode, _, mode_output_file, fingerprint), custom_ids in zip(pending_modes, mode_custom_ids):
+            missing = [custom_id for custom_id in custom_ids if custom_id not in responses]
+            if missing:
+                # Never write a partial file, it would hide the gap from the next run
+                for custom_id in missing:
+                    print(f'No result for {custom_id}: {errors.get(custom_id, "not in results file")}')
+                print(f'Skipping {mode_output_file}, {len(missing)} of {len(custom_ids)} chunks are missing')
                 continue
+            if not is_map_reduce(config, current_mode):
+                write_mode_output(mode_output_file, ''.join(responses[custom_id] + '\n' for custom_id in custom_ids),
+                                  config, fingerprint)
+                continue
+            with tag_calls(file=text_file.name, mode=current_mode, chunk='reduce'):
+                result = reduce_mode_results(client, [responses[custom_id] for custom_id in custom_ids], current_mode,
+                                             mode_output_file, config, cache)
+            if result is not None:
+                write_mode_output(mode_output_file, result + '\n', config, fingerprint)
+
+async def process_files_async(client, text_files, config, mode, output_base_path, max_in_flight, cache=None,
+                              shared=None):
+    """Process all files concurrently, keeping at most max_in_flight requests open."""
+    semaphore = asyncio.Semaphore(max_in_flight)
+    async with client:
+        await asyncio.gather(*[
+            process_file_async(client, text_file, config, mode, output_base_path, semaphore, cache, shared)
+            for text_file in text_files
+        ])
+
+def init_worker(backend, config, output_base_path, use_cache, cache=None, shared=None):
+    """Set up the client, cache and duplicate responses of a worker process, or of all worker threads."""
+    _worker_state['client'] = initialize_client(backend, config)
+    _worker_state['cache'] = cache if cache is not None else (open_cache(config) if use_cache else None)
+    _worker_state['config'] = config
+    _worker_state['output_base_path'] = output_base_path
+    _worker_state['shared'] = shared
+
+def run_job(job):
+    """Process one (file, mode) job in a worker and return how long it took, with the calls it made and avoided."""
+    started = time.perf_counter()
+    shared = _worker_state['shared']
+    process_file(_worker_state['client'], Path(job.path), _worker_state['config'], job.mode,
+                 _worker_state['output_base_path'], _worker_state['cache'], shared)
+    return time.perf_counter() - started, _metrics.drain(), shared.drain_saved() if shared else 0
+
+def collect_job_result(shared, result):
+    """Merge the call measurements of a finished job into this process's and return its elapsed time."""
+    elapsed, records, saved = result
+    _metrics.extend(records)
+    if shared is not None:
+        shared.reused(saved)
+    return elapsed
+
+def process_files_with_workers(text_files, config, mode, output_base_path, backend, max_workers, executor, cache,
+                               shared=None):
+    """Run every (file, mode) job of the directory from a global queue with a pool of workers."""
+    modes = list(config['modes'].keys()) if mode == "all" else [mode]
+    jobs = [job for job in build_jobs(text_files, modes)
+            if get_pending_modes(Path(job.path), config, job.mode, output_base_path, verbose=False)]
+    if not jobs:
+        print('Nothing to do, every output already exists.')
+        return
+    print(f'Running {len(jobs)} jobs with {max_workers} {executor} workers')
+    # Worker processes hand the responses of representative chunks to each other through a manager process
+    manager = Manager() if shared is not None and executor == 'process' else None
+    if manager:
+        shared.responses = manager.dict(shared.responses)
+    # Worker threads share this process's cache, worker processes open their own connection
+    initargs = (backend, config, output_base_path, cache is not None, cache if executor == 'thread' else None, shared)
+    try:
+        run_jobs(jobs, run_job, max_workers, executor, init_worker, initargs, partial(collect_job_result, shared))
+    finally:
+        if manager:
+            shared.responses = {}
+            manager.shutdown()
+
+def process_files(args, config, text_files, output_base_path, cache):
+    """Process the given text files with the selected engine."""
+    if args.batch_export:
+        export_batch(text_files, config, args.m, output_base_path, args.batch_export)
+        if is_local_lda(config, args.m):
+            print('The lda mode is computed by the local topic model, it is not part of the batch')
+        return
+
+    if args.batch_import:
+        if is_local_lda(config, args.m):
+            # The lda mode was not exported, the topic model writes it along with the imported modes
+            process_lda_locally(args, config, text_files, output_base_path, cache)
+        # Only map-reduce modes need the API, to reduce the imported chunk results
+        client = initialize_client(args.backend, config) if get_map_reduce_modes(config, args.m) else None
+        try:
+            import_batch(text_files, config, args.m, output_base_path, args.batch_import, cache, client)
+        finally:
+            if client:
+                print_endpoint_stats(client)
+                client.close()
+        return
+
+    if is_local_lda(config, args.m):
+        # The topic model answers the lda mode for every file at once, the LLM handles the other modes
+        process_lda_locally(args, config, text_files, output_base_path, cache)
+
+    # Runs where every output is up to date return before a client is built or the network is touched
+    text_files = [text_file for text_file in text_files
+                  if get_pending_modes(text_file, config, args.m, output_base_path, verbose=False)]
+    if not text_files:
+        print('Nothing to do, every output is up to date.')
+        return
+
+    if not is_dedup_enabled(config):
+        process_pending_files(args, config, text_files, output_base_path, cache)
+        return
+    shared, report = build_duplicate_index(text_files, config, args.m, output_base_path)
+    try:
+        process_pending_files(args, config, text_files, output_base_path, cache, shared)
+    finally:
+        write_dedup_report(report, shared.saved, output_base_path)
+
+def process_pending_files(args, config, text_files, output_base_path, cache, shared=None):
+    """Send the chunks of the given text files with the selected engine, reusing the responses of duplicates."""
+    if args.jobs:
+        process_files_with_workers(text_files, config, args.m, output_base_path, args.backend,
+                                   args.jobs, args.executor, cache, shared)
+        return
+
+    if args.use_async:
+        # Send every (file, mode, chunk) request at once, bounded by the in-flight limit
+        max_in_flight = args.max_in_flight or get_max_in_flight(args.backend, config)
+        client = initialize_async_client(args.backend, config)
+        print(f'Processing {len(text_files)} files with up to {max_in_flight} requests in flight')
+        asyncio.run(process_files_async(client, text_files, config, args.m, output_base_path, max_in_flight, cache,
+                                        shared))
+        print_endpoint_stats(client)
+        return
+
+    client = initialize_client(args.backend, config)
+
+    # Iterate through the text files and process them
+    try:
+        for text_file in text_files:
+            print(f'Processing file: {text_file}')
+            process_file(client, text_file, config, args.m, output_base_path, cache, shared)
+    finally:
+        print_endpoint_stats(client)
+        client.close()
+
+def is_dedup_enabled(config):
+    """Return True if duplicate chunks across the run should share one response."""
+    return str(config.get('dedup', {}).get('enabled', 'false')).lower() == 'true'
+
+def build_duplicate_index(text_files, config, mode, output_base_path):
+    """
+    Index the chunks of every file to process and route exact and near duplicates to one representative.
+
+    Returns the SharedResponses that hand each representative's responses to its
+    duplicates during the run, and the duplicate groups for the report.
+    """
+    dedup_config = config.get('dedup', {})
+    index = DuplicateIndex(
+        dedup_config.get('threshold', '0.9'), dedup_config.get('num_perm', '128'),
+        dedup_config.get('bands', '32'), dedup_config.get('shingle_words', '5')
+    )
+    for text_file in text_files:
+        if not get_pending_modes(text_file, config, mode, output_base_path, verbose=False):
+            continue
+        for idx, chunk in enumerate(iter_text_chunks(text_file, config)):
+            index.add((text_file.name, idx), chunk)
+
+    report = index.report()
+    print(f"Duplicate chunks: {report['exact_duplicates']} exact and {report['near_duplicates']} near duplicates "
+          f"of {report['chunks']} chunks")
+    return SharedResponses(index.representatives()), report
+
+def write_dedup_report(report, calls_saved, output_base_path):
+    """Write the duplicate groups of the run with the calls their shared responses actually avoided."""
+    report['calls_saved'] = calls_saved
+    report_file = output_base_path / 'dedup_report.json'
+    output_base_path.mkdir(parents=True, exist_ok=True)
+    write_file_atomically(report_file, [json.dumps(report, indent=2) + '\n'])
+    print(f'Duplicate chunks: {calls_saved} calls avoided by reusing responses (report in {report_file})')
+
+def is_local_lda(config, mode):
+    """Return True if the lda mode is computed with the local topic model instead of the LLM."""
+    return (mode in ('all', 'lda') and 'lda' in config['modes']
+            and config['modes']['lda'].get('engine', 'llm') == 'local')
+
+def label_topics(backend, config, topics, cache):
+    """Ask the LLM for a short title of every topic, from its top words."""
+    label_prompt = config['modes']['lda'].get('label_prompt', '')
+    client = initialize_client(backend, config)
+    labels = []
+    try:
+        for topic, words in enumerate(topics):
+            with tag_calls(mode='lda', chunk=f'label {topic + 1}'):
+                label = complete_request(client, build_request(config, label_prompt, ', '.join(words)), cache)
+            labels.append(label.strip().strip('#').strip() or ', '.join(words[:3]))
+    finally:
+        client.close()
+    return labels
+
+def process_lda_locally(args, config, text_files, output_base_path, cache):
+    """
+    Fit one topic model over the corpus of the files of the run and write their lda outputs.
+
+    The corpus is every text file of the directory, so the outputs of files outside the run
+    that a change of the corpus made stale are rewritten as well.
+    """
+    corpus = sorted({corpus_file for text_file in text_files for corpus_file in get_lda_corpus(text_file)})
+    pending = [(text_file, mode_output_file, fingerprint)
+               for text_file in corpus
+               for _, _, mode_output_file, fingerprint in get_pending_modes(text_file, config, 'lda', output_base_path,
+                                                                           verbose=False)]
+    if not pending:
+        return
+    try:
+        from topic_model import fit_corpus, format_topics
+    except ImportError:
+        print('The local lda engine needs numpy (pip install numpy), using the LLM instead')
+        return
+
+    lda_config = config['modes']['lda']
+    encoding = config['default'].get('encoding', 'utf-8')
+    started = time.perf_counter()
+    # Every file is streamed paragraph by paragraph, only the tokens of its segments are kept
+    texts = [iter_stream_paragraphs(iter_text_blocks(text_file, encoding)) for text_file in corpus]
+    try:
+        model, vocabulary, weights = fit_corpus(
+            texts, num_topics=lda_config.get('num_topics', '8'), segment_words=lda_config.get('segment_words', '200'),
+            passes=int(lda_config.get('passes', '5')), seed=int(lda_config.get('seed', '0'))
+        )
+    except ValueError as e:
+        print(f'Could not fit the local topic model ({e}), using the LLM instead')
+        return
+    topics = model.top_words(vocabulary, int(lda_config.get('top_words', '10')))
+    print(f'Fitted {model.num_topics} topics over {len(corpus)} files ({len(vocabulary)} words) '
+          f'in {time.perf_counter() - started:.1f}s')
+
+    labels = None
+    if str(lda_config.get('label_topics', 'false')).lower() == 'true':
+        labels = label_topics(args.backend, config, topics, cache)
+    positions = {text_file: i for i, text_file in enumerate(corpus)}
+    for text_file, mode_output_file, fingerprint in pending:
+        write_mode_output(mode_output_file, format_topics(topics, weights[positions[text_file]], labels), config,
+                          fingerprint)
+
+def get_prices(config):
+    """Return the (prompt, completion) prices per million tokens of the configured model, or None if unknown."""
+    prices = config.get('pricing', {}).get('models', {}).get(config['default']['model'])
+    if not prices:
+        return None
+    return float(prices.get('prompt', '0')), float(prices.get('completion', '0'))
+
+def plan_file(text_file, config, mode, output_base_path, cache=None, planned=None):
+    """Return what would run or be skipped for every mode of a file, with the requests and tokens it would take."""
+    modes_to_process = list(config['modes'].keys()) if mode == "all" else [mode]
+    planned = set() if planned is None else planned
+    rows, pending = [], []
+    for current_mode in modes_to_process:
+        file_extension = config['modes'].get(current_mode, {}).get('file_extension', 'txt')
+        mode_output_file = output_base_path / current_mode / text_file.with_suffix(f'.{file_extension}').name
+        needed, reason = get_output_status(text_file, config, current_mode, mode_output_file)
+        row = {'file': text_file.name, 'mode': current_mode, 'action': 'run' if needed else 'skip', 'reason': reason,
+               'chunks': 0, 'requests': 0, 'cached': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+        rows.append(row)
+        if needed and is_local_lda(config, current_mode):
+            row['reason'] += ', local topic model'
+        elif needed:
+            pending.append((row, config['modes'][current_mode].get('prompt', '')))
+    if not pending:
+        return rows
+
+    count_tokens = get_token_counter(config['default']['model'])
+    max_tokens = int(config['default']['max_tokens'])
+    completion_ratio = float(config.get('pricing', {}).get('completion_ratio', '0.25'))
+    # Tokens of the system message every request of a mode sends along with its chunk
+    prompt_tokens = [count_tokens(build_request(config, prompt_content, '')['messages'][0]['content'])
+                     for _, prompt_content in pending]
+    parts = [[] for _ in pending]  # Estimated tokens of every map result, to plan the reduce tree
+    for chunk in iter_text_chunks(text_file, config):
+        chunk_tokens = count_tokens(chunk)
+        completion_tokens = min(max_tokens, max(1, round(chunk_tokens * completion_ratio)))
+        for i, (row, prompt_content) in enumerate(pending):
+            row['chunks'] += 1
+            row['requests'] += 1
+            parts[i].append(completion_tokens)
+            if cache:
+                key = cache.make_key(build_request(config, prompt_content, chunk))
+                if key in planned or cache.contains(key):
+                    row['cached'] += 1  # Answered from the cache, no tokens spent
+                    continue
+                planned.add(key)
+            row['prompt_tokens'] += prompt_tokens[i] + chunk_tokens
+            row['completion_tokens'] += completion_tokens
+
+    for (row, _), mode_parts in zip(pending, parts):
+        if not is_map_reduce(config, row['mode']) or len(mode_parts) < 2:
+            continue
+        reduce_prompt, fan_in, budget, _ = get_reduce_options(config, row['mode'])
+        # A reduced group is assumed to be about as long as the average map result
+        result_tokens = round(sum(mode_parts) / len(mode_parts))
+        reduce_requests = estimate_tree(mode_parts, fan_in, budget, result_tokens)
+        row['requests'] += len(reduce_requests)
+        row['prompt_tokens'] += sum(reduce_requests) + len(reduce_requests) * count_tokens(reduce_prompt)
+        row['completion_tokens'] += len(reduce_requests) * result_tokens
+    return rows
+
+def format_cost(prices, prompt_tokens, completion_tokens):
+    """Format the estimated cost of a number of tokens, or nothing if the model has no price."""
+    if prices is None:
+        return ''
+    return f', ${(prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000:.4f}'
+
+def plan_files(args, config, text_files, output_base_path, cache=None):
+    """Print what a run would compute or skip, and the requests, tokens and cost it would take, without calling the API."""
+    prices = get_prices(config)
+    totals = {}
+    planned = set()  # Keys of the requests already counted, repeated ones will be answered by the cache
+    model = config['default']['model']
+    print(f"Plan for {len(text_files)} files with model {model}, counting tokens with {describe_token_counter(model)}:")
+    for text_file in text_files:
+        for row in plan_file(text_file, config, args.m, output_base_path, cache, planned):
+            if row['action'] == 'skip':
+                print(f"  skip {row['file']} [{row['mode']}]: {row['reason']}")
+                continue
+            print(f"  run  {row['file']} [{row['mode']}]: {row['reason']}, {row['chunks']} chunks, "
+                  f"{row['requests']} requests ({row['cached']} cached), {row['prompt_tokens']} prompt and "
+                  f"~{row['completion_tokens']} completion tokens"
+                  f"{format_cost(prices, row['prompt_tokens'], row['completion_tokens'])}")
+            total = totals.setdefault(row['mode'], Counter())
+            total.update({key: row[key] for key in ('requests', 'cached', 'prompt_tokens', 'completion_tokens')})
+            total['outputs'] += 1
+
+    grand_total = sum(totals.values(), Counter())
+    for current_mode, total in [*totals.items(), ('total', grand_total)]:
+        print(f"{current_mode}: {total['outputs']} outputs, {total['requests']} requests ({total['cached']} cached), "
+              f"{total['prompt_tokens']} prompt and ~{total['completion_tokens']} completion tokens"
+              f"{format_cost(prices, total['prompt_tokens'], total['completion_tokens'])}")
+    if prices is None:
+        print(f"No price for model {config['default']['model']} in the pricing section of config.json, cost not estimated")
+    return grand_total
+
+def run_incremental(args, config, text_files, output_base_path, cache):
+    """Process only the outputs that are missing or whose input, prompt, model or parameters changed."""
+    get_manifest(output_base_path, reload=True)
+    _corpus_hashes.clear()  # Files may have been added or changed since the last run of a --watch loop
+    if report_incremental(text_files, config, args.m, output_base_path):
+        process_files(args, config, text_files, output_base_path, cache)
+    get_manifest(output_base_path).compact()
+
+def watch_files(args, config, process_path, output_base_path, cache):
+    """Poll process_path and incrementally process new or changed text files until interrupted."""
+    config['default']['incremental'] = 'true'
+    seen = {}  # (size, mtime) of every file as of the last time it was processed
+    candidates = {}  # (size, mtime) of changed files as of the previous poll
+    print(f'Watching {process_path} every {args.interval:g}s, press Ctrl+C to stop')
+    try:
+        while True:
+            current = {}
+            for text_file in sorted(process_path.glob('*.txt')):
+                try:
+                    stat = text_file.stat()
+                except FileNotFoundError:
+                    continue
+                current[text_file] = (stat.st_size, stat.st_mtime_ns)
+
+            # Only pick up files that did not change between two polls, so half-written files are left alone
+            ready = [text_file for text_file, signature in current.items()
+                     if seen.get(text_file) != signature and candidates.get(text_file) == signature]
+            candidates = {text_file: signature for text_file, signature in current.items()
+                          if seen.get(text_file) != signature}
+            if ready:
+                run_incremental(args, config, ready, output_base_path, cache)
+                for text_file in ready:
+                    seen[text_file] = current[text_file]
+                    candidates.pop(text_file, None)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print('Stopped watching.')
+
+def write_run_report(args, output_base_path):
+    """Write the latency, throughput and error report of the completion calls made during the run."""
+    report_file = Path(args.report) if args.report else output_base_path / 'run_report.json'
+    report = _metrics.report()
+    total = report['total']
+    if not total['calls']:
+        return
+    _metrics.write_report(report_file)
+    latency = total['latency_seconds']
+    print(f"Completion calls: {total['calls']} calls, {total['errors']} errors, {total['retries']} retries, "
+          f"{total['prompt_tokens']} prompt and {total['completion_tokens']} completion tokens, "
+          f"latency p50 {latency['p50']:.2f}s p95 {latency['p95']:.2f}s p99 {latency['p99']:.2f}s")
+    print(f'Run report written to {report_file}')
+    if args.prometheus:
+        _metrics.write_prometheus(args.prometheus)
+        print(f'Prometheus metrics written to {args.prometheus}')
 
-        # Write output for each mode
-        with open(mode_output_file, 'w', encoding=config['default'].get('encoding', 'utf-8')) as file:
-            file.write(llm_response)
-        print(f'File {mode_output_file} created successfully.')
-        
 def main():
     # Initialize argument parser
     parser = argparse.ArgumentParser(description='Process files using OpenAI API or compatible local API.')
     parser.add_argument('--f', type=str, help='Processing path', default='./txt')
     parser.add_argument('--m', type=str, help='Processing Mode (ent,sum,ssm,lda,que,map)', default='all')
     parser.add_argument('--output', type=str, help='Base output path', default='./output')
+    parser.add_argument('--backend', type=str, choices=['ollama', 'openai'], help='API backend to use', default='ollama')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='Send all chunk requests concurrently')
+    parser.add_argument('--max-in-flight', type=int, help='Maximum concurrent requests (overrides config.json)', default=None)
+    parser.add_argument('--jobs', type=int, help='Process (file, mode) jobs with this many workers', default=None)
+    parser.add_argument('--executor', type=str, choices=['process', 'thread'], help='Worker type used with --jobs', default='process')
+    parser.add_argument('--stream', action='store_true', help='Stream responses to disk as they are generated')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the response cache')
+    parser.add_argument('--batch-export', type=str, help='Write pending requests to this Batch API JSONL file instead of calling the API', default=None)
+    parser.add_argument('--batch-import', type=str, help='Build the output files from this Batch API results JSONL file', default=None)
+    parser.add_argument('--incremental', action='store_true', help='Also recompute outputs whose input, prompt, model or parameters changed')
+    parser.add_argument('--watch', action='store_true', help='Keep polling the processing path and process new or changed files')
+    parser.add_argument('--interval', type=float, help='Seconds between two polls with --watch', default=10.0)
+    parser.add_argument('--lda-engine', type=str, choices=['llm', 'local'], help='Compute the lda mode with the LLM or a local topic model (overrides config.json)', default=None)
+    parser.add_argument('--dedup', action='store_true', help='Send exact and near-duplicate chunks across the run only once')
+    parser.add_argument('--report', type=str, help='Path of the JSON run report (default: <output>/run_report.json)', default=None)
+    parser.add_argument('--plan', action='store_true', help='List what would run or be skipped with its estimated tokens and cost, without calling the API')
+    parser.add_argument('--prometheus', type=str, help='Also write the run metrics to this Prometheus text file', default=None)
 
     # Parse the arguments
     args = parser.parse_args()
     print(args)
 
-    # Load configuration and initialize client
+    # Load configuration
     config = load_config()
-    client = initialize_client("ollama", config)
+    if args.stream:
+        config['default']['stream'] = 'true'
+    if args.incremental:
+        config['default']['incremental'] = 'true'
+    if args.lda_engine and 'lda' in config['modes']:
+        config['modes']['lda']['engine'] = args.lda_engine
+    if args.dedup:
+        config.setdefault('dedup', {})['enabled'] = 'true'
 
     # Validate and set paths
     process_path = Path(args.f)
@@ -114,10 +1151,23 @@ def main():
 
     print(f'Processing files in {process_path} and outputting to {output_base_path}')
 
-    # Iterate through the text files and process them
-    for text_file in process_path.glob(f'*.txt'):
-        print(f'Processing file: {text_file}')
-        process_file(client, text_file, config, args.m, output_base_path)
+    cache = None if args.no_cache else open_cache(config)
+    try:
+        if args.plan:
+            plan_files(args, config, sorted(process_path.glob('*.txt')), output_base_path, cache)
+        elif args.watch:
+            watch_files(args, config, process_path, output_base_path, cache)
+        elif is_incremental(config):
+            run_incremental(args, config, sorted(process_path.glob('*.txt')), output_base_path, cache)
+        else:
+            process_files(args, config, sorted(process_path.glob('*.txt')), output_base_path, cache)
+    finally:
+        write_run_report(args, output_base_path)
+        if cache:
+            stats = cache.stats()
+            print(f"Response cache: {stats['hits']} hits, {stats['misses']} misses, "
+                  f"{stats['evictions']} evictions, {stats['entries']} entries ({stats['size_bytes']} bytes)")
+            cache.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+import asyncio
+import random
+import re
+import threading
+import time
+import types
+
+from chunker import estimate_tokens
+from metrics import note_queue_wait, note_retry
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {'APITimeoutError', 'APIConnectionError'}
+CONCURRENCY_POLL_INTERVAL = 0.05  # Seconds to wait when every concurrency slot is taken
+DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+def parse_duration(value):
+    """Parse a rate limit reset duration such as '1s', '6m0s' or '20ms' into seconds."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+def estimate_request_tokens(request):
+    """Estimate how many tokens a request counts against a tokens-per-minute limit."""
+    prompt_tokens = sum(estimate_tokens(message.get('content') or '') for message in request.get('messages', []))
+    return prompt_tokens + int(request.get('max_tokens') or 0)
+
+def is_retryable(error, retry_connection_errors=True):
+    """Return True for throttling, timeouts and transient server errors."""
+    if getattr(error, 'status_code', None) in RETRYABLE_STATUS_CODES:
+        return True
+    return retry_connection_errors and type(error).__name__ in RETRYABLE_ERRORS
+
+def error_headers(error):
+    """Return the response headers attached to an API error, if any."""
+    response = getattr(error, 'response', None)
+    return getattr(response, 'headers', None) or {}
+
+class TokenBucket:
+    """A bucket refilled continuously at rate_per_minute, never holding more than one minute's worth."""
+
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.rate = self.capacity / 60.0
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self.reset_at = None  # When the server said the bucket is full again, if sooner than the refill
+
+    def _refill(self, now):
+        if self.reset_at is not None and now >= self.reset_at:
+            self.available = self.capacity
+            self.reset_at = None
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Return how long to wait until amount can be taken from the bucket."""
+        self._refill(now)
+        # A single request larger than the bucket is let through once the bucket is full
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        wait = (amount - self.available) / self.rate
+        if self.reset_at is not None:
+            wait = min(wait, self.reset_at - now)
+        return wait
+
+    def take(self, amount):
+        self.available -= amount
+
+    def update(self, limit, remaining, reset, now):
+        """Align the bucket with the limits reported by the server."""
+        if limit:
+            self.capacity = float(limit)
+            self.rate = self.capacity / 60.0
+        if remaining is not None:
+            self._refill(now)
+            self.available = min(self.available, float(remaining))
+            if reset and self.available < 1:
+                # The server told us exactly when the window opens again; the refill rate stays the configured one
+                self.reset_at = now + reset
+
+class RateLimitScheduler:
+    """
+    Client side scheduler that tracks requests/min and tokens/min and adapts concurrency.
+
+    Every request reserves one request and its estimated tokens from the buckets. The
+    buckets follow the x-ratelimit-* headers returned by the server. Concurrency grows by
+    one slot per window of successful requests and is halved whenever the server throttles.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, max_concurrency=16,
+                 min_concurrency=1, max_retries=6, base_delay=1.0, max_delay=60.0, retry_connection_errors=True):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.min_concurrency = max(1, min(int(min_concurrency), self.max_concurrency))
+        self.concurrency = float(self.max_concurrency)
+        self.max_retries = int(max_retries)
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        # Behind a backend pool, failing over to another endpoint beats retrying a dead one
+        self.retry_connection_errors = retry_connection_errors
+        self.in_flight = 0
+        self.throttled = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens):
+        """Reserve a slot for a request, or return how many seconds to wait before trying again."""
+        with self._lock:
+            if self.in_flight >= int(self.concurrency):
+                return CONCURRENCY_POLL_INTERVAL
+            now = time.monotonic()
+            wait = 0.0
+            if self.requests:
+                wait = max(wait, self.requests.wait_time(1, now))
+            if self.tokens:
+                wait = max(wait, self.tokens.wait_time(tokens, now))
+            if wait > 0:
+                return wait
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(min(tokens, self.tokens.capacity))
+            self.in_flight += 1
+            return 0.0
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _update_buckets(self, headers):
+        now = time.monotonic()
+        for bucket, kind in ((self.requests, 'requests'), (self.tokens, 'tokens')):
+            limit = headers.get(f'x-ratelimit-limit-{kind}')
+            remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+            if limit is None and remaining is None:
+                continue
+            if bucket is None:
+                if not limit:
+                    continue
+                # Start tracking a limit the server announced but the config did not set
+                bucket = TokenBucket(float(limit))
+                setattr(self, kind, bucket)
+            bucket.update(
+                float(limit) if limit else None,
+                float(remaining) if remaining is not None else None,
+                parse_duration(headers.get(f'x-ratelimit-reset-{kind}')),
+                now
+            )
+
+    def on_success(self, headers):
+        """Record a successful request and slowly raise concurrency."""
+        with self._lock:
+            self._update_buckets(headers or {})
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1.0 / self.concurrency)
+
+    def on_throttle(self, headers):
+        """Record a throttled request and halve concurrency."""
+        with self._lock:
+            self._update_buckets(headers or {})
+            self.throttled += 1
+            self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+
+    def backoff_delay(self, attempt, headers):
+        """Return the jittered exponential backoff for a retry, honouring retry-after."""
+        with self._lock:
+            self.retries += 1
+        retry_after = headers.get('retry-after-ms')
+        if retry_after is not None:
+            return float(retry_after) / 1000 + random.uniform(0, self.base_delay)
+        retry_after = parse_duration(headers.get('retry-after'))
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.base_delay)
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def stats(self):
+        return {
+            'concurrency': int(self.concurrency),
+            'throttled': self.throttled,
+            'retries': self.retries,
+        }
+
+class RateLimitedClient:
+    """Wrap an OpenAI client so every chat completion goes through a RateLimitScheduler."""
+
+    def __init__(self, client, scheduler):
+        self._client = client
+        self.scheduler = scheduler
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create))
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _acquire(self, tokens):
+        waited = time.perf_counter()
+        while True:
+            wait = self.scheduler.try_acquire(tokens)
+            if not wait:
+                note_queue_wait(time.perf_counter() - waited)
+                return
+            time.sleep(wait)
+
+    def _stream(self, stream):
+        # Hold the slot until the whole response has been received
+        try:
+            yield from stream
+        finally:
+            self.scheduler.release()
+
+    def create(self, **request):
+        tokens = estimate_request_tokens(request)
+        attempt = 0
+        while True:
+            self._acquire(tokens)
+            try:
+                raw = self._client.chat.completions.with_raw_response.create(**request)
+                response = raw.parse()
+            except Exception as e:
+                self.scheduler.release()
+                if (not is_retryable(e, self.scheduler.retry_connection_errors)
+                        or attempt >= self.scheduler.max_retries):
+                    raise
+                headers = error_headers(e)
+                if getattr(e, 'status_code', None) == 429:
+                    self.scheduler.on_throttle(headers)
+                delay = self.scheduler.backoff_delay(attempt, headers)
+                print(f'Request failed ({e.__class__.__name__}), retrying in {delay:.1f}s '
+                      f'(attempt {attempt + 1} of {self.scheduler.max_retries})')
+                attempt += 1
+                note_retry()
+                time.sleep(delay)
+                continue
+
+            self.scheduler.on_success(raw.headers)
+            if request.get('stream'):
+                return self._stream(response)
+            self.scheduler.release()
+            return response
+
+class AsyncRateLimitedClient:
+    """Wrap an AsyncOpenAI client so every chat completion goes through a RateLimitScheduler."""
+
+    def __init__(self, client, scheduler):
+        self._client = client
+        self.scheduler = scheduler
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create))
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    async def __aenter__(self):
+        await self._client.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await self._client.__aexit__(*exc_info)
+
+    async def _acquire(self, tokens):
+        waited = time.perf_counter()
+        while True:
+            wait = self.scheduler.try_acquire(tokens)
+            if not wait:
+                note_queue_wait(time.perf_counter() - waited)
+                return
+            await asyncio.sleep(wait)
+
+    async def _stream(self, stream):
+        # Hold the slot until the whole response has been received
+        try:
+            async for event in stream:
+                yield event
+        finally:
+            self.scheduler.release()
+
+    async def create(self, **request):
+        tokens = estimate_request_tokens(request)
+        attempt = 0
+        while True:
+            await self._acquire(tokens)
+            try:
+                raw = await self._client.chat.completions.with_raw_response.create(**request)
+                response = raw.parse()
+            except Exception as e:
+                self.scheduler.release()
+                if (not is_retryable(e, self.scheduler.retry_connection_errors)
+                        or attempt >= self.scheduler.max_retries):
+                    raise
+                headers = error_headers(e)
+                if getattr(e, 'status_code', None) == 429:
+                    self.scheduler.on_throttle(headers)
+                delay = self.scheduler.backoff_delay(attempt, headers)
+                print(f'Request failed ({e.__class__.__name__}), retrying in {delay:.1f}s '
+                      f'(attempt {attempt + 1} of {self.scheduler.max_retries})')
+                attempt += 1
+                note_retry()
+                await asyncio.sleep(delay)
+                continue
+
+            self.scheduler.on_success(raw.headers)
+            if request.get('stream'):
+                return self._stream(response)
+            self.scheduler.release()
+            return response
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+import json
+import os
+import re
+import struct
+import threading
+import zlib
+
+from ocr_text import orjson, parse_response
+
+PACK_MAGIC = b'DAIPACK1'
+RECORD_HEADER = struct.Struct('<II')  # Page number and length of the compressed response that follows
+INDEX_ENTRY = struct.Struct('<IQI')  # Page number, offset and length of a compressed response in the pack
+LEGACY_RESPONSE_FILE = re.compile(r'^(.*)_page_(\d+)\.json$')
+COMPRESSION_LEVEL = 6
+
+def dump_response(response):
+    """Serialize a response compactly, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(response)
+    return json.dumps(response, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def prune_response(response):
+    """
+    Keep only the fields text extraction reads: the text, the text anchors of the
+    paragraphs and the detected languages of every page.
+
+    Layout geometry, blocks, lines, tokens and page images usually make up most of a
+    response and are dropped.
+    """
+    document = response.get('document', {})
+    pages = []
+    for page in document.get('pages', ()):
+        pruned_page = {key: page[key] for key in ('pageNumber', 'dimension', 'detectedLanguages') if key in page}
+        paragraphs = []
+        for paragraph in page.get('paragraphs', ()):
+            layout = paragraph.get('layout', {})
+            paragraphs.append({'layout': {'textAnchor': layout['textAnchor']} if 'textAnchor' in layout else {}})
+        pruned_page['paragraphs'] = paragraphs
+        pages.append(pruned_page)
+    pruned_document = {key: document[key] for key in ('mimeType', 'text') if key in document}
+    pruned_document['pages'] = pages
+    return {'document': pruned_document}
+
+class ResponsePack:
+    """
+    The saved page responses of one PDF: an append-only file of compressed responses and
+    an index of where every page starts.
+
+    The index is read on first use, then a page is loaded with one seek and one read,
+    without touching the others. A page saved again is appended and the index points to
+    the latest copy. Every record also carries its page number, so records written
+    after the last index update (e.g. by a run that was killed) are found by scanning
+    the end of the pack, and a truncated last record is overwritten by the next append.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + '.idx'
+        self._index = None
+        self._end = len(PACK_MAGIC)
+        self._lock = threading.Lock()
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        index = {}
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size < len(PACK_MAGIC):
+            self._index = index
+            return
+        entries = []
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as index_file:
+                content = index_file.read()
+            content = content[:len(content) - len(content) % INDEX_ENTRY.size]
+            entries = [entry for entry in INDEX_ENTRY.iter_unpack(content) if entry[1] + entry[2] <= size]
+        end = max((offset + length for _, offset, length in entries), default=len(PACK_MAGIC))
+        scanned = []
+        with open(self.path, 'rb') as pack:
+            if pack.read(len(PACK_MAGIC)) != PACK_MAGIC:
+                raise ValueError(f'{self.path} is not a response pack')
+            pack.seek(end)
+            while end + RECORD_HEADER.size <= size:
+                page_number, length = RECORD_HEADER.unpack(pack.read(RECORD_HEADER.size))
+                if end + RECORD_HEADER.size + length > size:
+                    break
+                scanned.append((page_number, end + RECORD_HEADER.size, length))
+                end += RECORD_HEADER.size + length
+                pack.seek(end)
+        for page_number, offset, length in entries + scanned:
+            index[page_number] = (offset, length)
+        if scanned:
+            with open(self.index_path, 'ab') as index_file:
+                index_file.write(b''.join(INDEX_ENTRY.pack(*entry) for entry in scanned))
+        self._index = index
+        self._end = end
+
+    def pages(self):
+        """Return the numbers of the saved pages, in order."""
+        with self._lock:
+            self._load_index()
+            return sorted(self._index)
+
+    def __contains__(self, page_number):
+        with self._lock:
+            self._load_index()
+            return page_number in self._index
+
+    def get(self, page_number):
+        """Return the saved response of a page, or None if there is none."""
+        with self._lock:
+            self._load_index()
+            location = self._index.get(page_number)
+        if location is None:
+            return None
+        offset, length = location
+        with open(self.path, 'rb') as pack:
+            pack.seek(offset)
+            return parse_response(zlib.decompress(pack.read(length)))
+
+    def append(self, page_number, response):
+        """Save the response of a page."""
+        payload = zlib.compress(dump_response(response), COMPRESSION_LEVEL)
+        with self._lock:
+            self._load_index()
+            exists = os.path.exists(self.path) and os.path.getsize(self.path) >= len(PACK_MAGIC)
+            mode = 'r+b' if exists else 'w+b'
+            with open(self.path, mode) as pack:
+                if mode == 'w+b':
+                    pack.write(PACK_MAGIC)
+                pack.seek(self._end)
+                pack.write(RECORD_HEADER.pack(page_number, len(payload)))
+                pack.write(payload)
+                pack.truncate()
+            offset = self._end + RECORD_HEADER.size
+            # The record is written before the index entry, so an interrupted append is at worst rescanned
+            with open(self.index_path, 'wb' if mode == 'w+b' else 'ab') as index_file:
+                index_file.write(INDEX_ENTRY.pack(page_number, offset, len(payload)))
+            self._index[page_number] = (offset, len(payload))
+            self._end = offset + len(payload)
+
+class ResponseStore:
+    """
+    The Document AI responses of a folder of PDFs, one ResponsePack per PDF, named after the PDF.
+
+    Page responses saved as <name>_page_N.json by earlier versions are still found and
+    loaded, and migrate() moves them into the packs. With prune, only the fields text
+    extraction reads are saved.
+    """
+
+    def __init__(self, folder, prune=False):
+        self.folder = folder
+        self.prune = prune
+        self._packs = {}
+        self._lock = threading.Lock()
+
+    def pack(self, name):
+        """Return the pack of the PDF called name (without its extension)."""
+        with self._lock:
+            if name not in self._packs:
+                self._packs[name] = ResponsePack(os.path.join(self.folder, f'{name}.pack'))
+            return self._packs[name]
+
+    def legacy_path(self, name, page_number):
+        """Return the path of a page response saved as a JSON file by earlier versions."""
+        return os.path.join(self.folder, f'{name}_page_{page_number}.json')
+
+    def contains(self, name, page_number):
+        """Return True if the response of a page is saved."""
+        return page_number in self.pack(name) or os.path.exists(self.legacy_path(name, page_number))
+
+    def get(self, name, page_number):
+        """Return the saved response of a page, or None if there is none."""
+        response = self.pack(name).get(page_number)
+        if response is None:
+            legacy_path = self.legacy_path(name, page_number)
+            if os.path.exists(legacy_path):
+                with open(legacy_path, 'rb') as json_file:
+                    response = parse_response(json_file.read())
+        return response
+
+    def put(self, name, page_number, response):
+        """Save the response of a page and return the path of its pack."""
+        pack = self.pack(name)
+        pack.append(page_number, prune_response(response) if self.prune else response)
+        return pack.path
+
+    def _legacy_files(self):
+        files = {}
+        for filename in os.listdir(self.folder):
+            match = LEGACY_RESPONSE_FILE.match(filename)
+            if match:
+                files.setdefault(match.group(1), {})[int(match.group(2))] = os.path.join(self.folder, filename)
+        return files
+
+    def names(self):
+        """Return the names of the PDFs with saved responses."""
+        if not os.path.isdir(self.folder):
+            return []
+        names = {filename[:-len('.pack')] for filename in os.listdir(self.folder) if filename.endswith('.pack')}
+        return sorted(names | set(self._legacy_files()))
+
+    def pages(self, name):
+        """Return the numbers of the saved pages of a PDF, in order."""
+        return sorted(set(self.pack(name).pages()) | set(self._legacy_files().get(name, {})))
+
+    def migrate(self, remove=True):
+        """
+        Move the page responses saved as JSON files into the packs and return the number
+        of files moved, their size and the size they take in the packs.
+
+        A file is only removed once its response has been read back from the pack.
+        """
+        moved, json_bytes = 0, 0
+        packs = set()
+        for name, files in sorted(self._legacy_files().items()):
+            pack = self.pack(name)
+            for page_number, path in sorted(files.items()):
+                if page_number not in pack:
+                    with open(path, 'rb') as json_file:
+                        self.put(name, page_number, parse_response(json_file.read()))
+                    if pack.get(page_number) is None:
+                        raise ValueError(f'Could not read back page {page_number} of {name} from {pack.path}')
+                json_bytes += os.path.getsize(path)
+                moved += 1
+                if remove:
+                    os.remove(path)
+            packs.add(pack.path)
+        pack_bytes = sum(os.path.getsize(path) + os.path.getsize(path + '.idx') for path in packs)
+        return moved, json_bytes, pack_bytes
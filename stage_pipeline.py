@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+import queue
+import threading
+import time
+
+_DONE = object()  # Tells a worker that its stage has no more input
+
+class Stage:
+    """
+    One step of a pipeline: a pool of worker threads applying function to every item of a bounded queue.
+
+    function takes an item and returns or yields the items for the next stage (None for
+    the last stage). Items are handed on as they are yielded, so a stage that produces
+    many large items from one input never holds more than the next queue allows.
+    """
+
+    def __init__(self, name, function, workers=1, queue_size=None):
+        self.name = name
+        self.function = function
+        self.workers = max(1, int(workers))
+        self.queue = queue.Queue(maxsize=int(queue_size or 2 * self.workers))
+        self.items = 0
+        self.outputs = 0
+        self.errors = 0
+        self.busy = 0.0  # Seconds spent running function
+        self.waiting = 0.0  # Seconds spent waiting for input
+        self.blocked = 0.0  # Seconds spent waiting for room in the next stage's queue
+        self._lock = threading.Lock()
+
+    def _record(self, waiting, busy=0.0, blocked=0.0, outputs=0, failed=False, processed=True):
+        with self._lock:
+            self.waiting += waiting
+            self.busy += busy
+            self.blocked += blocked
+            self.outputs += outputs
+            if failed:
+                self.errors += 1
+            elif processed:
+                self.items += 1
+
+    def stats(self, elapsed):
+        """Return the item counts of the stage and the share of its workers' time spent busy, waiting and blocked."""
+        capacity = self.workers * elapsed or 1
+        return {
+            'workers': self.workers,
+            'items': self.items,
+            'outputs': self.outputs,
+            'errors': self.errors,
+            'busy': self.busy / capacity,
+            'waiting': self.waiting / capacity,
+            'blocked': self.blocked / capacity,
+        }
+
+class Pipeline:
+    """
+    Run items through stages connected by bounded queues, each stage with its own workers.
+
+    A stage that falls behind fills its queue, which blocks the stage before it, so work
+    never piles up in memory between stages. The time every stage spends busy, waiting
+    for input and blocked on the next stage shows which one is the bottleneck: it is the
+    stage that is busy while the ones before it are blocked and the ones after it wait.
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self.elapsed = 0.0
+
+    def _work(self, index):
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            started = time.perf_counter()
+            item = stage.queue.get()
+            picked = time.perf_counter()
+            if item is _DONE:
+                stage._record(picked - started, processed=False)
+                return
+            blocked, outputs, failed = 0.0, 0, False
+            try:
+                for output in stage.function(item) or ():
+                    outputs += 1
+                    if next_stage is not None:
+                        put_started = time.perf_counter()
+                        next_stage.queue.put(output)
+                        blocked += time.perf_counter() - put_started
+            except Exception as e:
+                failed = True
+                print(f'Error in the {stage.name} stage: {type(e).__name__}: {e}')
+            busy = time.perf_counter() - picked - blocked
+            stage._record(picked - started, busy, blocked, outputs, failed)
+
+    def run(self, items):
+        """Feed items to the first stage and return once every stage has finished."""
+        started = time.perf_counter()
+        threads = []
+        for index, stage in enumerate(self.stages):
+            threads.append([threading.Thread(target=self._work, args=(index,), name=f'{stage.name}-{worker}', daemon=True)
+                            for worker in range(stage.workers)])
+            for thread in threads[-1]:
+                thread.start()
+
+        for item in items:
+            self.stages[0].queue.put(item)
+        # Stages are closed in order: a stage's input ends once every worker of the stage before it is done
+        for stage, stage_threads in zip(self.stages, threads):
+            for _ in stage_threads:
+                stage.queue.put(_DONE)
+            for thread in stage_threads:
+                thread.join()
+        self.elapsed = time.perf_counter() - started
+        return self.report()
+
+    def report(self):
+        """Return the stats of every stage, by name."""
+        return {stage.name: stage.stats(self.elapsed) for stage in self.stages}
+
+    def format_report(self):
+        """Format the stats of every stage as a table."""
+        lines = [f'Pipeline finished in {self.elapsed:.1f}s',
+                 f'{"stage":>10} {"workers":>8} {"items":>7} {"outputs":>8} {"errors":>7} {"busy":>6} {"waiting":>8} {"blocked":>8}']
+        for name, stats in self.report().items():
+            lines.append(f'{name:>10} {stats["workers"]:8d} {stats["items"]:7d} {stats["outputs"]:8d} {stats["errors"]:7d} '
+                         f'{stats["busy"]:6.0%} {stats["waiting"]:8.0%} {stats["blocked"]:8.0%}')
+        return '\n'.join(lines)
@@ -0,0 +1,114 @@
+import importlib.util
+import json
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import chunker
+from batch_api import make_custom_id
+from llm_cache import ResponseCache
+
+MODEL = 'test-model'
+
+def load_analyzer():
+    spec = importlib.util.spec_from_file_location('openai_text_analizer', ROOT / 'openai-text-analizer.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class FakeClient:
+    """Answer every completion with the numbered reduce of the text it was sent."""
+
+    def __init__(self):
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **request):
+        self.requests.append(request)
+        content = f'reduced {len(self.requests)}'
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                               usage=SimpleNamespace(prompt_tokens=1, completion_tokens=1))
+
+@pytest.fixture
+def analyzer(monkeypatch):
+    # Count tokens from the text length, the tokenizer files may not be available offline
+    monkeypatch.setitem(chunker._token_counters, MODEL, chunker.estimate_tokens)
+    return load_analyzer()
+
+def make_config(strategy):
+    return {
+        'default': {'model': MODEL, 'max_tokens': '20', 'temperature': '0', 'top_p': '1', 'frequency_penalty': '0',
+                    'presence_penalty': '0', 'encoding': 'utf-8', 'chunk_fill_ratio': '1'},
+        'modes': {'sum': {'prompt': 'Summarize', 'reduce_prompt': 'Combine', 'fan_in': '2', 'file_extension': 'sum',
+                          'strategy': strategy}},
+    }
+
+def write_results(analyzer, config, text_file, results_file, empty=()):
+    count = 0
+    with open(results_file, 'w', encoding='utf-8') as file:
+        for idx, _ in enumerate(analyzer.iter_text_chunks(text_file, config)):
+            # A tool call comes back without content
+            choice = {'message': {'content': None}, 'finish_reason': 'tool_calls'} if idx in empty else \
+                {'message': {'content': f'summary {idx}'}, 'finish_reason': 'stop'}
+            body = {'choices': [choice]}
+            result = {'custom_id': make_custom_id(text_file.name, 'sum', idx),
+                      'response': {'status_code': 200, 'body': body}}
+            file.write(json.dumps(result) + '\n')
+            count += 1
+    return count
+
+def make_input(tmp_path):
+    text_file = tmp_path / 'doc.txt'
+    text_file.write_text('\n\n'.join(f'Paragraph {i} has a few words of text to summarize.' for i in range(6)),
+                         encoding='utf-8')
+    return text_file
+
+def test_import_reduces_map_reduce_mode(analyzer, tmp_path):
+    config = make_config('map_reduce')
+    text_file = make_input(tmp_path)
+    results_file = tmp_path / 'results.jsonl'
+    chunks = write_results(analyzer, config, text_file, results_file)
+    assert chunks > 2
+    client = FakeClient()
+    cache = ResponseCache(tmp_path / 'cache.sqlite')
+    try:
+        analyzer.import_batch([text_file], config, 'sum', tmp_path / 'output', results_file, cache, client)
+
+        output = (tmp_path / 'output' / 'sum' / 'doc.sum').read_text(encoding='utf-8')
+        assert output == f'reduced {len(client.requests)}\n'
+        assert len(client.requests) == chunks - 1  # A fan-in of 2 reduces n parts in n - 1 requests
+        assert all(request['messages'][0]['content'].startswith('Combine') for request in client.requests)
+        assert all(cache.contains(cache.make_key(request)) for request in client.requests)
+    finally:
+        cache.close()
+
+def test_import_joins_concat_mode(analyzer, tmp_path):
+    config = make_config('concat')
+    text_file = make_input(tmp_path)
+    results_file = tmp_path / 'results.jsonl'
+    chunks = write_results(analyzer, config, text_file, results_file)
+    client = FakeClient()
+    analyzer.import_batch([text_file], config, 'sum', tmp_path / 'output', results_file, None, client)
+
+    output = (tmp_path / 'output' / 'sum' / 'doc.sum').read_text(encoding='utf-8')
+    assert output == ''.join(f'summary {idx}\n' for idx in range(chunks))
+    assert not client.requests
+
+def test_import_skips_results_without_content(analyzer, tmp_path):
+    config = make_config('concat')
+    text_file = make_input(tmp_path)
+    results_file = tmp_path / 'results.jsonl'
+    write_results(analyzer, config, text_file, results_file, empty={1})
+    cache = ResponseCache(tmp_path / 'cache.sqlite')
+    try:
+        analyzer.import_batch([text_file], config, 'sum', tmp_path / 'output', results_file, cache, FakeClient())
+
+        # The chunk without content is missing like a failed one, the mode's file is not written
+        assert not (tmp_path / 'output' / 'sum' / 'doc.sum').exists()
+        assert cache.stats()['entries'] == len(list(analyzer.iter_text_chunks(text_file, config))) - 1
+    finally:
+        cache.close()
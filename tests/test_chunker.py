@@ -0,0 +1,28 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import chunker
+
+def count_dense_tail(text):
+    # Text of x counts twice as many tokens per character as text of a
+    return (sum(2 if char == 'x' else 1 for char in text) + chunker.CHARS_PER_TOKEN - 1) // chunker.CHARS_PER_TOKEN
+
+def test_character_fallback_keeps_every_slice_within_budget():
+    text = 'a' * 200 + 'x' * 400  # No word boundary, and the first slice is the cheapest
+    chunks = list(chunker.pack_chunks([text], 10, count_dense_tail))
+
+    assert ''.join(chunks) == text
+    assert all(count_dense_tail(chunk) <= 10 for chunk in chunks)
+
+def test_token_counter_never_downloads(monkeypatch, tmp_path):
+    monkeypatch.setenv('TIKTOKEN_CACHE_DIR', str(tmp_path))  # An empty cache
+    monkeypatch.setattr(chunker, '_token_counters', {})
+    monkeypatch.setattr(chunker, '_token_counter_names', {})
+    if chunker.tiktoken is not None:
+        monkeypatch.setattr(chunker.tiktoken, 'get_encoding', lambda name: pytest.fail('tried to load an encoding'))
+
+    assert chunker.get_token_counter('gpt-4o') is chunker.estimate_tokens
@@ -0,0 +1,93 @@
+import asyncio
+import importlib.util
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import chunker
+
+MODEL = 'test-model'
+PARAGRAPHS = [f'Paragraph {word} has a few words of text to summarize.' for word in ('one', 'two', 'three', 'four')]
+
+def load_analyzer():
+    spec = importlib.util.spec_from_file_location('openai_text_analizer', ROOT / 'openai-text-analizer.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def make_response(request):
+    content = f"answer to {request['messages'][1]['content']}"
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                           usage=SimpleNamespace(prompt_tokens=1, completion_tokens=1))
+
+class FakeClient:
+    def __init__(self):
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **request):
+        self.requests.append(request)
+        return make_response(request)
+
+class FakeAsyncClient(FakeClient):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return None
+
+    async def create(self, **request):
+        self.requests.append(request)
+        await asyncio.sleep(0.01)
+        return make_response(request)
+
+@pytest.fixture
+def analyzer(monkeypatch):
+    # Count tokens from the text length, the tokenizer files may not be available offline
+    monkeypatch.setitem(chunker._token_counters, MODEL, chunker.estimate_tokens)
+    return load_analyzer()
+
+@pytest.fixture
+def text_files(tmp_path):
+    # Every paragraph is a chunk; the second file repeats two chunks of the first
+    files = []
+    for name, paragraphs in (('a.txt', PARAGRAPHS[:3]), ('b.txt', PARAGRAPHS[:2] + PARAGRAPHS[3:])):
+        files.append(tmp_path / name)
+        files[-1].write_text('\n\n'.join(paragraphs), encoding='utf-8')
+    return files
+
+def make_config():
+    return {
+        'default': {'model': MODEL, 'max_tokens': '20', 'temperature': '0', 'top_p': '1', 'frequency_penalty': '0',
+                    'presence_penalty': '0', 'encoding': 'utf-8', 'chunk_fill_ratio': '1'},
+        'modes': {'sum': {'prompt': 'Summarize', 'file_extension': 'sum'}},
+    }
+
+def test_duplicates_reuse_responses_without_cache(analyzer, text_files, tmp_path):
+    config = make_config()
+    output = tmp_path / 'output'
+    shared, report = analyzer.build_duplicate_index(text_files, config, 'sum', output)
+    assert report['exact_duplicates'] == 2
+    client = FakeClient()
+    for text_file in text_files:
+        analyzer.process_file(client, text_file, config, 'sum', output, None, shared)
+
+    assert len(client.requests) == 4
+    assert shared.saved == 2
+    assert (output / 'sum' / 'b.sum').read_text(encoding='utf-8') == \
+        ''.join(f'answer to {paragraph}\n' for paragraph in PARAGRAPHS[:2] + PARAGRAPHS[3:])
+
+def test_duplicates_wait_for_representatives_in_flight(analyzer, text_files, tmp_path):
+    config = make_config()
+    output = tmp_path / 'output'
+    shared, _ = analyzer.build_duplicate_index(text_files, config, 'sum', output)
+    client = FakeAsyncClient()
+    asyncio.run(analyzer.process_files_async(client, text_files, config, 'sum', output, 2, None, shared))
+
+    assert len(client.requests) == 4
+    assert shared.saved == 2
+    assert (output / 'sum' / 'b.sum').exists()
@@ -0,0 +1,44 @@
+import re
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+from map_reduce import PART_SEPARATOR, estimate_tree, reduce_tree
+
+def count_tokens(text):
+    return len(text.split())
+
+def run_tree(parts, fan_in=4, budget=1000):
+    requests = []
+
+    def reduce_group(text):
+        requests.append(text)
+        return f'r{len(text.split(PART_SEPARATOR))}:' + '+'.join(part.split()[0] for part in text.split(PART_SEPARATOR))
+
+    return reduce_tree(parts, reduce_group, fan_in, budget, count_tokens), requests
+
+def touches_first_window(request):
+    return any(name in ('p0', 'p1', 'p2', 'p3') for name in re.split(r'[\s:+]', request))
+
+def test_longer_chunk_only_recomputes_its_path():
+    parts = [f'p{i} ' + 'word ' * 10 for i in range(16)]
+    _, before = run_tree(parts, budget=35)
+    parts[1] = 'p1 ' + 'word ' * 30  # Now too long to share a request with the rest of its window
+    _, after = run_tree(parts, budget=35)
+
+    # The requests of the other three windows are sent again with the same text, so the cache answers them
+    others = [request for request in before if not touches_first_window(request)]
+    assert len(others) == 6
+    assert set(others) <= set(after)
+
+def test_windows_respect_the_budget():
+    parts = [f'p{i} ' + 'word ' * 10 for i in range(8)]
+    result, requests = run_tree(parts, fan_in=4, budget=25)
+    assert result
+    assert all(count_tokens(request) <= 25 for request in requests if not request.startswith('r'))
+
+def test_estimate_matches_the_tree():
+    parts = [f'p{i} ' + 'word ' * (5 + i) for i in range(11)]
+    _, requests = run_tree(parts, fan_in=3, budget=30)
+    assert len(estimate_tree([count_tokens(part) for part in parts], 3, 30, 1)) == len(requests)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+import codecs
+import mmap
+
+from chunker import PARAGRAPH_BREAK, get_token_counter, iter_paragraphs, pack_chunks
+
+BLOCK_SIZE = 1024 * 1024  # Bytes decoded at a time
+MAX_PARAGRAPH_CHARS = 4 * 1024 * 1024  # Longer runs of text without a blank line are cut at a line break
+
+def iter_text_blocks(path, encoding='utf-8', block_size=BLOCK_SIZE):
+    """
+    Yield the text of a file block by block from a memory map.
+
+    Bytes are decoded incrementally, so multi-byte characters split across blocks are
+    handled, and line endings are translated to '\\n' like open() does in text mode.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    with open(path, 'rb') as file:
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return  # Empty files cannot be mapped
+        with mapped:
+            pending_cr = False
+            for start in range(0, len(mapped), block_size):
+                text = decoder.decode(mapped[start:start + block_size])
+                if pending_cr:
+                    text = '\r' + text
+                # A '\r' at the end of a block may be the first half of a '\r\n'
+                pending_cr = text.endswith('\r')
+                if pending_cr:
+                    text = text[:-1]
+                if text:
+                    yield text.replace('\r\n', '\n').replace('\r', '\n')
+            text = decoder.decode(b'', final=True)
+            if pending_cr:
+                text = '\r' + text
+            if text:
+                yield text.replace('\r\n', '\n').replace('\r', '\n')
+
+def _cut_point(buffer):
+    """Return where a buffer can be cut so that no paragraph is split, or 0 if it cannot yet."""
+    # A break touching the end of the buffer may continue in the next block
+    last = None
+    for match in PARAGRAPH_BREAK.finditer(buffer):
+        if match.end() < len(buffer):
+            last = match
+    if last is not None:
+        return last.start()
+    if len(buffer) > MAX_PARAGRAPH_CHARS:
+        # Keep memory bounded on text without blank lines, such as some OCR dumps
+        cut = buffer.rfind('\n', 0, len(buffer) - 1)
+        if cut <= 0:
+            cut = max(buffer.rfind(' ', 0, len(buffer) - 1), 0)
+        return cut or len(buffer) - 1
+    return 0
+
+def iter_stream_paragraphs(blocks):
+    """Yield the paragraphs of a stream of text blocks, holding at most one paragraph and one block in memory."""
+    buffer = ''
+    for block in blocks:
+        buffer += block
+        cut = _cut_point(buffer)
+        if cut:
+            yield from iter_paragraphs(buffer[:cut])
+            buffer = buffer[cut:]
+    yield from iter_paragraphs(buffer)
+
+def iter_file_chunks(path, max_tokens, model, fill_ratio=1.0, overlap_tokens=0, encoding='utf-8'):
+    """
+    Lazily split a text file into chunks, like chunker.iter_chunks does for a string.
+
+    Only the paragraphs of the chunk being packed are held in memory, so the memory
+    used does not grow with the size of the file.
+    """
+    budget = max(1, int(max_tokens * fill_ratio))
+    paragraphs = iter_stream_paragraphs(iter_text_blocks(path, encoding))
+    return pack_chunks(paragraphs, budget, get_token_counter(model), overlap_tokens)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+import re
+from collections import Counter
+
+import numpy as np
+
+TOKEN = re.compile(r"[^\W\d_][^\W\d_'-]{2,}")
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below between
+both but by can could did do does doing down during each either else even ever every few for from further had
+has have having he her here hers herself him himself his how however i if in into is it its itself just least
+less like made make many may me might more most much must my myself neither never no nor not now of off often
+on once one only or other others our ours ourselves out over own per perhaps rather same shall she should since
+so some such than that the their theirs them themselves then there these they this those though through thus to
+too two under until up upon us very was we were what when where whether which while who whom whose why will
+with within without would yet you your yours yourself yourselves
+""".split())
+
+def tokenize(text):
+    """Return the lowercase words of a text that can carry a topic, without stopwords."""
+    return [word for word in TOKEN.findall(text.lower()) if word not in STOPWORDS]
+
+def iter_segments(pieces, segment_words):
+    """
+    Cut text read piece by piece, such as the paragraphs of a file, into documents of segment_words tokens.
+
+    Only the tokens of the segment being filled are held besides the current piece, so
+    the text itself is never loaded as a whole.
+    """
+    tokens = []
+    for piece in pieces:
+        tokens.extend(tokenize(piece))
+        while len(tokens) >= segment_words:
+            yield tokens[:segment_words]
+            tokens = tokens[segment_words:]
+    if tokens:
+        yield tokens
+
+def digamma(x):
+    """Digamma function for positive arrays, by recurrence and asymptotic expansion."""
+    x = np.asarray(x, dtype=np.float64)
+    result = np.zeros_like(x)
+    # Shift small arguments up to where the expansion is accurate
+    for _ in range(6):
+        small = x < 6
+        if not small.any():
+            break
+        result[small] -= 1 / x[small]
+        x = np.where(small, x + 1, x)
+    inverse_square = 1 / (x * x)
+    return result + np.log(x) - 0.5 / x - inverse_square * (
+        1 / 12 - inverse_square * (1 / 120 - inverse_square * (1 / 252 - inverse_square * (1 / 240 - inverse_square / 132))))
+
+def dirichlet_expectation(parameters):
+    """Return E[log x] for x ~ Dirichlet(parameters), row by row."""
+    if parameters.ndim == 1:
+        return digamma(parameters) - digamma(parameters.sum())
+    return digamma(parameters) - digamma(parameters.sum(axis=1))[:, np.newaxis]
+
+class SparseCounts:
+    """A document-term count matrix in compressed sparse row form."""
+
+    def __init__(self, documents, vocabulary):
+        index = {word: i for i, word in enumerate(vocabulary)}
+        indptr, indices, counts = [0], [], []
+        for document in documents:
+            for word, count in Counter(word for word in document if word in index).items():
+                indices.append(index[word])
+                counts.append(count)
+            indptr.append(len(indices))
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.indices = np.array(indices, dtype=np.int64)
+        self.counts = np.array(counts, dtype=np.float64)
+        self.shape = (len(documents), len(vocabulary))
+
+    def select(self, rows):
+        """Return (indptr, indices, counts) of the given rows."""
+        starts, ends = self.indptr[rows], self.indptr[np.asarray(rows) + 1]
+        lengths = ends - starts
+        indptr = np.concatenate(([0], np.cumsum(lengths)))
+        # Positions of every entry of the selected rows in the full arrays
+        positions = np.repeat(starts - indptr[:-1], lengths) + np.arange(indptr[-1])
+        return indptr, self.indices[positions], self.counts[positions]
+
+    def dense_rows(self, rows):
+        """Return the given rows as a dense array."""
+        indptr, indices, counts = self.select(rows)
+        dense = np.zeros((len(rows), self.shape[1]))
+        dense[np.repeat(np.arange(len(rows)), np.diff(indptr)), indices] = counts
+        return dense
+
+def row_sums(values, indptr):
+    """Sum topic-major per-entry values of a CSR matrix into one row per document."""
+    lengths = np.diff(indptr)
+    sums = np.zeros((len(lengths), values.shape[0]))
+    nonempty = lengths > 0
+    if nonempty.any():
+        # reduceat sums from each start to the next one, so empty rows must be left out
+        sums[nonempty] = np.add.reduceat(values, indptr[:-1][nonempty], axis=1).T
+    return sums
+
+def build_vocabulary(documents, min_df=2, max_df=0.5, max_features=5000):
+    """Keep the words found in at least min_df documents and at most a max_df fraction of them."""
+    document_frequency = Counter(word for document in documents for word in set(document))
+    limit = max_df * len(documents)
+    words = [(count, word) for word, count in document_frequency.items() if min_df <= count <= max(limit, min_df)]
+    words.sort(key=lambda item: (-item[0], item[1]))
+    return sorted(word for _, word in words[:max_features])
+
+class OnlineLDA:
+    """
+    Latent Dirichlet Allocation fitted with online variational Bayes (Hoffman, Blei and Bach, 2010).
+
+    The E-step updates a whole mini-batch at once, vectorized over the non-zero entries of
+    its document-term matrix, so fitting a corpus of a few thousand short documents takes seconds.
+    """
+
+    def __init__(self, num_topics=8, alpha=None, eta=None, tau0=64.0, kappa=0.7, batch_size=256, passes=5,
+                 max_iterations=50, tolerance=1e-3, seed=0):
+        self.num_topics = int(num_topics)
+        self.alpha = float(alpha) if alpha else 1.0 / self.num_topics
+        self.eta = float(eta) if eta else 1.0 / self.num_topics
+        self.tau0 = float(tau0)
+        self.kappa = float(kappa)
+        self.batch_size = int(batch_size)
+        self.passes = int(passes)
+        self.max_iterations = int(max_iterations)
+        self.tolerance = float(tolerance)
+        self.random = np.random.default_rng(int(seed))
+        self.topic_words = None
+        self.updates = 0
+
+    def _e_step(self, batch, exp_elog_beta):
+        """Return the topic weights of a batch of documents and its sufficient statistics."""
+        indptr, indices, counts = batch
+        documents = len(indptr) - 1
+        # Every update only touches the words present in the batch, stored topic-major for fast row access
+        document_of = np.repeat(np.arange(documents), np.diff(indptr))
+        word_topics = exp_elog_beta[:, indices]
+        gamma = self.random.gamma(100.0, 0.01, (documents, self.num_topics))
+        exp_elog_theta = np.exp(dirichlet_expectation(gamma))
+        for _ in range(self.max_iterations):
+            previous = gamma
+            ratio = counts / (np.einsum('ki,ki->i', exp_elog_theta.T[:, document_of], word_topics) + 1e-100)
+            gamma = self.alpha + exp_elog_theta * row_sums(word_topics * ratio, indptr)
+            exp_elog_theta = np.exp(dirichlet_expectation(gamma))
+            if np.mean(np.abs(gamma - previous)) < self.tolerance:
+                break
+        ratio = counts / (np.einsum('ki,ki->i', exp_elog_theta.T[:, document_of], word_topics) + 1e-100)
+        contributions = exp_elog_theta.T[:, document_of] * word_topics * ratio
+        statistics = np.stack([np.bincount(indices, weights=contributions[topic], minlength=exp_elog_beta.shape[1])
+                               for topic in range(self.num_topics)])
+        return gamma, statistics
+
+    def _seed_topics(self, matrix, candidates=1000):
+        """
+        Start every topic from a different document, picked farthest-first by cosine similarity.
+
+        Starting from near-uniform topics, as the paper does, often lets two topics settle
+        on the same theme on small corpora.
+        """
+        rows = self.random.choice(matrix.shape[0], min(candidates, matrix.shape[0]), replace=False)
+        counts = matrix.dense_rows(rows)
+        unit = counts / np.maximum(np.linalg.norm(counts, axis=1, keepdims=True), 1e-12)
+        chosen = [int(self.random.integers(len(rows)))]
+        closest = unit @ unit[chosen[0]]
+        while len(chosen) < min(self.num_topics, len(rows)):
+            chosen.append(int(np.argmin(closest)))
+            closest = np.maximum(closest, unit @ unit[chosen[-1]])
+        seeds = np.zeros((self.num_topics, matrix.shape[1]))
+        seeds[:len(chosen)] = counts[chosen]
+        return self.random.gamma(100.0, 0.01, seeds.shape) + seeds
+
+    def fit(self, matrix):
+        """Fit the topics of a SparseCounts matrix."""
+        documents = matrix.shape[0]
+        self.topic_words = self._seed_topics(matrix)
+        for _ in range(self.passes):
+            order = self.random.permutation(documents)
+            for start in range(0, documents, self.batch_size):
+                rows = order[start:start + self.batch_size]
+                exp_elog_beta = np.exp(dirichlet_expectation(self.topic_words))
+                _, statistics = self._e_step(matrix.select(rows), exp_elog_beta)
+                rho = (self.tau0 + self.updates) ** -self.kappa
+                self.topic_words = ((1 - rho) * self.topic_words
+                                    + rho * (self.eta + documents / len(rows) * statistics))
+                self.updates += 1
+        return self
+
+    def transform(self, matrix):
+        """Return the normalized topic weights of every document of a SparseCounts matrix."""
+        exp_elog_beta = np.exp(dirichlet_expectation(self.topic_words))
+        weights = []
+        for start in range(0, matrix.shape[0], self.batch_size):
+            gamma, _ = self._e_step(matrix.select(np.arange(start, min(start + self.batch_size, matrix.shape[0]))),
+                                    exp_elog_beta)
+            weights.append(gamma / gamma.sum(axis=1, keepdims=True))
+        return np.vstack(weights) if weights else np.zeros((0, self.num_topics))
+
+    def top_words(self, vocabulary, count=10):
+        """Return the count most probable words of every topic."""
+        return [[vocabulary[i] for i in np.argsort(-topic)[:count]] for topic in self.topic_words]
+
+def fit_corpus(texts, num_topics=8, segment_words=200, min_df=2, max_df=0.5, max_features=5000, passes=5, seed=0):
+    """
+    Fit topics over a corpus and return (model, vocabulary, topic weights of every text).
+
+    Every text is a string or an iterable of its pieces, such as the paragraphs streamed
+    from a file. Each text is cut into segments of segment_words tokens so a single long
+    book still gives the model enough documents; the weights of a text are the mean of
+    its segments'.
+    """
+    segments, owners = [], []
+    for i, text in enumerate(texts):
+        for segment in iter_segments([text] if isinstance(text, str) else text, int(segment_words)):
+            segments.append(segment)
+            owners.append(i)
+    if not segments:
+        raise ValueError('The corpus has no words to model')
+    vocabulary = build_vocabulary(segments, int(min_df), float(max_df), int(max_features))
+    if not vocabulary:
+        # A tiny corpus: keep every word rather than fit nothing
+        vocabulary = build_vocabulary(segments, 1, 1.0, int(max_features))
+    matrix = SparseCounts(segments, vocabulary)
+    model = OnlineLDA(min(int(num_topics), max(1, len(segments))), passes=passes, seed=seed).fit(matrix)
+
+    segment_weights = model.transform(matrix)
+    owners = np.array(owners, dtype=np.int64)
+    text_weights = np.zeros((len(texts), model.num_topics))
+    for i in range(len(texts)):
+        rows = segment_weights[owners == i]
+        if len(rows):
+            text_weights[i] = rows.mean(axis=0)
+    return model, vocabulary, text_weights
+
+def format_topics(topics, weights, labels=None, min_weight=0.05):
+    """Format the topics of one text as markdown, most prominent first."""
+    lines = []
+    for topic in np.argsort(-weights):
+        if weights[topic] < min_weight:
+            continue
+        title = labels[topic] if labels else ', '.join(word.capitalize() for word in topics[topic][:3])
+        lines.append(f'### {title}')
+        lines.append('')
+        lines.append(', '.join(topics[topic]))
+        lines.append('')
+    return '\n'.join(lines)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_concat import id3_size, mp3_data_offset
+
+BYTE_LIMIT = 5000  # Bytes of text Google Text-to-Speech accepts in one request
+TTS_WORKERS = 4  # Chunks synthesized at the same time
+
+def chunk_text(text, byte_limit=BYTE_LIMIT):
+    """Split text into chunks of whole sentences that fit within byte_limit bytes."""
+    chunks = []
+    current_chunk = ""
+    for sentence in text.split('.'):
+        sentence = sentence.strip() + ". "
+        if len(current_chunk.encode('utf-8')) + len(sentence.encode('utf-8')) > byte_limit:
+            chunks.append(current_chunk.strip())
+            current_chunk = sentence
+        else:
+            current_chunk += sentence
+    if current_chunk:
+        chunks.append(current_chunk.strip())  # Add the last chunk
+    # A first sentence longer than byte_limit leaves an empty chunk behind
+    return [chunk for chunk in chunks if chunk]
+
+class GoogleSynthesizer:
+    """Synthesize MP3 speech with Google Text-to-Speech, through one client shared by all threads."""
+
+    def __init__(self, credentials=None, gender='NEUTRAL'):
+        from google.cloud import texttospeech
+        self.texttospeech = texttospeech
+        self.client = texttospeech.TextToSpeechClient(credentials=credentials)
+        self.gender = getattr(texttospeech.SsmlVoiceGender, gender)
+        self.audio_config = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.MP3)
+
+    def synthesize(self, text, language_code):
+        """Return the MP3 audio of text."""
+        voice = self.texttospeech.VoiceSelectionParams(language_code=language_code, ssml_gender=self.gender)
+        response = self.client.synthesize_speech(input=self.texttospeech.SynthesisInput(text=text), voice=voice,
+                                                 audio_config=self.audio_config)
+        return response.audio_content
+
+class SpeechEngine:
+    """
+    Turn long texts into MP3 files, synthesizing their chunks on a bounded thread pool.
+
+    The synthesizer is any object with a synthesize(text, language_code) method returning
+    MP3 data, such as GoogleSynthesizer or a local fake. At most window chunks of a text
+    are in flight or waiting to be written; each is appended to the output file as soon
+    as the chunks before it are written, so the audio is never held in memory as a
+    whole, nor decoded and re-encoded. MP3 data can be concatenated frame by frame: only
+    the ID3 tag of the first chunk is kept, and the Xing, Info or VBRI header frame of
+    every chunk is dropped, as it would describe the length of that chunk alone. The
+    file is written under a temporary name and renamed once complete, so an interrupted
+    run leaves no partial file that would be taken for finished audio.
+    """
+
+    def __init__(self, synthesizer, workers=TTS_WORKERS, byte_limit=BYTE_LIMIT, window=None):
+        self.synthesizer = synthesizer
+        self.workers = max(1, int(workers))
+        self.byte_limit = int(byte_limit)
+        self.window = int(window or 2 * self.workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tts')
+        self.chunks = 0
+        self.audio_bytes = 0
+        self.synthesis_time = 0.0  # Seconds spent in the synthesizer, summed over workers
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _synthesize(self, chunk, language_code):
+        started = time.perf_counter()
+        audio = self.synthesizer.synthesize(chunk, language_code)
+        with self._lock:
+            self.chunks += 1
+            self.audio_bytes += len(audio)
+            self.synthesis_time += time.perf_counter() - started
+        return audio
+
+    def synthesize_to_file(self, text, language_code, output_path):
+        """Synthesize text into the MP3 file output_path and return the number of chunks."""
+        chunks = chunk_text(text, self.byte_limit)
+        part_path = output_path + '.part'
+        pending = deque()
+        first = True
+        try:
+            with open(part_path, 'wb') as output:
+                for chunk in chunks:
+                    pending.append(self.executor.submit(self._synthesize, chunk, language_code))
+                    if len(pending) >= self.window:
+                        audio = pending.popleft().result()
+                        output.write((audio[:id3_size(audio)] if first else b'') + audio[mp3_data_offset(audio):])
+                        first = False
+                while pending:
+                    audio = pending.popleft().result()
+                    output.write((audio[:id3_size(audio)] if first else b'') + audio[mp3_data_offset(audio):])
+                    first = False
+            os.replace(part_path, output_path)
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        return len(chunks)
+
+    def stats(self):
+        return {'chunks': self.chunks, 'audio_bytes': self.audio_bytes, 'synthesis_time': self.synthesis_time}
+
+    def close(self):
+        """Wait for the chunks in flight and stop the workers."""
+        self.executor.shutdown(wait=True)
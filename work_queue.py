@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+Job = namedtuple('Job', ['path', 'mode', 'size'])
+
+def build_jobs(text_files, modes):
+    """
+    Build the global queue of (file, mode) jobs, largest input first.
+
+    Starting with the largest files keeps a single huge file from being picked up last
+    and leaving every other worker idle while it finishes.
+    """
+    jobs = [Job(str(text_file), mode, text_file.stat().st_size) for text_file in text_files for mode in modes]
+    return sorted(jobs, key=lambda job: job.size, reverse=True)
+
+def format_duration(seconds):
+    """Format a number of seconds as h:mm:ss."""
+    seconds = int(seconds)
+    return f'{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}'
+
+class Progress:
+    """Track finished jobs and estimate the remaining time from the input bytes processed so far."""
+
+    def __init__(self, jobs):
+        self.total_jobs = len(jobs)
+        self.total_bytes = sum(job.size for job in jobs) or 1
+        self.done_jobs = 0
+        self.done_bytes = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+
+    def update(self, job, elapsed, error=None):
+        self.done_jobs += 1
+        self.done_bytes += job.size
+        if error is not None:
+            self.failed += 1
+        wall = time.perf_counter() - self.started
+        rate = self.done_bytes / wall if wall > 0 else 0
+        eta = (self.total_bytes - self.done_bytes) / rate if rate > 0 else 0
+        status = f'failed: {error}' if error is not None else f'finished in {elapsed:.1f}s'
+        print(f'[{self.done_jobs}/{self.total_jobs}] {job.path} ({job.mode}) {status} | '
+              f'{100 * self.done_bytes / self.total_bytes:.0f}% of input, '
+              f'elapsed {format_duration(wall)}, ETA {format_duration(eta)}')
+
+    def summary(self):
+        wall = time.perf_counter() - self.started
+        print(f'{self.done_jobs - self.failed} of {self.total_jobs} jobs finished, {self.failed} failed, '
+              f'in {format_duration(wall)}')
+
+def run_jobs(jobs, worker, max_workers, executor='process', initializer=None, initargs=(), on_result=None):
+    """
+    Run every job with a pool of workers and report progress as jobs complete.
+
+    Args:
+      jobs: The jobs to run, in scheduling order.
+      worker: Picklable function called with a job; returns the job's elapsed seconds, or a result
+        that on_result turns into them.
+      max_workers: Number of worker processes or threads.
+      executor: 'process' or 'thread'.
+      initializer: Called once in each worker process before it runs jobs.
+      initargs: Arguments of initializer.
+      on_result: Called in this process with the result of each job; returns the job's elapsed seconds.
+    """
+    progress = Progress(jobs)
+    if executor == 'process':
+        pool = ProcessPoolExecutor(max_workers=max_workers, initializer=initializer, initargs=initargs)
+    else:
+        # Threads share the state set up once in this process
+        if initializer:
+            initializer(*initargs)
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    with pool:
+        # The executor queue hands jobs out in submission order, largest first
+        futures = {pool.submit(worker, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+                progress.update(job, on_result(result) if on_result else result)
+            except Exception as e:
+                progress.update(job, 0, e)
+    progress.summary()
+    return progress